@@ -0,0 +1,111 @@
+import json
+import os
+from config import Config
+from youtube_api import format_twitch_vod_id
+
+
+# 動画説明文のデフォルトテンプレート（{date}, {channel_url}, {channel}, {title}を置換）
+DEFAULT_DESCRIPTION_TEMPLATE = (
+    "Twitch配信アーカイブ\n\n配信日（JST）: {date}\n\n"
+    "Twitchチャンネル: {channel_url}\n\n#Twitch #配信アーカイブ"
+)
+DEFAULT_TAGS = ['Twitch', '配信アーカイブ', 'ライブ配信']
+
+
+class ChannelConfig:
+    """1チャンネル分の設定（動画説明文のテンプレートとアップロード先）"""
+
+    def __init__(self, name, channel_url=None, author_name=None,
+                 description_template=None, tags=None, youtube_token=None,
+                 privacy_status='private', category_id='22',
+                 file_prefix=''):
+        self.name = name
+        self.channel_url = channel_url or f'https://www.twitch.tv/{name}'
+        self.author_name = author_name
+        self.description_template = (
+            description_template or DEFAULT_DESCRIPTION_TEMPLATE
+        )
+        self.tags = list(tags) if tags is not None else list(DEFAULT_TAGS)
+        # アップロード先のYouTubeアカウントのトークン（pickle/配下のファイル名）
+        self.youtube_token = youtube_token
+        self.privacy_status = privacy_status
+        self.category_id = category_id
+        self.file_prefix = file_prefix
+
+    @classmethod
+    def from_config(cls):
+        """.envの単一チャンネル設定から作成"""
+        return cls(
+            Config.TWITCH_CHANNEL_NAME,
+            channel_url=Config.TWITCH_CHANNEL_URL,
+            author_name=Config.AUTHOR_NAME
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        """チャンネル設定ファイルの1項目から作成
+
+        複数チャンネルでファイル名が重複しないよう、ダウンロードファイル名の
+        先頭にチャンネル名を付ける。
+        """
+        return cls(
+            data['name'],
+            channel_url=data.get('channel_url'),
+            author_name=data.get('author_name'),
+            description_template=data.get('description_template'),
+            tags=data.get('tags'),
+            youtube_token=data.get('youtube_token'),
+            privacy_status=data.get('privacy_status', 'private'),
+            category_id=str(data.get('category_id', '22')),
+            file_prefix=f"{data['name']}_"
+        )
+
+    @property
+    def youtube_token_path(self):
+        if not self.youtube_token:
+            return None
+        return os.path.join(Config.project_root, 'pickle', self.youtube_token)
+
+    def build_metadata(self, created_at_jst, title='', video_id=None,
+                       part=None, parts=None):
+        """YouTubeにアップロードする動画の説明文とタグを作成
+
+        video_idを渡すと、アップロード済みの動画と照合できるよう
+        説明文の末尾にTwitchの動画ID（分割した場合はパート番号も）を追記する。
+        """
+        description = self.description_template.format(
+            date=created_at_jst.strftime('%Y年%m月%d日'),
+            channel_url=self.channel_url,
+            channel=self.name,
+            title=title
+        )
+        if video_id:
+            description += (
+                f"\n\n{format_twitch_vod_id(video_id, part, parts)}"
+            )
+
+        # タグに作者名を追加
+        tags = list(self.tags)
+        if self.author_name:
+            tags.append(self.author_name)
+
+        return description, tags
+
+
+def load_channels(path=None):
+    """チャンネル設定ファイルを読み込む
+
+    ファイルがない場合は.envの単一チャンネル設定を使う。
+    """
+    path = path or Config.CHANNELS_FILE
+    if not os.path.exists(path):
+        return [ChannelConfig.from_config()]
+
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    channels = [ChannelConfig.from_dict(item) for item in data['channels']]
+
+    names = [channel.name for channel in channels]
+    if len(set(names)) != len(names):
+        raise ValueError(f"チャンネル名が重複しています: {path}")
+    return channels
@@ -6,11 +6,12 @@ Twitch設定とYouTube設定を確認するツール
 import os
 import sys
 import argparse
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 
 from config import Config
 from twitch_api import TwitchAPI
+from vod_catalog import VODCatalog
 from youtube_api import YouTubeAPI
 
 
@@ -83,7 +84,7 @@ def check_twitch_config(start_datetime=None, end_datetime=None):
 
         # 動画取得テスト（過去7日間の範囲で）
         print("動画取得テスト中...")
-        videos = twitch_api.get_videos(days_back=3)  # 前日分をテスト
+        videos = twitch_api.get_videos(max_pages=1)  # 最新1ページ分をテスト
         if videos is not None:
             print(f"✅ 動画取得成功: {len(videos)}件の動画を発見")
 
@@ -97,41 +98,34 @@ def check_twitch_config(start_datetime=None, end_datetime=None):
 
                 print(f"検索期間: {start_jst.strftime('%Y年%m月%d日 %H:%M:%S')} から {end_jst.strftime('%Y年%m月%d日 %H:%M:%S')}")
 
-                # すべての動画を取得してソート
-                all_raw_videos = []
-                for days_back in range(1, 31):  # 最大30日間
-                    videos = twitch_api.get_videos(days_back=days_back)
-                    if videos:
-                        for video in videos:
-                            # 重複チェック
-                            if not any(v['id'] == video['id'] for v in all_raw_videos):
-                                all_raw_videos.append(video)
-
-                # 作成日時でソート（新しい順）
-                all_raw_videos.sort(key=lambda x: x['created_at'], reverse=True)
-
-                # 指定された日付範囲内の動画のみを抽出
-                for video in all_raw_videos:
-                    created_at_utc = datetime.fromisoformat(
-                        video['created_at'].replace('Z', '+00:00')
-                    )
-                    created_at_jst = created_at_utc.astimezone(jst)
+                # カタログを同期してから日時範囲で検索
+                catalog = VODCatalog()
+                catalog.sync(twitch_api)
+                for video in catalog.get_videos_in_range(
+                        start_jst, end_jst, channel=twitch_api.channel_name
+                ):
+                    created_at_jst = twitch_api.parse_created_at(
+                        video['created_at']
+                    ).astimezone(jst)
+                    all_videos.append(video)
+                    print(f"期間内の動画を発見: {video['title']} - {created_at_jst.strftime('%Y年%m月%d日 %H:%M:%S')}")
 
-                    # 指定された日付範囲内の動画のみを追加
-                    if start_jst <= created_at_jst <= end_jst:
-                        all_videos.append(video)
-                        print(f"期間内の動画を発見: {video['title']} - {created_at_jst.strftime('%Y年%m月%d日 %H:%M:%S')}")
-                    elif created_at_jst < start_jst:
-                        # 開始日より古い動画に到達したら終了
-                        break
-                
                 print(f"指定期間で {len(all_videos)}件の動画を発見")
             else:
-                # デフォルト: 昨日分の動画を取得
-                videos = twitch_api.get_videos(days_back=1)
-                if videos:
-                    for video in videos:
-                        all_videos.append(video)
+                # デフォルト: 昨日分（JST）の動画を取得
+                jst = pytz.timezone('Asia/Tokyo')
+                yesterday_start = (
+                    datetime.now(jst) - timedelta(days=1)
+                ).replace(hour=0, minute=0, second=0, microsecond=0)
+                yesterday_end = yesterday_start.replace(
+                    hour=23, minute=59, second=59, microsecond=999999
+                )
+                catalog = VODCatalog()
+                catalog.sync(twitch_api)
+                all_videos.extend(catalog.get_videos_in_range(
+                    yesterday_start, yesterday_end,
+                    channel=twitch_api.channel_name
+                ))
                 
                 print(f"昨日分で {len(all_videos)}件の動画を発見")
             
@@ -145,7 +139,7 @@ def check_twitch_config(start_datetime=None, end_datetime=None):
                     created_at_jst = created_at_utc.astimezone(jst)
                     
                     # 動画長を時間:分:秒形式に変換
-                    duration_seconds = twitch_api.parse_twitch_duration(video['duration'])
+                    duration_seconds = video['duration']
                     hours = duration_seconds // 3600
                     minutes = (duration_seconds % 3600) // 60
                     seconds = duration_seconds % 60
@@ -160,8 +154,7 @@ def check_twitch_config(start_datetime=None, end_datetime=None):
                     )
                     print(f"動画長: {duration_str} ({duration_seconds}秒)")
                     print(f"URL: https://www.twitch.tv/videos/{video['id']}")
-                    print(f"視聴回数: {video.get('view_count', 'N/A')}")
-                    print(f"言語: {video.get('language', 'N/A')}")
+                    print(f"処理状態: {video['state']}")
             else:
                 print("昨日分でも動画が見つかりません")
                 print("考えられる原因:")
@@ -219,6 +212,7 @@ def check_youtube_config():
                 part='snippet',
                 mine=True
             ).execute()
+            youtube_api.quota.record('channels.list')
 
             if channels_response['items']:
                 channel = channels_response['items'][0]
@@ -235,6 +229,16 @@ def check_youtube_config():
             print(f"❌ チャンネル情報取得エラー: {str(e)}")
             return False
 
+        # 当日（太平洋時間）のクォータ消費量
+        quota = youtube_api.quota
+        print(
+            f"本日のクォータ消費量: {quota.used()}"
+            f" / {quota.daily_limit or '上限なし'}ユニット"
+            f"（{quota.format_reset()}にリセット）"
+        )
+        for method, (units, calls) in quota.usage_by_method().items():
+            print(f"  {method}: {units}ユニット（{calls}回）")
+
         print("\n✅ YouTube設定は正常です")
         return True
 
@@ -23,6 +23,15 @@ class Config:
         f'https://www.twitch.tv/{TWITCH_CHANNEL_NAME}'
     )
 
+    # API接続先（通常は変更不要。ベンチマーク用のローカルサーバーなどに使用）
+    TWITCH_API_BASE_URL = os.getenv(
+        'TWITCH_API_BASE_URL', 'https://api.twitch.tv/helix'
+    )
+    TWITCH_AUTH_URL = os.getenv(
+        'TWITCH_AUTH_URL', 'https://id.twitch.tv/oauth2/token'
+    )
+    YOUTUBE_API_ROOT_URL = os.getenv('YOUTUBE_API_ROOT_URL')
+
     # 作者設定
     AUTHOR_NAME = os.getenv('AUTHOR_NAME')
 
@@ -35,6 +44,111 @@ class Config:
         'DOWNLOAD_DIR', os.path.join(project_root, 'downloads')
     )
     MAX_VIDEO_LENGTH = int(os.getenv('MAX_VIDEO_LENGTH', 43200))
+    # MAX_VIDEO_LENGTHを超える動画をffmpegで分割してアップロードする（falseの場合はスキップ）
+    SPLIT_LONG_VIDEOS = os.getenv('SPLIT_LONG_VIDEOS', 'true').lower() == 'true'
+    # 分割した動画のパートを同時にアップロードする数
+    SPLIT_UPLOAD_WORKERS = int(os.getenv('SPLIT_UPLOAD_WORKERS', 2))
+
+    # HLSダウンロード設定（0の場合は常にyt-dlpを使用）
+    HLS_DOWNLOAD_WORKERS = int(os.getenv('HLS_DOWNLOAD_WORKERS', 8))
+    HLS_SEGMENT_RETRIES = int(os.getenv('HLS_SEGMENT_RETRIES', 5))
+    # 長さを確認できないダウンロードを保留する回数（超えた動画はスキップ、0は無制限）
+    DOWNLOAD_MAX_UNVERIFIED = int(os.getenv('DOWNLOAD_MAX_UNVERIFIED', 3))
+
+    # ステージング領域（DOWNLOAD_DIR）の使用量の上限（GB、0の場合は空き容量のみで判断）
+    STAGING_MAX_GB = float(os.getenv('STAGING_MAX_GB', 0))
+    # ダウンロード前に予約するサイズの見積もり（ビットレートが分からない場合の
+    # 想定ビットレート（Mbps）と、見積もりに掛ける余裕）
+    STAGING_DEFAULT_BITRATE_MBPS = float(
+        os.getenv('STAGING_DEFAULT_BITRATE_MBPS', 8)
+    )
+    STAGING_SIZE_MARGIN = float(os.getenv('STAGING_SIZE_MARGIN', 1.1))
+    # カタログにないファイルを削除してよい経過時間（時間、0の場合は削除しない）
+    STAGING_ORPHAN_MAX_AGE_HOURS = float(
+        os.getenv('STAGING_ORPHAN_MAX_AGE_HOURS', 0)
+    )
+
+    # パイプライン処理設定（ダウンロードとアップロードを並行実行）
+    PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 1))
+    PIPELINE_MIN_FREE_SPACE_GB = float(
+        os.getenv('PIPELINE_MIN_FREE_SPACE_GB', 20)
+    )
+
+    # ストリーミング処理設定（ダウンロードしながらアップロード）
+    STREAM_BUFFER_MB = int(os.getenv('STREAM_BUFFER_MB', 512))
+    STREAM_SPILL_TO_DISK = (
+        os.getenv('STREAM_SPILL_TO_DISK', 'false').lower() == 'true'
+    )
+
+    # YouTubeアップロードのチャンク設定（送信速度に応じて最小〜最大で調整）
+    UPLOAD_CHUNK_INITIAL_MB = int(os.getenv('UPLOAD_CHUNK_INITIAL_MB', 32))
+    UPLOAD_CHUNK_MIN_MB = int(os.getenv('UPLOAD_CHUNK_MIN_MB', 8))
+    UPLOAD_CHUNK_MAX_MB = int(os.getenv('UPLOAD_CHUNK_MAX_MB', 256))
+    UPLOAD_CHUNK_TARGET_SECONDS = float(
+        os.getenv('UPLOAD_CHUNK_TARGET_SECONDS', 20)
+    )
+    UPLOAD_CHUNK_RETRIES = int(os.getenv('UPLOAD_CHUNK_RETRIES', 5))
+
+    # 帯域制限（全ダウンロード・全アップロードそれぞれの合計の上限）
+    # *_MBPSは既定の上限（Mbps、0の場合は制限しない）、*_PROFILEは
+    # 「09:00-18:00=50,18:00-24:00=200」形式の時間帯ごとの上限
+    DOWNLOAD_BANDWIDTH_MBPS = float(os.getenv('DOWNLOAD_BANDWIDTH_MBPS', 0))
+    DOWNLOAD_BANDWIDTH_PROFILE = os.getenv('DOWNLOAD_BANDWIDTH_PROFILE', '')
+    UPLOAD_BANDWIDTH_MBPS = float(os.getenv('UPLOAD_BANDWIDTH_MBPS', 0))
+    UPLOAD_BANDWIDTH_PROFILE = os.getenv('UPLOAD_BANDWIDTH_PROFILE', '')
+    # 時間帯を判定するタイムゾーン
+    BANDWIDTH_TIMEZONE = os.getenv('BANDWIDTH_TIMEZONE', 'Asia/Tokyo')
+
+    # 処理段階ごとの計測ログ（JSON Lines）
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(project_root, 'logs'))
+    # 計測ログ1ファイルの上限（MB）と、上限に達したときに残す古いファイルの数
+    METRICS_FILE_MAX_MB = float(os.getenv('METRICS_FILE_MAX_MB', 100))
+    METRICS_FILE_BACKUPS = int(os.getenv('METRICS_FILE_BACKUPS', 3))
+    # メモリに保持する直近のSpanの数（ワーカーごとの転送速度の集計に使う）
+    METRICS_MAX_SPANS = int(os.getenv('METRICS_MAX_SPANS', 10000))
+
+    # Prometheus textfile collector用の出力先（未設定の場合は出力しない）
+    PROMETHEUS_TEXTFILE = os.getenv('PROMETHEUS_TEXTFILE')
+    PROMETHEUS_INTERVAL = int(os.getenv('PROMETHEUS_INTERVAL', 30))
+
+    # 配信アーカイブのローカルカタログ（SQLite）
+    CATALOG_PATH = os.getenv(
+        'CATALOG_PATH', os.path.join(project_root, 'data', 'vod_catalog.db')
+    )
+
+    # 一覧取得からこの時間（分）以上経った未処理のアーカイブは、処理前に情報を再取得する
+    VOD_REFRESH_MINUTES = int(os.getenv('VOD_REFRESH_MINUTES', 60))
+
+    # --watch時のポーリング間隔（秒）と、未処理のアーカイブを遡る期間（時間）
+    WATCH_INTERVAL = int(os.getenv('WATCH_INTERVAL', 300))
+    WATCH_LOOKBACK_HOURS = int(os.getenv('WATCH_LOOKBACK_HOURS', 48))
+
+    # YouTube Data APIの1日のクォータ（0の場合は残量を確認しない）と消費量の記録先
+    YOUTUBE_DAILY_QUOTA = int(os.getenv('YOUTUBE_DAILY_QUOTA', 10000))
+    QUOTA_LEDGER_PATH = os.getenv(
+        'QUOTA_LEDGER_PATH', os.path.join(project_root, 'data', 'youtube_quota.db')
+    )
+
+    # ダウンロード前にYouTubeのアップロード済み動画と照合して重複を防ぐ
+    CHECK_EXISTING_UPLOADS = (
+        os.getenv('CHECK_EXISTING_UPLOADS', 'true').lower() == 'true'
+    )
+
+    # 複数ホストで処理を分担する場合の共有リースDB（未設定の場合は分担しない）
+    LEASE_DB_PATH = os.getenv('LEASE_DB_PATH')
+    LEASE_TTL = int(os.getenv('LEASE_TTL', 300))
+    LEASE_JOURNAL_MODE = os.getenv('LEASE_JOURNAL_MODE', 'WAL')
+    WORKER_ID = os.getenv('WORKER_ID')
+
+    # 複数チャンネル設定（ファイルがない場合は上記の単一チャンネル設定を使用）
+    CHANNELS_FILE = os.getenv(
+        'CHANNELS_FILE', os.path.join(project_root, 'config', 'channels.json')
+    )
+    # 複数チャンネル時に全チャンネルで共有するダウンロードの同時実行数
+    DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', 2))
+    # アップロードの同時実行数（--pipeline・複数チャンネル時）
+    UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 2))
 
     @classmethod
     def validate_config(cls):
@@ -45,7 +159,8 @@ class Config:
             missing_configs.append('TWITCH_CLIENT_ID')
         if not cls.TWITCH_CLIENT_SECRET:
             missing_configs.append('TWITCH_CLIENT_SECRET')
-        if not cls.TWITCH_CHANNEL_NAME:
+        if not cls.TWITCH_CHANNEL_NAME and not os.path.exists(
+                cls.CHANNELS_FILE):
             missing_configs.append('TWITCH_CHANNEL_NAME')
 
         return missing_configs
@@ -0,0 +1,231 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+from config import Config
+
+
+# claim()の結果
+LEASE_CLAIMED = 'claimed'  # 処理権を取得した
+LEASE_BUSY = 'busy'        # 他のワーカーが処理中
+LEASE_DONE = 'done'        # 他のワーカー（または以前の実行）が処理を完了済み
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    video_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    state TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    youtube_id TEXT,
+    skip_reason TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_leases_owner ON leases (owner, state);
+"""
+
+
+class LeaseStore:
+    """複数のホスト・プロセスで配信アーカイブの処理を分担するための処理権（リース）
+
+    共有のSQLiteデータベースに「どのワーカーがどの動画を処理中か」を有効期限
+    付きで記録する。処理中はハートビートで期限を延長し、ワーカーが停止して
+    期限が切れたリースは他のワーカーが引き継ぐ。処理を終えた動画は完了として
+    記録し、他のワーカーが再び処理しないようにする。
+    時刻はホストの時計（time.time()）で比較するため、各ホストの時刻を同期しておく。
+    """
+
+    def __init__(self, db_path, worker_id=None, ttl=None, journal_mode=None):
+        self.db_path = db_path
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.ttl = ttl or Config.LEASE_TTL
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        # トランザクションはBEGIN IMMEDIATEで明示的に開始する
+        self.conn = sqlite3.connect(
+            db_path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self.conn.execute(
+            f"PRAGMA journal_mode = {journal_mode or Config.LEASE_JOURNAL_MODE}"
+        )
+        self.conn.executescript(SCHEMA)
+
+        self._held = set()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    @classmethod
+    def from_config(cls):
+        """LEASE_DB_PATHが設定されている場合のみ作成"""
+        if not Config.LEASE_DB_PATH:
+            return None
+        return cls(Config.LEASE_DB_PATH, worker_id=Config.WORKER_ID)
+
+    def _transaction(self, func):
+        """書き込みロックを取得した1トランザクションでfuncを実行"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self.conn, time.time())
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    def claim(self, video_id):
+        """動画の処理権の取得を試み、LEASE_CLAIMED・LEASE_BUSY・LEASE_DONEを返す"""
+        def claim(conn, now):
+            row = conn.execute(
+                "SELECT owner, state, expires_at FROM leases "
+                "WHERE video_id = ?",
+                (video_id,)
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO leases "
+                    "(video_id, owner, state, expires_at, heartbeat_at) "
+                    "VALUES (?, ?, 'active', ?, ?)",
+                    (video_id, self.worker_id, now + self.ttl, now)
+                )
+                return LEASE_CLAIMED
+            owner, state, expires_at = row
+            if state == 'done':
+                return LEASE_DONE
+            if owner != self.worker_id and expires_at > now:
+                return LEASE_BUSY
+            if owner != self.worker_id:
+                print(
+                    f"期限切れのリースを引き継ぎます: {video_id}"
+                    f"（前の担当: {owner}）"
+                )
+            conn.execute(
+                "UPDATE leases SET owner = ?, expires_at = ?, "
+                "heartbeat_at = ?, attempts = attempts + 1 "
+                "WHERE video_id = ?",
+                (self.worker_id, now + self.ttl, now, video_id)
+            )
+            return LEASE_CLAIMED
+
+        result = self._transaction(claim)
+        if result == LEASE_CLAIMED:
+            with self._lock:
+                self._held.add(video_id)
+            self._start_heartbeat()
+        return result
+
+    def owns(self, video_id):
+        """現在もこのワーカーが処理権を持っているか（引き継がれていないか）"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT owner, state FROM leases WHERE video_id = ?",
+                (video_id,)
+            ).fetchone()
+        return row is not None and row == (self.worker_id, 'active')
+
+    def release(self, video_id, done=False, youtube_id=None,
+                skip_reason=None):
+        """処理権を手放す
+
+        done=Trueの場合は完了として記録し、以降どのワーカーも処理しない。
+        それ以外（失敗・延期）の場合は、他のワーカーがすぐに取得できるよう
+        リースを削除する。
+        """
+        def release(conn, now):
+            if done:
+                conn.execute(
+                    """
+                    INSERT INTO leases
+                        (video_id, owner, state, expires_at, heartbeat_at,
+                         youtube_id, skip_reason)
+                    VALUES (?, ?, 'done', ?, ?, ?, ?)
+                    ON CONFLICT (video_id) DO UPDATE SET
+                        owner = excluded.owner,
+                        state = 'done',
+                        heartbeat_at = excluded.heartbeat_at,
+                        youtube_id = excluded.youtube_id,
+                        skip_reason = excluded.skip_reason
+                    """,
+                    (video_id, self.worker_id, now, now, youtube_id,
+                     skip_reason)
+                )
+            else:
+                conn.execute(
+                    "DELETE FROM leases WHERE video_id = ? AND owner = ? "
+                    "AND state = 'active'",
+                    (video_id, self.worker_id)
+                )
+
+        self._transaction(release)
+        with self._lock:
+            self._held.discard(video_id)
+
+    def active_video_ids(self):
+        """いずれかのワーカー（このワーカーを含む）が処理中の動画IDの集合"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT video_id FROM leases "
+                "WHERE state = 'active' AND expires_at > ?",
+                (time.time(),)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def result(self, video_id):
+        """完了済みの動画の(youtube_id, skip_reason)を取得"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT youtube_id, skip_reason FROM leases "
+                "WHERE video_id = ? AND state = 'done'",
+                (video_id,)
+            ).fetchone()
+        return row or (None, None)
+
+    def heartbeat(self):
+        """保持しているリースの期限を延長し、他のワーカーに引き継がれたものを返す"""
+        with self._lock:
+            held = set(self._held)
+        if not held:
+            return set()
+
+        def renew(conn, now):
+            conn.execute(
+                "UPDATE leases SET expires_at = ?, heartbeat_at = ? "
+                "WHERE owner = ? AND state = 'active'",
+                (now + self.ttl, now, self.worker_id)
+            )
+            rows = conn.execute(
+                "SELECT video_id FROM leases WHERE owner = ?",
+                (self.worker_id,)
+            ).fetchall()
+            return {row[0] for row in rows}
+
+        lost = held - self._transaction(renew)
+        for video_id in lost:
+            print(f"リースが他のワーカーに引き継がれました: {video_id}")
+        return lost
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat is not None:
+                return
+            self._heartbeat = threading.Thread(
+                target=self._heartbeat_loop, name='lease-heartbeat',
+                daemon=True
+            )
+        self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                self.heartbeat()
+            except sqlite3.Error as e:
+                # 次回のハートビートで再試行する（期限内であれば問題ない）
+                print(f"リースの更新エラー: {str(e)}")
+
+    def close(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        self.conn.close()
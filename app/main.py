@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 import argparse
+import os
+import signal
+import threading
 from datetime import datetime, timedelta
 import pytz
+from channels import load_channels
+from config import Config
+from multi_channel import MultiChannelManager
 from upload_manager import UploadManager
 
 
@@ -29,12 +35,51 @@ def main():
         help='指定した日時範囲の動画をアップロード（例: --range "2024/12/01 00:00:00" "2024/12/07 23:59:59"）'
     )
 
+    parser.add_argument(
+        '--pipeline', action='store_true',
+        help='次の動画のダウンロードと前の動画のアップロードを並行して実行'
+    )
+
+    parser.add_argument(
+        '--stream', action='store_true',
+        help='動画をローカルに保存せず、ダウンロードしながらアップロード'
+    )
+
+    parser.add_argument(
+        '--watch', action='store_true',
+        help='常駐して新しい配信アーカイブを定期的に確認し、見つかり次第アップロード'
+    )
+
+    parser.add_argument(
+        '--interval', type=int, default=None,
+        help='--watch時の確認間隔（秒、デフォルトはWATCH_INTERVAL）'
+    )
+
     args = parser.parse_args()
 
-    # UploadManagerを初期化
-    upload_manager = UploadManager()
+    if args.pipeline and args.stream:
+        parser.error('--pipeline と --stream は同時に指定できません')
+    if args.watch and args.range is not None:
+        parser.error('--watch と --range は同時に指定できません')
+
+    if os.path.exists(Config.CHANNELS_FILE):
+        # 複数チャンネル設定: 全チャンネルを共有のワーカーで処理
+        if args.stream:
+            parser.error('複数チャンネル設定では --stream は使用できません')
+        upload_manager = MultiChannelManager(load_channels())
+    else:
+        # UploadManagerを初期化
+        upload_manager = UploadManager()
 
-    if args.range is not None:
+    if args.watch:
+        # SIGTERM（systemctl stopなど）を受けたら、処理中の動画を終えてから終了
+        stop_event = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+        upload_manager.run_watch(
+            interval=args.interval, pipeline=args.pipeline,
+            stream=args.stream, stop_event=stop_event
+        )
+    elif args.range is not None:
         # 日時範囲指定
         start_datetime_str, end_datetime_str = args.range
         jst = pytz.timezone('Asia/Tokyo')
@@ -47,7 +92,10 @@ def main():
         start_datetime_jst = jst.localize(start_datetime)
         end_datetime_jst = jst.localize(end_datetime)
         
-        upload_manager.run_manual_upload(start_datetime_jst, end_datetime_jst)
+        upload_manager.run_manual_upload(
+            start_datetime_jst, end_datetime_jst, pipeline=args.pipeline,
+            stream=args.stream
+        )
     else:
         # デフォルト: 前日の動画をアップロード（日時範囲指定を使用）
         jst = pytz.timezone('Asia/Tokyo')
@@ -59,7 +107,10 @@ def main():
             f"前日（{yesterday_start.strftime('%Y年%m月%d日')}）"
             "の配信アーカイブをアップロードします"
         )
-        upload_manager.run_manual_upload(yesterday_start, yesterday_end)
+        upload_manager.run_manual_upload(
+            yesterday_start, yesterday_end, pipeline=args.pipeline,
+            stream=args.stream
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+import mmap
+import os
+import struct
+
+
+# MPEG-TSのパケット長と同期バイト
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+
+# PCRを探すために先頭・末尾から読む範囲
+TS_SCAN_BYTES = 4 * 1024 * 1024
+
+# PCR（33bit, 90kHz）の周期
+PCR_WRAP = 1 << 33
+PCR_CLOCK = 90000
+
+
+def _iter_boxes(data, start, end):
+    """MP4のボックスを (type, 本体の開始位置, 終了位置) で列挙"""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack_from('>Q', data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def mp4_duration(data):
+    """moov/mvhdボックスから動画の長さ（秒）を取得"""
+    for box_type, body, end in _iter_boxes(data, 0, len(data)):
+        if box_type != b'moov':
+            continue
+        for child_type, child, _ in _iter_boxes(data, body, end):
+            if child_type != b'mvhd':
+                continue
+            version = data[child]
+            if version == 1:
+                timescale, duration = struct.unpack_from(
+                    '>IQ', data, child + 20
+                )
+            else:
+                timescale, duration = struct.unpack_from(
+                    '>II', data, child + 12
+                )
+            if timescale and duration:
+                return duration / timescale
+            return None
+    return None
+
+
+def _find_ts_start(data, start, end):
+    """連続する同期バイトからパケットの境界を見つける"""
+    for pos in range(start, min(end, start + TS_PACKET_SIZE)):
+        if all(
+            data[pos + i * TS_PACKET_SIZE] == TS_SYNC_BYTE
+            for i in range(3)
+            if pos + i * TS_PACKET_SIZE < end
+        ):
+            return pos
+    return None
+
+
+def _read_pcr(data, pos):
+    """パケットのアダプテーションフィールドから (PID, PCR) を取得"""
+    if data[pos + 3] & 0x20 == 0 or data[pos + 4] < 7:
+        return None
+    if data[pos + 5] & 0x10 == 0:
+        return None
+    pid = ((data[pos + 1] & 0x1F) << 8) | data[pos + 2]
+    b = data[pos + 6:pos + 11]
+    pcr = (b[0] << 25) | (b[1] << 17) | (b[2] << 9) | (b[3] << 1) | (b[4] >> 7)
+    return pid, pcr
+
+
+def _scan_pcrs(data, start, end):
+    pos = _find_ts_start(data, start, end)
+    if pos is None:
+        return []
+    pcrs = []
+    while pos + TS_PACKET_SIZE <= end:
+        if data[pos] != TS_SYNC_BYTE:
+            # 同期が外れた場合は探し直す
+            pos = _find_ts_start(data, pos + 1, end)
+            if pos is None:
+                break
+            continue
+        found = _read_pcr(data, pos)
+        if found:
+            pcrs.append(found)
+        pos += TS_PACKET_SIZE
+    return pcrs
+
+
+def ts_duration(data):
+    """先頭と末尾のPCRの差から動画の長さ（秒）を取得"""
+    size = len(data)
+    head = _scan_pcrs(data, 0, min(size, TS_SCAN_BYTES))
+    if not head:
+        return None
+    pid, first = head[0]
+
+    tail_start = max(0, size - TS_SCAN_BYTES)
+    tail = [pcr for p, pcr in _scan_pcrs(data, tail_start, size) if p == pid]
+    if not tail:
+        return None
+    last = tail[-1]
+
+    if tail_start == 0:
+        # ファイル全体を走査済みなのでPCRを順に辿って周回を数える
+        elapsed = 0
+        previous = first
+        for p, pcr in head:
+            if p == pid:
+                elapsed += (pcr - previous) % PCR_WRAP
+                previous = pcr
+        return elapsed / PCR_CLOCK
+
+    return ((last - first) % PCR_WRAP) / PCR_CLOCK
+
+
+def probe_duration(file_path):
+    """MP4/MPEG-TSファイルの長さ（秒）を外部プロセスを使わずに取得
+
+    対応していない形式・情報がない場合はNoneを返す。
+    """
+    if os.path.getsize(file_path) == 0:
+        return None
+
+    with open(file_path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data[0] == TS_SYNC_BYTE:
+            return ts_duration(data)
+        if data[4:8] in (b'ftyp', b'moov', b'free', b'mdat', b'wide'):
+            return mp4_duration(data)
+    return None
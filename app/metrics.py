@@ -0,0 +1,389 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from config import Config
+
+
+OUTCOME_OK = 'ok'
+OUTCOME_ERROR = 'error'
+
+# 処理段階の所要時間のヒストグラムのバケット（秒）
+LATENCY_BUCKETS = (
+    0.1, 0.5, 1, 5, 15, 60, 300, 900, 1800, 3600, 7200, 14400, 28800
+)
+
+# 段階ごとの集計を、この属性の値ごとにも累積する（summary(group_by=...)用）
+SUMMARY_GROUPS = ('channel',)
+
+
+class Span:
+    """処理段階1回分の計測結果"""
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = dict(fields)
+        self.outcome = OUTCOME_OK
+        self.bytes = 0
+        self.start = time.monotonic()
+        self.started_at = datetime.now(timezone.utc)
+        self.duration = None
+
+    def set(self, **fields):
+        """任意の属性を追加"""
+        self.fields.update(fields)
+
+    def fail(self, outcome=OUTCOME_ERROR, **fields):
+        """失敗・スキップなどの結果を記録"""
+        self.outcome = outcome
+        self.fields.update(fields)
+
+    def to_dict(self):
+        record = {
+            'span': self.name,
+            'started_at': self.started_at.isoformat(),
+            'duration': round(self.duration, 3),
+            'outcome': self.outcome,
+            'bytes': self.bytes,
+        }
+        # 共通の項目は上書きしない
+        for key, value in self.fields.items():
+            record.setdefault(key, value)
+        return record
+
+
+class StageStats:
+    """処理段階1つ分の累積の集計（回数・成功数・時間・転送量・ヒストグラム）"""
+
+    def __init__(self):
+        self.count = 0
+        self.ok = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.last_success = None
+
+    def add(self, span):
+        self.count += 1
+        self.seconds += span.duration
+        self.bytes += span.bytes
+        for i, bucket in enumerate(LATENCY_BUCKETS):
+            if span.duration <= bucket:
+                self.buckets[i] += 1
+        if span.outcome == OUTCOME_OK:
+            self.ok += 1
+            finished = span.started_at.timestamp() + span.duration
+            self.last_success = max(self.last_success or 0, finished)
+
+    def copy(self):
+        stats = StageStats()
+        stats.__dict__.update(self.__dict__, buckets=list(self.buckets))
+        return stats
+
+    def row(self):
+        return {
+            'count': self.count, 'ok': self.ok,
+            'seconds': self.seconds, 'bytes': self.bytes
+        }
+
+
+class MetricsRecorder:
+    """処理段階ごとの所要時間・転送量をJSON Lines形式で記録する
+
+    1回の実行につき logs/metrics_<日時>.jsonl を作成し（METRICS_FILE_MAX_MB
+    に達したら .1〜.<METRICS_FILE_BACKUPS> にずらして新しく書き始める）、
+    終了時には段階ごとの集計表を出力できる。常駐する監視モードでも
+    メモリを使い続けないよう、集計は段階ごとの累積値（StageStats）で持ち、
+    Spanそのものは直近のmax_spans件だけを保持する。
+    """
+
+    def __init__(self, log_dir=None, enabled=None, max_spans=None,
+                 max_file_bytes=None, backups=None):
+        self.log_dir = log_dir or Config.METRICS_DIR
+        self.enabled = Config.METRICS_ENABLED if enabled is None else enabled
+        self.run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.path = os.path.join(self.log_dir, f'metrics_{self.run_id}.jsonl')
+        max_spans = (
+            Config.METRICS_MAX_SPANS if max_spans is None else max_spans
+        )
+        self.spans = deque(maxlen=max_spans or None)
+        self.max_file_bytes = (
+            int(Config.METRICS_FILE_MAX_MB * 1024 * 1024)
+            if max_file_bytes is None else max_file_bytes
+        )
+        self.backups = (
+            Config.METRICS_FILE_BACKUPS if backups is None else backups
+        )
+        self.stages = {}
+        self.groups = {field: {} for field in SUMMARY_GROUPS}
+        self.counters = {}
+        self.gauges = {}
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._file = None
+        self._context = threading.local()
+
+    def span(self, name, **fields):
+        return _SpanContext(
+            self, name, {**getattr(self._context, 'fields', {}), **fields}
+        )
+
+    @contextmanager
+    def context(self, **fields):
+        """このスレッドで記録するSpanに共通の属性（チャンネル名など）を付ける"""
+        previous = getattr(self._context, 'fields', {})
+        self._context.fields = {**previous, **fields}
+        try:
+            yield
+        finally:
+            self._context.fields = previous
+
+    def current_context(self):
+        """このスレッドの共通の属性（別スレッドに引き継ぐ場合に使う）"""
+        return dict(getattr(self._context, 'fields', {}))
+
+    def count(self, name, value=1):
+        """累積カウンター（転送バイト数・処理件数など）を加算"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        """現在値（キューの長さなど）を設定"""
+        with self._lock:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        """直近のSpan・カウンター・現在値のコピーを取得"""
+        with self._lock:
+            return list(self.spans), dict(self.counters), dict(self.gauges)
+
+    def values(self):
+        """カウンター・現在値のコピーを取得"""
+        with self._lock:
+            return dict(self.counters), dict(self.gauges)
+
+    def stage_stats(self):
+        """処理段階ごとの累積の集計（StageStats）のコピーを取得"""
+        with self._lock:
+            return {name: stats.copy() for name, stats in self.stages.items()}
+
+    def add_listener(self, listener):
+        """記録したSpanを受け取る関数を登録"""
+        self.listeners.append(listener)
+
+    def record(self, span):
+        with self._lock:
+            self.spans.append(span)
+            self.stages.setdefault(span.name, StageStats()).add(span)
+            for field, groups in self.groups.items():
+                key = (span.fields.get(field), span.name)
+                groups.setdefault(key, StageStats()).add(span)
+            if self.enabled:
+                try:
+                    if self._file is None:
+                        os.makedirs(self.log_dir, exist_ok=True)
+                        self._file = open(self.path, 'a', encoding='utf-8')
+                    self._file.write(
+                        json.dumps(span.to_dict(), ensure_ascii=False) + '\n'
+                    )
+                    self._file.flush()
+                    if (self.max_file_bytes and
+                            self._file.tell() >= self.max_file_bytes):
+                        self._rotate()
+                except OSError as e:
+                    print(f"メトリクスの書き込みエラー: {str(e)}")
+                    self.enabled = False
+        for listener in self.listeners:
+            listener(span)
+
+    def _rotate(self):
+        """計測ログを<path>.1〜.<backups>にずらし、次のSpanから新しく書き始める"""
+        self._file.close()
+        self._file = None
+        if not self.backups:
+            os.remove(self.path)
+            return
+        for i in range(self.backups, 0, -1):
+            source = self.path if i == 1 else f'{self.path}.{i - 1}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.path}.{i}')
+
+    def summary(self, group_by=None):
+        """段階ごとの回数・成功数・合計時間・転送量を集計
+
+        group_byに属性名を指定すると、(属性値, 段階)ごとに集計する。
+        SUMMARY_GROUPS以外の属性は、保持している直近のSpanのみを集計する。
+        """
+        with self._lock:
+            if group_by is None:
+                return {
+                    name: stats.row() for name, stats in self.stages.items()
+                }
+            if group_by in self.groups:
+                return {
+                    key: stats.row()
+                    for key, stats in self.groups[group_by].items()
+                }
+        rows = {}
+        spans, _, _ = self.snapshot()
+        for span in spans:
+            key = (
+                (span.fields.get(group_by), span.name) if group_by
+                else span.name
+            )
+            row = rows.setdefault(key, {
+                'count': 0, 'ok': 0, 'seconds': 0.0, 'bytes': 0
+            })
+            row['count'] += 1
+            row['ok'] += span.outcome == OUTCOME_OK
+            row['seconds'] += span.duration
+            row['bytes'] += span.bytes
+        return rows
+
+    def throughput(self, name, group_by='worker'):
+        """段階の属性値（ワーカー）ごとの転送速度と、全体の実時間あたりの転送速度
+
+        全体の速度は、いずれかのSpanが実行中だった時間（重なりは1回だけ
+        数える）で合計の転送量を割って求める。保持している直近のSpanのみを
+        集計する。
+        """
+        spans, _, _ = self.snapshot()
+        spans = [span for span in spans if span.name == name]
+        groups = {}
+        for span in spans:
+            row = groups.setdefault(span.fields.get(group_by), {
+                'count': 0, 'seconds': 0.0, 'bytes': 0
+            })
+            row['count'] += 1
+            row['seconds'] += span.duration
+            row['bytes'] += span.bytes
+
+        # 実行中だった区間の和集合の長さと、同時実行数の最大値
+        events = sorted(
+            [(span.start, 1) for span in spans] +
+            [(span.start + span.duration, -1) for span in spans],
+            key=lambda event: (event[0], event[1])
+        )
+        wall = 0.0
+        active = 0
+        peak = 0
+        since = None
+        for at, delta in events:
+            if active == 0 and delta > 0:
+                since = at
+            active += delta
+            peak = max(peak, active)
+            if active == 0:
+                wall += at - since
+        total = {
+            'count': len(spans),
+            'bytes': sum(span.bytes for span in spans),
+            'seconds': wall,
+            'concurrency': peak,
+        }
+        return groups, total
+
+    def print_throughput(self, name='upload', group_by='worker'):
+        groups, total = self.throughput(name, group_by)
+        if not total['count']:
+            return
+        mb = 1024 * 1024
+        print(f"\n=== {name}の{group_by}ごとの転送速度 ===")
+        print(
+            f"{group_by:<20} {'回数':>6} {'合計秒':>10} {'MB':>10} {'MB/s':>8}"
+        )
+        for group, row in sorted(groups.items(), key=lambda i: str(i[0])):
+            rate = row['bytes'] / row['seconds'] / mb if row['seconds'] else 0
+            print(
+                f"{str(group):<20} {row['count']:>6} {row['seconds']:>10.1f} "
+                f"{row['bytes'] / mb:>10.1f} {rate:>8.2f}"
+            )
+        rate = total['bytes'] / total['seconds'] / mb if total['seconds'] else 0
+        print(
+            f"全体: {total['bytes'] / mb:.1f}MB, 実時間 {total['seconds']:.1f}秒, "
+            f"{rate:.2f}MB/s（最大同時実行数 {total['concurrency']}）"
+        )
+
+    def print_summary(self, group_by=None):
+        rows = self.summary(group_by)
+        if not rows:
+            return
+        mb = 1024 * 1024
+        if group_by:
+            print(f"\n=== {group_by}・処理段階ごとの集計 ===")
+            # 属性のないSpan（トークン取得など）は除いて、属性値ごとに並べる
+            rows = {
+                f"{group}/{name}": row
+                for (group, name), row in sorted(
+                    rows.items(), key=lambda item: str(item[0][0])
+                )
+                if group is not None
+            }
+        else:
+            print("\n=== 処理段階ごとの集計 ===")
+        print(
+            f"{'段階':<20} {'回数':>6} {'成功':>6} {'合計秒':>10} "
+            f"{'平均秒':>8} {'MB':>10} {'MB/s':>8}"
+        )
+        for name, row in rows.items():
+            rate = row['bytes'] / row['seconds'] / mb if row['seconds'] else 0
+            print(
+                f"{name:<20} {row['count']:>6} {row['ok']:>6} "
+                f"{row['seconds']:>10.1f} "
+                f"{row['seconds'] / row['count']:>8.2f} "
+                f"{row['bytes'] / mb:>10.1f} {rate:>8.2f}"
+            )
+        if self.enabled and self._file:
+            print(f"メトリクスログ: {self.path}")
+
+
+class _SpanContext:
+    def __init__(self, recorder, name, fields):
+        self.recorder = recorder
+        self.span = Span(name, fields)
+
+    def __enter__(self):
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        span.duration = time.monotonic() - span.start
+        if exc is not None:
+            span.fail(error=f"{exc_type.__name__}: {exc}")
+        self.recorder.record(span)
+        return False
+
+
+# プロセス全体で共有する記録先
+recorder = MetricsRecorder()
+
+
+def span(name, **fields):
+    """処理段階を計測するコンテキストマネージャー
+
+    with span('download', video_id=...) as s:
+        ...
+        s.bytes = 書き込んだバイト数
+    """
+    return recorder.span(name, **fields)
+
+
+def context(**fields):
+    """このスレッドで記録するSpanに共通の属性を付けるコンテキストマネージャー"""
+    return recorder.context(**fields)
+
+
+def current_context():
+    """このスレッドで設定されている共通の属性"""
+    return recorder.current_context()
+
+
+def count(name, value=1):
+    recorder.count(name, value)
+
+
+def set_gauge(name, value):
+    recorder.set_gauge(name, value)
@@ -0,0 +1,263 @@
+import threading
+from collections import OrderedDict, deque
+from twitch_api import TwitchAPI
+from video_downloader import VideoDownloader
+from vod_catalog import VODCatalog
+from quota_ledger import QuotaLedger
+from job_lease import LeaseStore
+from staging_area import StagingArea
+from upload_manager import UploadManager
+from config import Config
+import metrics
+from prometheus_exporter import TextfileExporter
+
+
+class FairQueue:
+    """チャンネルごとの待ち行列から順番に（ラウンドロビンで）取り出すキュー
+
+    maxsizeを指定すると、全体の件数が上限に達している間put()がブロックする。
+    """
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self._queues = OrderedDict()
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, key, item):
+        with self._cond:
+            while self.maxsize and self._size >= self.maxsize:
+                self._cond.wait()
+            self._queues.setdefault(key, deque()).append(item)
+            self._size += 1
+            self._cond.notify_all()
+
+    def get(self):
+        """次の(key, item)を取り出す。close()後に空になったらNoneを返す"""
+        with self._cond:
+            while True:
+                for key, items in self._queues.items():
+                    if not items:
+                        continue
+                    item = items.popleft()
+                    # 取り出したチャンネルは最後尾に回す
+                    self._queues.move_to_end(key)
+                    self._size -= 1
+                    self._cond.notify_all()
+                    return key, item
+                if self._closed and self._size == 0:
+                    return None
+                self._cond.wait()
+
+    def close(self):
+        """これ以上put()しないことを通知"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def qsize(self):
+        with self._cond:
+            return self._size
+
+
+class MultiChannelManager:
+    """複数チャンネルの配信アーカイブを、共有のワーカーで処理する
+
+    Twitchのアクセストークン・HTTPセッション、カタログ、ダウンローダー、
+    YouTube APIのクォータ台帳、複数ホスト用のリースは全チャンネルで共有する。
+    ダウンロード・アップロードはそれぞれ上限付きのワーカーでチャンネルを
+    順番に処理し、1チャンネルの大量のアーカイブが他のチャンネルを
+    待たせないようにする。同じチャンネルの動画も同時にアップロードでき、
+    その場合はアップロードごとに別のYouTubeクライアントを使う。
+    """
+
+    def __init__(self, channels, download_workers=None, upload_workers=None):
+        twitch_api = TwitchAPI(channels[0].name)
+        downloader = VideoDownloader()
+        catalog = VODCatalog()
+        # 全チャンネルが同じGoogle Cloudプロジェクトのクォータを使う
+        quota = QuotaLedger()
+        leases = LeaseStore.from_config()
+        # ダウンロード先は全チャンネルで共有するため、容量も共有で管理する
+        self.staging = StagingArea(
+            downloader.download_dir, catalog, leases=leases,
+            file_prefixes=[channel.file_prefix for channel in channels]
+        )
+        self.managers = OrderedDict(
+            (channel.name, UploadManager(
+                channel,
+                twitch_api=twitch_api.for_channel(channel.name),
+                downloader=downloader,
+                catalog=catalog,
+                quota=quota,
+                leases=leases,
+                staging=self.staging
+            ))
+            for channel in channels
+        )
+        self.download_workers = download_workers or Config.DOWNLOAD_WORKERS
+        self.upload_workers = upload_workers or Config.UPLOAD_WORKERS
+
+    def run_manual_upload(self, start_datetime, end_datetime, pipeline=False,
+                          stream=False):
+        """全チャンネルの指定した日時範囲の動画をアップロード
+
+        ダウンロードとアップロードは常に並行して行う（pipelineの指定に
+        かかわらず。streamは単一チャンネル用のため指定するとValueError）。
+        """
+        self._check_mode(pipeline, stream)
+        print(
+            f"{len(self.managers)}チャンネルの手動アップロード処理を開始: "
+            f"{start_datetime.strftime('%Y年%m月%d日 %H:%M:%S')} から "
+            f"{end_datetime.strftime('%Y年%m月%d日 %H:%M:%S')} "
+            "までの動画"
+        )
+        exporter = TextfileExporter.from_config()
+        if exporter:
+            exporter.start()
+        try:
+            self._run(lambda manager: manager._get_videos_in_date_range(
+                start_datetime, end_datetime
+            ))
+        finally:
+            if exporter:
+                exporter.stop()
+            self._print_summary()
+
+    def run_watch(self, interval=None, pipeline=False, stream=False,
+                  stop_event=None):
+        """全チャンネルの新しい配信アーカイブを定期的に確認してアップロード
+
+        pipeline・streamの扱いはrun_manual_uploadと同じ。1回の確認で
+        エラーが起きても、次の確認で再試行する。
+        """
+        self._check_mode(pipeline, stream)
+        interval = interval or Config.WATCH_INTERVAL
+        stop_event = stop_event or threading.Event()
+        exporter = TextfileExporter.from_config()
+        if exporter:
+            exporter.start()
+        print(
+            f"監視モードを開始: {len(self.managers)}チャンネルを"
+            f"{interval}秒ごとに確認します"
+        )
+        try:
+            while not stop_event.is_set():
+                try:
+                    self._run(lambda manager: manager.get_watch_videos())
+                except Exception as e:
+                    # 一時的なエラーで監視を止めないよう、次回の確認で再試行する
+                    print(f"監視処理エラー: {str(e)}")
+                stop_event.wait(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            print("\n監視モードを終了します")
+            if exporter:
+                exporter.stop()
+            self._print_summary()
+
+    @staticmethod
+    def _check_mode(pipeline, stream):
+        """単一チャンネル用の処理方式の指定を確認する"""
+        if stream:
+            raise ValueError("複数チャンネル設定では --stream は使用できません")
+        if pipeline:
+            print(
+                "複数チャンネル設定では常にダウンロードとアップロードを"
+                "並行して行います（--pipeline の指定は不要です）"
+            )
+
+    def _run(self, list_videos):
+        """チャンネルごとに動画一覧を取得し、まとめて処理"""
+        jobs = OrderedDict()
+        for name, manager in self.managers.items():
+            with metrics.context(channel=name):
+                try:
+                    jobs[name] = list_videos(manager)
+                except Exception as e:
+                    # 1チャンネルのエラーで他のチャンネルを止めない
+                    print(f"動画一覧の取得エラー（{name}）: {str(e)}")
+                    continue
+            if jobs[name]:
+                print(
+                    f"{name}: 未処理の配信アーカイブ {len(jobs[name])} 件を発見"
+                )
+                metrics.count('vods_discovered', len(jobs[name]))
+        if any(jobs.values()):
+            self._run_workers(jobs)
+
+    def _print_summary(self):
+        metrics.recorder.print_summary()
+        metrics.recorder.print_summary(group_by='channel')
+        metrics.recorder.print_throughput('upload')
+
+    def _run_workers(self, jobs):
+        """チャンネルごとの動画一覧を共有のワーカーで処理し、完了を待つ"""
+        # 処理が終わった動画の残りのファイルを削除
+        self.staging.cleanup()
+        downloads = FairQueue()
+        for name, videos in jobs.items():
+            for video in videos:
+                downloads.put(name, video)
+        downloads.close()
+        uploads = FairQueue(
+            maxsize=max(Config.PIPELINE_QUEUE_SIZE, self.upload_workers)
+        )
+
+        downloaders = [
+            threading.Thread(
+                target=self._download_worker, args=(downloads, uploads),
+                name=f'channel-download-{i}'
+            )
+            for i in range(self.download_workers)
+        ]
+        uploaders = [
+            threading.Thread(
+                target=self._upload_worker, args=(uploads,),
+                name=f'channel-upload-{i}'
+            )
+            for i in range(self.upload_workers)
+        ]
+        for thread in downloaders + uploaders:
+            thread.start()
+        for thread in downloaders:
+            thread.join()
+        uploads.close()
+        for thread in uploaders:
+            thread.join()
+
+    def _download_worker(self, downloads, uploads):
+        while True:
+            entry = downloads.get()
+            if entry is None:
+                break
+            name, video = entry
+            with metrics.context(channel=name):
+                print(f"\n=== [{name}] ダウンロード中: {video['title']} ===")
+                try:
+                    job = self.managers[name].download_single_video(video)
+                except Exception as e:
+                    print(f"動画処理エラー（{name}）: {str(e)}")
+                    metrics.count('vods_failed')
+                    continue
+            if job:
+                # アップロード待ちが上限に達している間はここでブロックする
+                uploads.put(name, job)
+                metrics.set_gauge('queue_depth', uploads.qsize())
+
+    def _upload_worker(self, uploads):
+        while True:
+            entry = uploads.get()
+            if entry is None:
+                break
+            name, job = entry
+            metrics.set_gauge('queue_depth', uploads.qsize())
+            try:
+                with metrics.context(channel=name):
+                    print(f"\n=== [{name}] アップロード中: {job['title']} ===")
+                    self.managers[name].upload_downloaded_video(job)
+            except Exception as e:
+                print(f"動画処理エラー（{name}）: {str(e)}")
+                metrics.count('vods_failed')
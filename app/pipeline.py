@@ -0,0 +1,113 @@
+import queue
+import shutil
+import threading
+import time
+from config import Config
+import metrics
+
+
+# キューの終端を示す番兵
+_DONE = object()
+
+
+class UploadPipeline:
+    """ダウンロードとアップロードを別スレッドで並行実行するパイプライン
+
+    ダウンロード済みの動画は上限付きキューを経由して、upload_workers個の
+    アップロードスレッドに渡される。キューが満杯、またはDOWNLOAD_DIRの
+    空き容量が不足している間は次のダウンロードを開始しない。
+    """
+
+    def __init__(self, upload_manager, queue_size=None,
+                 min_free_bytes=None, poll_interval=10, upload_workers=None):
+        self.upload_manager = upload_manager
+        self.upload_workers = upload_workers or Config.UPLOAD_WORKERS
+        self.download_dir = upload_manager.downloader.download_dir
+        self.queue = queue.Queue(
+            maxsize=queue_size or Config.PIPELINE_QUEUE_SIZE
+        )
+        self.min_free_bytes = (
+            min_free_bytes if min_free_bytes is not None
+            else Config.PIPELINE_MIN_FREE_SPACE_GB * 1024 ** 3
+        )
+        self.poll_interval = poll_interval
+        self._uploading = 0
+        self._uploading_lock = threading.Lock()
+
+    def _free_bytes(self):
+        return shutil.disk_usage(self.download_dir).free
+
+    def _wait_for_disk_space(self):
+        """空き容量が閾値を下回っている間、アップロードの完了を待つ
+
+        アップロード待ち・アップロード中の動画がなければ、待っても空き容量は
+        増えないためそのまま続行する。
+        """
+        warned = False
+        while self._free_bytes() < self.min_free_bytes:
+            if self.queue.empty() and not self._uploading:
+                break
+            if not warned:
+                print(
+                    f"空き容量不足のためダウンロードを待機中: "
+                    f"残り {self._free_bytes() / 1024 ** 3:.1f}GB"
+                )
+                warned = True
+            time.sleep(self.poll_interval)
+
+    def _download_worker(self, videos):
+        try:
+            for i, video in enumerate(videos, 1):
+                self._wait_for_disk_space()
+                print(f"\n=== {i}件目の動画をダウンロード中 ===")
+                try:
+                    job = self.upload_manager.download_single_video(video)
+                except Exception as e:
+                    print(f"動画処理エラー: {str(e)}")
+                    metrics.count('vods_failed')
+                    continue
+                if job:
+                    # キューが満杯の間はここでブロックする
+                    self.queue.put(job)
+                    metrics.set_gauge('queue_depth', self.queue.qsize())
+        finally:
+            # アップロードスレッドごとに終端を渡す
+            for _ in range(self.upload_workers):
+                self.queue.put(_DONE)
+
+    def _upload_worker(self):
+        while True:
+            job = self.queue.get()
+            metrics.set_gauge('queue_depth', self.queue.qsize())
+            if job is _DONE:
+                break
+            with self._uploading_lock:
+                self._uploading += 1
+            try:
+                print(f"\n=== アップロード中: {job['title']} ===")
+                self.upload_manager.upload_downloaded_video(job)
+            except Exception as e:
+                print(f"動画処理エラー: {str(e)}")
+                metrics.count('vods_failed')
+            finally:
+                with self._uploading_lock:
+                    self._uploading -= 1
+
+    def run(self, videos):
+        """動画一覧をパイプラインで処理し、すべて完了するまで待つ"""
+        downloader = threading.Thread(
+            target=self._download_worker, args=(videos,),
+            name='pipeline-download'
+        )
+        uploaders = [
+            threading.Thread(
+                target=self._upload_worker, name=f'pipeline-upload-{i}'
+            )
+            for i in range(self.upload_workers)
+        ]
+        downloader.start()
+        for uploader in uploaders:
+            uploader.start()
+        downloader.join()
+        for uploader in uploaders:
+            uploader.join()
@@ -0,0 +1,141 @@
+import os
+import threading
+from config import Config
+import metrics
+
+
+PREFIX = 'twitch_vod_uploader'
+
+# 処理段階の所要時間のヒストグラムのバケット（秒）
+LATENCY_BUCKETS = metrics.LATENCY_BUCKETS
+
+# カウンター名とその説明
+COUNTERS = {
+    'vods_discovered': '処理対象として見つかった配信アーカイブ数',
+    'vods_processed': 'YouTubeへのアップロードが完了した配信アーカイブ数',
+    'vods_skipped': 'スキップした配信アーカイブ数',
+    'vods_failed': '処理に失敗した配信アーカイブ数',
+    'vods_deferred': (
+        'YouTube APIのクォータ不足・ダウンロード先の容量不足で'
+        '延期した配信アーカイブ数'
+    ),
+    'bytes_downloaded': 'ダウンロードしたバイト数',
+    'bytes_uploaded': 'アップロードしたバイト数',
+    'bytes_evicted': 'ステージング領域の容量を空けるために削除したバイト数',
+    'download_throttled_seconds': '帯域制限によりダウンロードを待たせた秒数',
+    'upload_throttled_seconds': '帯域制限によりアップロードを待たせた秒数',
+}
+
+# 現在値とその説明
+GAUGES = {
+    'queue_depth': 'アップロード待ちの動画数',
+    'youtube_quota_used': '当日（太平洋時間）に消費したYouTube APIのクォータ',
+    'staging_bytes': 'ダウンロード先に置かれているファイルの合計バイト数',
+    'staging_reserved_bytes': '処理中の動画のために予約したバイト数',
+    'download_rate_limit_bytes': '現在のダウンロードの帯域上限（バイト/秒、0は無制限）',
+    'upload_rate_limit_bytes': '現在のアップロードの帯域上限（バイト/秒、0は無制限）',
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+class TextfileExporter:
+    """node_exporterのtextfile collector形式でメトリクスを書き出す
+
+    start()すると一定間隔で、stop()すると最後にもう一度書き出す。
+    書き込みは一時ファイルからのリネームで行うため、読み込み側が
+    書きかけのファイルを見ることはない。
+    """
+
+    def __init__(self, path, interval=None, recorder=None):
+        self.path = path
+        self.interval = interval or Config.PROMETHEUS_INTERVAL
+        self.recorder = recorder or metrics.recorder
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls):
+        """PROMETHEUS_TEXTFILEが設定されている場合のみ作成"""
+        if not Config.PROMETHEUS_TEXTFILE:
+            return None
+        return cls(Config.PROMETHEUS_TEXTFILE)
+
+    def render(self):
+        counters, gauges = self.recorder.values()
+        stages = self.recorder.stage_stats()
+        lines = []
+
+        for name, help_text in COUNTERS.items():
+            metric = f'{PREFIX}_{name}_total'
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric} {counters.get(name, 0)}')
+
+        for name, help_text in GAUGES.items():
+            metric = f'{PREFIX}_{name}'
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} gauge')
+            lines.append(f'{metric} {gauges.get(name, 0)}')
+
+        # 処理段階ごとの所要時間（記録時に累積した値を使う）
+        metric = f'{PREFIX}_stage_duration_seconds'
+        lines.append(f'# HELP {metric} 処理段階ごとの所要時間')
+        lines.append(f'# TYPE {metric} histogram')
+        for stage, stats in sorted(stages.items()):
+            label = f'stage="{_escape(stage)}"'
+            for bucket, n in zip(LATENCY_BUCKETS, stats.buckets):
+                lines.append(f'{metric}_bucket{{{label},le="{bucket}"}} {n}')
+            lines.append(
+                f'{metric}_bucket{{{label},le="+Inf"}} {stats.count}'
+            )
+            lines.append(f'{metric}_sum{{{label}}} {stats.seconds:.3f}')
+            lines.append(f'{metric}_count{{{label}}} {stats.count}')
+
+        # 処理段階ごとの最終成功時刻
+        metric = f'{PREFIX}_stage_last_success_timestamp_seconds'
+        lines.append(f'# HELP {metric} 処理段階が最後に成功した時刻')
+        lines.append(f'# TYPE {metric} gauge')
+        for stage, stats in sorted(stages.items()):
+            if stats.last_success is None:
+                continue
+            lines.append(
+                f'{metric}{{stage="{_escape(stage)}"}} '
+                f'{stats.last_success:.3f}'
+            )
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.render())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Prometheusメトリクスの書き込みエラー: {str(e)}")
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            self.write()
+
+    def start(self):
+        self.write()
+        # stop()した後にもう一度start()できるよう、開始のたびに作り直す
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(self._stop,),
+            name='prometheus-exporter', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.write()
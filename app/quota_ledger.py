@@ -0,0 +1,190 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+import pytz
+from config import Config
+import metrics
+
+
+# YouTube Data APIのメソッドごとのクォータ消費量（ユニット）
+QUOTA_COSTS = {
+    'videos.insert': 1600,
+    'videos.update': 50,
+    'videos.list': 1,
+    'channels.list': 1,
+    'playlistItems.list': 1,
+}
+
+# クォータは太平洋時間の0時にリセットされる
+QUOTA_TIMEZONE = pytz.timezone('America/Los_Angeles')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quota_usage (
+    day TEXT NOT NULL,
+    method TEXT NOT NULL,
+    units INTEGER NOT NULL,
+    calls INTEGER NOT NULL,
+    PRIMARY KEY (day, method)
+);
+"""
+
+
+class QuotaReservation:
+    """QuotaLedger.reserve()で予約したクォータ
+
+    予約したAPI呼び出しを行ったらuse()で1回分を予約から外し（消費量は
+    record()で記録される）、不要になった残りはrelease()で解除する。
+    """
+
+    def __init__(self, ledger, method, count):
+        self.ledger = ledger
+        self.method = method
+        self.remaining = count
+        self._lock = threading.Lock()
+
+    def use(self):
+        """予約したAPI呼び出しを1回行った"""
+        self.release(1)
+
+    def release(self, count=None):
+        """予約の残り（またはcount回分）を解除"""
+        with self._lock:
+            count = self.remaining if count is None else min(
+                count, self.remaining
+            )
+            self.remaining -= count
+        if count:
+            self.ledger.release(self.method, count)
+
+
+class QuotaLedger:
+    """YouTube Data APIのクォータ消費量を太平洋時間の日ごとに記録する台帳
+
+    消費量はSQLiteに保存するため、複数回の実行をまたいで1日の合計を追跡できる。
+    ダウンロード開始前にreserve()でアップロード分のクォータを予約しておくと、
+    並行して処理中の動画の分も差し引いて残量を判断できる（予約はプロセス内のみ）。
+    daily_limitが0の場合は残量を確認しない。
+    """
+
+    def __init__(self, db_path=None, daily_limit=None):
+        self.db_path = db_path or Config.QUOTA_LEDGER_PATH
+        self.daily_limit = (
+            Config.YOUTUBE_DAILY_QUOTA if daily_limit is None else daily_limit
+        )
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._reserve_lock = threading.Lock()
+        self._reserved = 0
+        # 複数プロセス・複数チャンネルから同じファイルを使うため待ち時間を設ける
+        self.conn = sqlite3.connect(
+            self.db_path, timeout=30, check_same_thread=False
+        )
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    @staticmethod
+    def today():
+        """現在のクォータ期間（太平洋時間の日付）"""
+        return datetime.now(QUOTA_TIMEZONE).strftime('%Y-%m-%d')
+
+    @staticmethod
+    def next_reset():
+        """次にクォータがリセットされる日時（太平洋時間の翌日0時）"""
+        now = datetime.now(QUOTA_TIMEZONE)
+        tomorrow = (now + timedelta(days=1)).date()
+        return QUOTA_TIMEZONE.localize(
+            datetime.combine(tomorrow, datetime.min.time())
+        )
+
+    def cost(self, method):
+        return QUOTA_COSTS.get(method, 1)
+
+    def record(self, method, units=None):
+        """APIの呼び出し1回分の消費量を記録"""
+        units = self.cost(method) if units is None else units
+        with self._lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO quota_usage (day, method, units, calls)
+                VALUES (?, ?, ?, 1)
+                ON CONFLICT (day, method) DO UPDATE SET
+                    units = units + excluded.units,
+                    calls = calls + 1
+                """,
+                (self.today(), method, units)
+            )
+        metrics.set_gauge('youtube_quota_used', self.used())
+
+    def mark_exhausted(self):
+        """APIからquotaExceededが返された場合、当日の残量を0として記録"""
+        remaining = self.remaining(include_reserved=False)
+        if remaining:
+            self.record('quotaExceeded', remaining)
+        print(
+            f"YouTube APIのクォータが上限に達しました。"
+            f"{self.format_reset()}にリセットされます"
+        )
+
+    def used(self, day=None):
+        """指定した日（省略時は当日）の消費量の合計"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT COALESCE(SUM(units), 0) FROM quota_usage WHERE day = ?",
+                (day or self.today(),)
+            ).fetchone()
+        return row[0]
+
+    def usage_by_method(self, day=None):
+        """指定した日のメソッドごとの消費量と呼び出し回数"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT method, units, calls FROM quota_usage WHERE day = ? "
+                "ORDER BY units DESC",
+                (day or self.today(),)
+            ).fetchall()
+        return {method: (units, calls) for method, units, calls in rows}
+
+    def remaining(self, include_reserved=True):
+        """当日の残りクォータ（上限なしの場合はNone）"""
+        if not self.daily_limit:
+            return None
+        reserved = self._reserved if include_reserved else 0
+        return max(self.daily_limit - self.used() - reserved, 0)
+
+    def can_afford(self, method, count=1):
+        """予約分を除いた当日の残量でメソッドcount回分をまかなえるか"""
+        if not self.daily_limit:
+            return True
+        return (
+            self.remaining(include_reserved=False) >= self.cost(method) * count
+        )
+
+    def reserve(self, method, count=1):
+        """残量が足りればメソッドcount回分を予約してQuotaReservationを返す
+
+        足りない場合はNoneを返す。
+        """
+        if not self.daily_limit:
+            return QuotaReservation(self, method, count)
+        cost = self.cost(method) * count
+        with self._reserve_lock:
+            if self.remaining() < cost:
+                return None
+            self._reserved += cost
+        return QuotaReservation(self, method, count)
+
+    def release(self, method, count=1):
+        """reserve()した予約を解除（実際の消費はrecord()で記録する）"""
+        if not self.daily_limit:
+            return
+        with self._reserve_lock:
+            self._reserved = max(
+                self._reserved - self.cost(method) * count, 0
+            )
+
+    def format_reset(self):
+        """次のリセット日時を日本時間で表示用に整形"""
+        reset_jst = self.next_reset().astimezone(pytz.timezone('Asia/Tokyo'))
+        return reset_jst.strftime('%Y年%m月%d日 %H:%M')
@@ -0,0 +1,164 @@
+import threading
+import time
+from datetime import datetime
+import pytz
+from config import Config
+import metrics
+
+
+# 待機中でもこの間隔（秒）ごとに上限を確認し直し、時間帯の切り替えを反映する
+MAX_SLEEP = 1.0
+
+
+def mbps_to_bytes(mbps):
+    """Mbps（メガビット毎秒）をバイト毎秒に変換"""
+    return mbps * 1000 * 1000 / 8
+
+
+def _parse_time(value):
+    hours, minutes = value.strip().split(':')
+    minute = int(hours) * 60 + int(minutes)
+    if not 0 <= minute <= 24 * 60:
+        raise ValueError(f"無効な時刻: {value}")
+    return minute
+
+
+class BandwidthProfile:
+    """時間帯ごとの転送速度の上限（Mbps）
+
+    specは「09:00-18:00=50,18:00-24:00=200」のようなカンマ区切りの
+    「開始-終了=Mbps」で、終了が開始より前の場合は日をまたぐ時間帯と
+    みなす。どの時間帯にも当てはまらない時刻はdefault_mbpsを使い、
+    0は制限しないことを表す。時刻はtimezoneの現地時刻で判定する。
+    """
+
+    def __init__(self, default_mbps=0, spec='', timezone=None):
+        self.default_mbps = default_mbps
+        self.timezone = pytz.timezone(timezone or Config.BANDWIDTH_TIMEZONE)
+        self.windows = []
+        for entry in (spec or '').split(','):
+            if not entry.strip():
+                continue
+            try:
+                span, mbps = entry.split('=')
+                start, end = span.split('-')
+                self.windows.append(
+                    (_parse_time(start), _parse_time(end), float(mbps))
+                )
+            except ValueError:
+                raise ValueError(f"帯域プロファイルの形式が不正です: {entry}")
+
+    def mbps_at(self, now=None):
+        """時刻nowの上限（Mbps、0は無制限）"""
+        now = now or datetime.now(self.timezone)
+        minute = now.hour * 60 + now.minute
+        for start, end, mbps in self.windows:
+            if start <= end:
+                if start <= minute < end:
+                    return mbps
+            elif minute >= start or minute < end:
+                return mbps
+        return self.default_mbps
+
+    def rate_at(self, now=None):
+        """時刻nowの上限（バイト/秒、0は無制限）"""
+        return mbps_to_bytes(self.mbps_at(now))
+
+
+class TokenBucket:
+    """転送量（バイト/秒）の上限を複数スレッドで共有するトークンバケット
+
+    送信・受信後に転送したバイト数を consume() すると、上限を超えた分だけ
+    呼び出したスレッドを待たせる。トークンが足りない場合は借りとして
+    記録するため、バケットの容量より大きい転送もまとめて計上できる。
+    profileを渡すと呼び出しのたびに現在の時間帯の上限を使うため、
+    長い転送の途中でも上限が切り替わる。上限が0の場合は制限しない。
+
+    nameを渡すと、待った秒数を「<name>_throttled_seconds」、現在の上限を
+    「<name>_rate_limit_bytes」としてメトリクスに記録する。
+    """
+
+    def __init__(self, rate=0, burst=None, profile=None, name=None):
+        self.profile = profile
+        self.name = name
+        self._fixed_burst = burst
+        self.rate = rate
+        # 1秒分までは溜めておける（アイドル後の送り始めを待たせない）
+        self.burst = burst or rate
+        self.waited = 0.0
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refresh(self, now):
+        """現在の上限を反映してトークンを補充する（ロック内で呼ぶ）"""
+        if self.profile:
+            rate = self.profile.rate_at()
+            if rate != self.rate:
+                self.rate = rate
+                self.burst = self._fixed_burst or rate
+                # 無制限になった場合は借りを帳消しにする
+                if not rate:
+                    self._tokens = 0.0
+                if self.name:
+                    metrics.set_gauge(f'{self.name}_rate_limit_bytes', rate)
+        if self.rate:
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+        self._updated = now
+
+    def current_rate(self):
+        """現在の上限（バイト/秒、0は無制限）"""
+        if not self.profile:
+            return self.rate
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self.rate
+
+    def consume(self, amount):
+        """amountバイト分のトークンを消費し、待った秒数を返す"""
+        if amount <= 0 or not (self.rate or self.profile):
+            return 0.0
+        with self._lock:
+            self._refresh(time.monotonic())
+            if not self.rate:
+                return 0.0
+            self._tokens -= amount
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refresh(time.monotonic())
+                if not self.rate or self._tokens >= 0:
+                    break
+                wait = min(-self._tokens / self.rate, MAX_SLEEP)
+            time.sleep(wait)
+            waited += wait
+
+        if waited:
+            with self._lock:
+                self.waited += waited
+            if self.name:
+                metrics.count(f'{self.name}_throttled_seconds', waited)
+        return waited
+
+
+def _build_limiter(name, mbps, spec):
+    profile = BandwidthProfile(mbps, spec) if spec else None
+    limiter = TokenBucket(mbps_to_bytes(mbps), profile=profile, name=name)
+    metrics.set_gauge(
+        f'{name}_rate_limit_bytes',
+        profile.rate_at() if profile else limiter.rate
+    )
+    return limiter
+
+
+# ダウンロード（受信）・アップロード（送信）それぞれ、全ワーカー・全チャンネルで
+# 共有する上限
+download_limiter = _build_limiter(
+    'download', Config.DOWNLOAD_BANDWIDTH_MBPS, Config.DOWNLOAD_BANDWIDTH_PROFILE
+)
+upload_limiter = _build_limiter(
+    'upload', Config.UPLOAD_BANDWIDTH_MBPS, Config.UPLOAD_BANDWIDTH_PROFILE
+)
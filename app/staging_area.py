@@ -0,0 +1,308 @@
+import os
+import re
+import shutil
+import threading
+import time
+from config import Config
+from job_lease import LEASE_CLAIMED
+from vod_catalog import (
+    STATE_DOWNLOADING, STATE_DOWNLOADED, STATE_VERIFIED, STATE_UPLOADING,
+    STATE_UPLOADED
+)
+import metrics
+
+
+# 追い出す順番（値が小さいものから追い出す。同じ順位では最後に使った時刻が古い順）
+EVICT_ORPHAN = 0       # カタログにない（または処理が終わった）動画のファイル
+EVICT_UPLOADED = 1     # アップロード済みで削除されずに残ったファイル
+EVICT_INCOMPLETE = 2   # ダウンロード途中のファイル
+EVICT_PENDING = 3      # アップロード待ち（失敗したものを含む）のファイル
+
+# このツールが作成するファイル名（<接頭辞>YYYYMMDD_<タイトル>.mp4と、
+# その名前で始まる一時ファイル・分割したパート）の接頭辞以降の部分
+GENERATED_NAME = r'\d{8}_.*\.(?:mp4|part\d{3}\.ts|parts\.csv)(?:\..*)?'
+
+EVICT_ORDER = {
+    STATE_UPLOADED: EVICT_UPLOADED,
+    STATE_DOWNLOADING: EVICT_INCOMPLETE,
+    STATE_DOWNLOADED: EVICT_PENDING,
+    STATE_VERIFIED: EVICT_PENDING,
+    STATE_UPLOADING: EVICT_PENDING,
+}
+
+
+class StagedVOD:
+    """DOWNLOAD_DIRに置かれている1動画分のファイル"""
+
+    def __init__(self, video_id, state):
+        self.video_id = video_id
+        self.state = state
+        self.paths = []
+        self.size = 0
+        self.last_used = 0.0
+
+    @property
+    def rank(self):
+        if self.video_id is None:
+            return EVICT_ORPHAN
+        return EVICT_ORDER.get(self.state, EVICT_ORPHAN)
+
+
+class StagingArea:
+    """DOWNLOAD_DIRの使用量を上限内に保つステージング領域
+
+    ファイルはカタログの記録（動画IDと処理状態）と結び付けて管理する。
+    ダウンロードの前に予想サイズを予約し、上限（max_bytes、0の場合は
+    ディスクの空き容量のみ）を超える場合は、処理中でない動画のファイルを
+    処理状態の順（EVICT_*）、同じ状態では最後に使った時刻の古い順に
+    追い出す。それでも足りない場合は、他の動画の予約が解除されるのを
+    待つか、待っても空かない場合は予約を断る。
+
+    leasesを渡すと、他のプロセス・ホストが処理中（リースが有効）の動画の
+    ファイルも追い出さない。渡さない場合はこのプロセスの予約のみを見るため、
+    DOWNLOAD_DIRを複数のプロセスで共有する場合はLEASE_DB_PATHを設定する。
+
+    カタログにないファイルは、このツールが作成する名前（file_prefixesの
+    いずれかの接頭辞で始まるもの）のみを対象とし、それ以外には触れない。
+    それらも旧版が残したダウンロードの可能性があるため、最後に更新されてから
+    orphan_max_age秒（0の場合は無期限）経つまでは削除しない。
+    """
+
+    def __init__(self, download_dir, catalog, max_bytes=None,
+                 poll_interval=10, leases=None, file_prefixes=('',),
+                 orphan_max_age=None):
+        self.download_dir = download_dir
+        self.catalog = catalog
+        self.leases = leases
+        self._generated = re.compile(
+            '(?:' + '|'.join(
+                re.escape(prefix)
+                for prefix in sorted(set(file_prefixes), key=len, reverse=True)
+            ) + ')' + GENERATED_NAME
+        )
+        self.max_bytes = (
+            max_bytes if max_bytes is not None
+            else int(Config.STAGING_MAX_GB * 1024 ** 3)
+        )
+        self.orphan_max_age = (
+            orphan_max_age if orphan_max_age is not None
+            else Config.STAGING_ORPHAN_MAX_AGE_HOURS * 3600
+        )
+        self.poll_interval = poll_interval
+        # 処理中の動画IDと予約したバイト数（処理中の動画のファイルは追い出さない）
+        self._reserved = {}
+        self._last_used = {}
+        self._cond = threading.Condition()
+
+    def _scan(self):
+        """ディレクトリ内のファイルを動画ごとにまとめる
+
+        カタログに記録されたファイルと、その名前で始まる一時ファイル
+        （.part・分割したパート・アップロードの再開情報など）を同じ動画の
+        ファイルとみなす。
+        """
+        owners = {}
+        prefixes = []
+        for video_id, state, file_path in self.catalog.get_staged_files():
+            owners[os.path.basename(file_path)] = (video_id, state)
+            root = os.path.splitext(os.path.basename(file_path))[0]
+            prefixes.append((root + '.', video_id, state))
+
+        vods = {}
+        try:
+            names = os.listdir(self.download_dir)
+        except FileNotFoundError:
+            return []
+        for name in names:
+            path = os.path.join(self.download_dir, name)
+            # ストリーミング用のバッファなどの隠しファイルは対象外
+            if name.startswith('.') or not os.path.isfile(path):
+                continue
+            owner = owners.get(name) or next(
+                ((video_id, state) for prefix, video_id, state in prefixes
+                 if name.startswith(prefix)),
+                (None, None)
+            )
+            # このツールが作成したものでないファイルは対象外
+            if owner[0] is None and not self._generated.fullmatch(name):
+                continue
+            # カタログにないファイルは1ファイルずつ扱う
+            key = owner[0] or path
+            vod = vods.get(key)
+            if vod is None:
+                vod = vods[key] = StagedVOD(*owner)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            vod.paths.append(path)
+            vod.size += stat.st_size
+            vod.last_used = max(
+                vod.last_used, stat.st_mtime,
+                self._last_used.get(owner[0], 0.0)
+            )
+        return list(vods.values())
+
+    def _outstanding(self, vods):
+        """予約のうち、まだ書き込まれていないバイト数"""
+        written = {vod.video_id: vod.size for vod in vods}
+        return sum(
+            max(size - written.get(video_id, 0), 0)
+            for video_id, size in self._reserved.items()
+        )
+
+    def _shortfall(self, vods, size, own):
+        """sizeバイトを追加で予約するために空ける必要があるバイト数"""
+        outstanding = self._outstanding(vods) + max(size - own, 0)
+        shortfall = outstanding - shutil.disk_usage(self.download_dir).free
+        if self.max_bytes:
+            used = sum(vod.size for vod in vods)
+            shortfall = max(shortfall, used + outstanding - self.max_bytes)
+        return shortfall
+
+    def _in_flight(self):
+        """処理中の動画ID（このプロセスの予約と、有効なリースのある動画）"""
+        in_flight = set(self._reserved)
+        if self.leases:
+            in_flight |= self.leases.active_video_ids()
+        return in_flight
+
+    def _removable(self, vods):
+        """削除してよい動画（処理中でないもの。カタログにないものは十分古いもの）"""
+        in_flight = self._in_flight()
+        now = time.time()
+        removable = []
+        for vod in vods:
+            if vod.video_id is None:
+                if not self.orphan_max_age or \
+                        now - vod.last_used < self.orphan_max_age:
+                    continue
+            elif vod.video_id in in_flight:
+                continue
+            removable.append(vod)
+        return removable
+
+    def _evict(self, vods, needed):
+        """処理中でない動画のファイルを追い出し、空けたバイト数を返す
+
+        追い出しても足りない場合は何も削除せずに0を返す。
+        """
+        candidates = sorted(
+            self._removable(vods), key=lambda vod: (vod.rank, vod.last_used)
+        )
+        if sum(vod.size for vod in candidates) < needed:
+            return 0
+        freed = 0
+        for vod in candidates:
+            if freed >= needed:
+                break
+            freed += self._remove(vod)
+        return freed
+
+    def _remove(self, vod):
+        """動画のファイルを削除し、カタログを削除後の状態に戻す
+
+        処理待ちの動画は、削除する間だけリースを取得し、他のワーカーが
+        同時に処理を始めないようにする（取得できなければ削除せずに0を返す）。
+        """
+        needs_lease = bool(
+            self.leases and vod.video_id is not None and
+            vod.rank > EVICT_UPLOADED
+        )
+        if needs_lease and self.leases.claim(vod.video_id) != LEASE_CLAIMED:
+            return 0
+        try:
+            return self._remove_files(vod)
+        finally:
+            if needs_lease:
+                self.leases.release(vod.video_id)
+
+    def _remove_files(self, vod):
+        for path in vod.paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+        if vod.video_id is None:
+            print(f"不要なファイルを削除: {os.path.basename(vod.paths[0])}")
+        else:
+            print(
+                f"ステージング領域から追い出しました: {vod.video_id}"
+                f"（{vod.state}、{vod.size / 1024 ** 3:.1f}GB）"
+            )
+            if vod.state == STATE_UPLOADED:
+                self.catalog.mark_cleaned(vod.video_id)
+            elif vod.rank > EVICT_UPLOADED:
+                # 次回は最初からダウンロードし直す
+                self.catalog.reset(vod.video_id)
+            self._last_used.pop(vod.video_id, None)
+        metrics.count('bytes_evicted', vod.size)
+        return vod.size
+
+    def _update_gauges(self, vods=None):
+        vods = self._scan() if vods is None else vods
+        metrics.set_gauge('staging_bytes', sum(vod.size for vod in vods))
+        metrics.set_gauge('staging_reserved_bytes', sum(self._reserved.values()))
+
+    def reserve(self, video_id, size, wait=True):
+        """動画の予想サイズ分の容量を予約し、予約できればTrueを返す
+
+        容量が足りない場合は追い出しを行い、それでも足りなければ
+        他の動画の予約が解除されるまで待つ（wait=Falseの場合や、
+        待っても空かない場合はFalseを返す）。
+        """
+        warned = False
+        with self._cond:
+            while True:
+                vods = self._scan()
+                own = next(
+                    (vod.size for vod in vods if vod.video_id == video_id), 0
+                )
+                if self.max_bytes and size > self.max_bytes:
+                    print(
+                        f"予想サイズ（{size / 1024 ** 3:.1f}GB）が"
+                        f"ステージング領域の上限"
+                        f"（{self.max_bytes / 1024 ** 3:.1f}GB）を超えています"
+                    )
+                    return False
+                shortfall = self._shortfall(vods, size, own)
+                if shortfall > 0:
+                    shortfall -= self._evict(
+                        [vod for vod in vods if vod.video_id != video_id],
+                        shortfall
+                    )
+                if shortfall <= 0:
+                    self._reserved[video_id] = size
+                    self._update_gauges()
+                    return True
+                # 処理中の動画がなければ、待っても空き容量は増えない
+                if not wait or not self._reserved:
+                    print(
+                        f"ステージング領域の容量が"
+                        f"{shortfall / 1024 ** 3:.1f}GB不足しています"
+                    )
+                    return False
+                if not warned:
+                    print(
+                        f"ステージング領域の容量不足のため、処理中の動画の"
+                        f"完了を待機中（不足 {shortfall / 1024 ** 3:.1f}GB）"
+                    )
+                    warned = True
+                self._cond.wait(self.poll_interval)
+
+    def release(self, video_id):
+        """動画の処理が終わった（ファイルは残っていれば追い出しの対象になる）"""
+        with self._cond:
+            if self._reserved.pop(video_id, None) is None:
+                return
+            self._last_used[video_id] = time.time()
+            self._update_gauges()
+            self._cond.notify_all()
+
+    def cleanup(self):
+        """処理が終わった動画・カタログにない動画のファイルを削除"""
+        with self._cond:
+            for vod in self._removable(self._scan()):
+                if vod.rank <= EVICT_UPLOADED:
+                    self._remove(vod)
+            self._update_gauges()
@@ -0,0 +1,123 @@
+import os
+import threading
+
+
+class StreamBufferError(IOError):
+    """ストリームの書き込み側が失敗、または処理が中断された"""
+
+
+class StreamBuffer:
+    """ダウンロードとアップロードをつなぐ固定サイズのリングバッファ
+
+    書き込み側（ダウンロード）は空きができるまでブロックし、読み込み側
+    （アップロード）は要求した範囲が書き込まれるまでブロックする。
+    読み込み位置より前のデータはアップロード済みとみなして解放する。
+    spill_pathを指定した場合はメモリではなくそのファイルを保存先に使う。
+    """
+
+    def __init__(self, capacity, spill_path=None):
+        self.capacity = capacity
+        self.spill_path = spill_path
+        if spill_path:
+            self._file = open(spill_path, 'w+b')
+            self._file.truncate(capacity)
+            self._memory = None
+        else:
+            self._file = None
+            self._memory = bytearray(capacity)
+
+        # 絶対位置（ストリーム先頭からのバイト数）で管理する
+        self._start = 0   # 保持している最も古いバイトの位置
+        self._end = 0     # 書き込み済みの末尾位置
+        self._finished = False
+        self._error = None
+        self._cond = threading.Condition()
+
+    @property
+    def bytes_written(self):
+        return self._end
+
+    def _store(self, pos, data):
+        offset = pos % self.capacity
+        first = min(len(data), self.capacity - offset)
+        for at, part in ((offset, data[:first]), (0, data[first:])):
+            if not part:
+                continue
+            if self._file:
+                self._file.seek(at)
+                self._file.write(part)
+            else:
+                self._memory[at:at + len(part)] = part
+
+    def _load(self, pos, length):
+        offset = pos % self.capacity
+        first = min(length, self.capacity - offset)
+        parts = []
+        for at, size in ((offset, first), (0, length - first)):
+            if not size:
+                continue
+            if self._file:
+                self._file.seek(at)
+                parts.append(self._file.read(size))
+            else:
+                parts.append(bytes(self._memory[at:at + size]))
+        return b''.join(parts)
+
+    def write(self, data):
+        """データを書き込む（空きができるまでブロック）"""
+        view = memoryview(data)
+        while view:
+            with self._cond:
+                while (self._error is None and
+                       self._end - self._start >= self.capacity):
+                    self._cond.wait()
+                if self._error is not None:
+                    raise StreamBufferError(str(self._error))
+                size = min(
+                    len(view), self.capacity - (self._end - self._start)
+                )
+                self._store(self._end, view[:size].tobytes())
+                self._end += size
+                self._cond.notify_all()
+            view = view[size:]
+
+    def finish(self):
+        """書き込み側の終端を通知"""
+        with self._cond:
+            self._finished = True
+            self._cond.notify_all()
+
+    def fail(self, error):
+        """書き込み側・読み込み側のエラーを通知し、相手側の待機を解除"""
+        with self._cond:
+            if self._error is None:
+                self._error = error
+            self._cond.notify_all()
+
+    def read_at(self, begin, length):
+        """beginからlengthバイトを読み込む
+
+        begin より前のデータは解放する。終端に達した場合のみ短いデータを返す。
+        """
+        with self._cond:
+            if begin < self._start:
+                raise StreamBufferError(
+                    f"解放済みの位置は読み込めません: {begin} < {self._start}"
+                )
+            self._start = begin
+            self._cond.notify_all()
+            while (self._error is None and not self._finished and
+                   self._end < begin + length):
+                self._cond.wait()
+            if self._error is not None:
+                raise StreamBufferError(str(self._error))
+            size = max(0, min(length, self._end - begin))
+            return self._load(begin, size)
+
+    def close(self):
+        """保存先を解放（ディスクに退避していた場合はファイルを削除）"""
+        if self._file:
+            self._file.close()
+            self._file = None
+            os.remove(self.spill_path)
+        self._memory = None
@@ -1,19 +1,80 @@
 import requests
 import re
+import threading
+import time
+from datetime import datetime
 from config import Config
+import metrics
 
 
-class TwitchAPI:
+# Helix APIへの接続・読み込みタイムアウト（秒）
+DEFAULT_TIMEOUT = (10, 30)
+
+# /videosにidで問い合わせる際の1リクエストあたりの最大件数
+MAX_VIDEO_IDS = 100
+
+# トークンの有効期限のこの秒数前になったら事前に再取得する
+TOKEN_REFRESH_MARGIN = 300
+
+
+class AppAccessToken:
+    """アプリアクセストークン（複数チャンネルのTwitchAPIで共有できる）"""
+
     def __init__(self):
+        self.value = None
+        self.expires_at = None
+        self.lock = threading.Lock()
+
+
+class TwitchAPI:
+    def __init__(self, channel_name=None, token=None, session=None):
         self.client_id = Config.TWITCH_CLIENT_ID
         self.client_secret = Config.TWITCH_CLIENT_SECRET
-        self.channel_name = Config.TWITCH_CHANNEL_NAME
-        self.access_token = None
-        self.base_url = "https://api.twitch.tv/helix"
+        self.channel_name = channel_name or Config.TWITCH_CHANNEL_NAME
+        self.token = token or AppAccessToken()
+        self.channel_id = None
+        self.base_url = Config.TWITCH_API_BASE_URL
+        self.token_url = Config.TWITCH_AUTH_URL
+        self.timeout = DEFAULT_TIMEOUT
+
+        # Keep-Aliveで接続を使い回すためのセッション
+        self.session = session or requests.Session()
+        if session is None:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=4, pool_maxsize=8
+            )
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+
+    def for_channel(self, channel_name):
+        """同じセッション・アクセストークンを使う別チャンネル用のインスタンスを作成"""
+        return TwitchAPI(channel_name, token=self.token, session=self.session)
+
+    @property
+    def access_token(self):
+        return self.token.value
+
+    @access_token.setter
+    def access_token(self, value):
+        self.token.value = value
+
+    @property
+    def token_expires_at(self):
+        return self.token.expires_at
+
+    @token_expires_at.setter
+    def token_expires_at(self, value):
+        self.token.expires_at = value
 
     def get_access_token(self):
         """Twitch APIのアクセストークンを取得"""
-        url = "https://id.twitch.tv/oauth2/token"
+        with metrics.span('twitch.token') as s:
+            if not self._fetch_access_token():
+                s.fail()
+                return False
+        return True
+
+    def _fetch_access_token(self):
         data = {
             'client_id': self.client_id,
             'client_secret': self.client_secret,
@@ -21,10 +82,16 @@ class TwitchAPI:
         }
 
         try:
-            response = requests.post(url, data=data, timeout=30)
+            response = self.session.post(
+                self.token_url, data=data, timeout=self.timeout
+            )
             if response.status_code == 200:
                 token_data = response.json()
                 self.access_token = token_data['access_token']
+                expires_in = token_data.get('expires_in')
+                self.token_expires_at = (
+                    time.monotonic() + expires_in if expires_in else None
+                )
                 print("Twitch APIアクセストークンを取得しました")
                 return True
             else:
@@ -35,89 +102,175 @@ class TwitchAPI:
             print(f"Twitch API接続エラー: {str(e)}")
             return False
 
-    def get_channel_id(self):
-        """チャンネル名からチャンネルIDを取得"""
-        if not self.access_token:
-            if not self.get_access_token():
-                return None
+    def _ensure_access_token(self, stale_token=None):
+        """有効なアクセストークンを保持していることを保証（期限前に更新）
 
-        headers = {
-            'Client-ID': self.client_id,
-            'Authorization': f'Bearer {self.access_token}'
-        }
+        stale_tokenには失効が分かったトークンを渡す。他のスレッドが既に
+        再取得していれば、そのトークンをそのまま使う。
+        """
+        with self.token.lock:
+            if self.access_token and self.access_token != stale_token and (
+                self.token_expires_at is None or
+                time.monotonic() < self.token_expires_at - TOKEN_REFRESH_MARGIN
+            ):
+                return True
+            return self.get_access_token()
 
-        url = f"{self.base_url}/users"
-        params = {'login': self.channel_name}
+    def _helix_get(self, path, params):
+        """Helix APIにGETリクエストを送信
 
-        try:
-            response = requests.get(
-                url, headers=headers, params=params, timeout=30
-            )
-            if response.status_code == 200:
-                data = response.json()
-                if data['data']:
-                    return data['data'][0]['id']
-                else:
-                    print(f"チャンネル '{self.channel_name}' が見つかりません")
-            elif response.status_code == 401:
+        トークンが失効していた場合（401）は一度だけ再取得して再試行する。
+        接続エラー時はNoneを返す。
+        """
+        if not self._ensure_access_token():
+            return None
+
+        url = f"{self.base_url}/{path}"
+        for attempt in range(2):
+            token = self.access_token
+            headers = {
+                'Client-ID': self.client_id,
+                'Authorization': f'Bearer {token}'
+            }
+            try:
+                response = self.session.get(
+                    url, headers=headers, params=params, timeout=self.timeout
+                )
+            except requests.exceptions.RequestException as e:
+                print(f"Twitch API接続エラー: {str(e)}")
+                return None
+
+            if response.status_code == 401 and attempt == 0:
                 print(
                     "Twitch API認証エラー: トークンが無効です。再取得を試行します。"
                 )
-                self.access_token = None
-                if self.get_access_token():
-                    return self.get_channel_id()  # 再帰的に再試行
+                if not self._ensure_access_token(stale_token=token):
+                    return response
+                continue
+            return response
+
+    def get_channel_id(self):
+        """チャンネル名からチャンネルIDを取得（取得後はキャッシュ）"""
+        if self.channel_id:
+            return self.channel_id
+
+        response = self._helix_get('users', {'login': self.channel_name})
+        if response is None:
+            return None
+
+        if response.status_code == 200:
+            data = response.json()
+            if data['data']:
+                self.channel_id = data['data'][0]['id']
+                return self.channel_id
             else:
-                print(f"チャンネルID取得エラー: {response.status_code}")
-                print(f"エラー詳細: {response.text}")
-        except requests.exceptions.RequestException as e:
-            print(f"Twitch API接続エラー: {str(e)}")
+                print(f"チャンネル '{self.channel_name}' が見つかりません")
+        else:
+            print(f"チャンネルID取得エラー: {response.status_code}")
+            print(f"エラー詳細: {response.text}")
 
         return None
 
-    def get_videos(self, days_back=1):
-        """指定した日数前の配信アーカイブを取得"""
-        if not self.access_token:
-            if not self.get_access_token():
-                return []
+    def get_live_stream(self):
+        """チャンネルが配信中であれば配信情報（started_atなど）を返す
 
+        配信していない場合はNone、取得に失敗した場合はFalseを返す。
+        """
         channel_id = self.get_channel_id()
         if not channel_id:
-            print(f"チャンネル '{self.channel_name}' が見つかりません")
-            return []
+            return False
 
-        headers = {
-            'Client-ID': self.client_id,
-            'Authorization': f'Bearer {self.access_token}'
-        }
+        response = self._helix_get('streams', {'user_id': channel_id})
+        if response is None:
+            return False
+        if response.status_code != 200:
+            print(f"配信状態の取得に失敗: {response.status_code}")
+            return False
+
+        data = response.json()['data']
+        return data[0] if data else None
+
+    def get_videos(self, since=None, until=None, max_pages=None):
+        """配信アーカイブを新しい順にページングしながら取得
+
+        Helixの pagination.cursor を辿り、created_at が since より古い
+        アーカイブに到達した時点で打ち切る。since/until はタイムゾーン付きの
+        datetime（Noneの場合は制限なし）。
+        """
+        videos, _ = self.list_videos(since, until, max_pages)
+        return videos
+
+    def list_videos(self, since=None, until=None, max_pages=None):
+        """get_videosと同じ条件で取得し、(動画のリスト, 取得しきれたか) を返す
+
+        途中のページの取得に失敗した場合やmax_pagesで打ち切った場合は、
+        それまでに取得した動画とFalseを返す。
+        """
+        with metrics.span('twitch.list') as s:
+            videos, complete = self._list_videos(since, until, max_pages, s)
+            s.set(videos=len(videos), complete=complete)
+        return videos, complete
+
+    def _list_videos(self, since, until, max_pages, span):
+        channel_id = self.get_channel_id()
+        if not channel_id:
+            print(f"チャンネル '{self.channel_name}' が見つかりません")
+            span.fail()
+            return [], False
 
-        url = f"{self.base_url}/videos"
         params = {
             'user_id': channel_id,
             'type': 'archive',
             'first': 100  # Twitch APIの最大値
         }
 
-        try:
-            response = requests.get(
-                url, headers=headers, params=params, timeout=30
-            )
-            if response.status_code == 200:
-                videos = response.json()['data']
-                return videos
-            elif response.status_code == 401:
-                print(
-                    "Twitch API認証エラー: トークンが無効です。再取得を試行します。"
-                )
-                self.access_token = None
-                if self.get_access_token():
-                    return self.get_videos(days_back)  # 再帰的に再試行
-            else:
+        # 動画IDをキーにして重複を除外
+        videos_by_id = {}
+        pages = 0
+        complete = False
+        while True:
+            response = self._helix_get('videos', params)
+            if response is None:
+                span.fail()
+                break
+            if response.status_code != 200:
+                span.fail(status=response.status_code)
                 print(f"動画の取得に失敗: {response.status_code}")
                 print(f"エラー詳細: {response.text}")
-        except requests.exceptions.RequestException as e:
-            print(f"Twitch API接続エラー: {str(e)}")
+                break
+
+            body = response.json()
+            pages += 1
+            span.set(pages=pages)
+            reached_start = False
+            for video in body['data']:
+                created_at = self.parse_created_at(video['created_at'])
+                if since and created_at < since:
+                    # 新しい順に並んでいるので、以降はすべて範囲外
+                    reached_start = True
+                    break
+                if until and created_at > until:
+                    continue
+                videos_by_id[video['id']] = video
 
-        return []
+            cursor = body.get('pagination', {}).get('cursor')
+            if reached_start or not cursor or not body['data']:
+                complete = True
+                break
+            if max_pages and pages >= max_pages:
+                break
+            params['after'] = cursor
+
+        videos = sorted(
+            videos_by_id.values(),
+            key=lambda v: v['created_at'],
+            reverse=True
+        )
+        return videos, complete
+
+    def parse_created_at(self, created_at_str):
+        """Twitchのcreated_at文字列（UTC）をdatetimeに変換"""
+        return datetime.fromisoformat(created_at_str.replace('Z', '+00:00'))
 
     def parse_twitch_duration(self, duration_str):
         """Twitchのduration文字列（例: '2h21m23s'）を秒に変換"""
@@ -130,24 +283,39 @@ class TwitchAPI:
         seconds = int(match.group('seconds') or 0)
         return hours * 3600 + minutes * 60 + seconds
 
-    def get_video_url(self, video_id):
-        """動画のダウンロードURLを取得"""
-        if not self.access_token:
-            if not self.get_access_token():
-                return None
+    def get_videos_by_id(self, video_ids):
+        """動画IDから最新の動画情報を取得（最大100件ずつまとめて問い合わせる）
 
-        headers = {
-            'Client-ID': self.client_id,
-            'Authorization': f'Bearer {self.access_token}'
-        }
-
-        url = f"{self.base_url}/videos"
-        params = {'id': video_id}
-
-        response = requests.get(url, headers=headers, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            if data['data']:
-                return data['data'][0]['url']
+        見つかった動画を動画IDをキーにした辞書で返す。Twitchから削除された
+        動画は含まれない。取得に失敗した場合はNoneを返す。
+        """
+        video_ids = list(video_ids)
+        with metrics.span('twitch.lookup', videos=len(video_ids)) as s:
+            videos = {}
+            for i in range(0, len(video_ids), MAX_VIDEO_IDS):
+                batch = video_ids[i:i + MAX_VIDEO_IDS]
+                response = self._helix_get(
+                    'videos', [('id', video_id) for video_id in batch]
+                )
+                if response is None:
+                    s.fail()
+                    return None
+                # 指定したIDがすべて見つからない場合は404が返される
+                if response.status_code == 404:
+                    continue
+                if response.status_code != 200:
+                    s.fail(status=response.status_code)
+                    print(f"動画情報の取得に失敗: {response.status_code}")
+                    print(f"エラー詳細: {response.text}")
+                    return None
+                for video in response.json()['data']:
+                    videos[video['id']] = video
+            s.set(found=len(videos))
+        return videos
 
+    def get_video_url(self, video_id):
+        """動画のダウンロードURLを取得"""
+        videos = self.get_videos_by_id([video_id])
+        if videos and video_id in videos:
+            return videos[video_id]['url']
         return None
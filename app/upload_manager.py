@@ -1,23 +1,238 @@
 import os
-from datetime import datetime
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 import pytz
 from twitch_api import TwitchAPI
-from youtube_api import YouTubeAPI
-from video_downloader import VideoDownloader
+from youtube_api import YouTubeAPI, TITLE_MAX_LENGTH
+from video_downloader import VideoDownloader, DURATION_TOLERANCE
+from video_splitter import VideoSplitter
+from staging_area import StagingArea
+from vod_catalog import (
+    VODCatalog, PENDING_STATES, STATE_LISTED, STATE_DOWNLOADING,
+    STATE_DOWNLOADED, STATE_VERIFIED, STATE_UPLOADING, STATE_UPLOADED,
+    STATE_CLEANED, STATE_SKIPPED
+)
+from job_lease import LeaseStore, LEASE_CLAIMED, LEASE_DONE
+from pipeline import UploadPipeline
+from stream_buffer import StreamBuffer, StreamBufferError
+from channels import ChannelConfig
 from config import Config
+import metrics
+from prometheus_exporter import TextfileExporter
+
+
+# 配信中のアーカイブとみなす範囲（配信開始時刻のこの時間前以降に作成されたもの）
+LIVE_ARCHIVE_MARGIN = timedelta(minutes=10)
 
 
 class UploadManager:
-    def __init__(self):
-        self.twitch_api = TwitchAPI()
-        self.youtube_api = YouTubeAPI()
-        self.downloader = VideoDownloader()
+    def __init__(self, channel=None, twitch_api=None, downloader=None,
+                 catalog=None, quota=None, leases=None, staging=None):
+        """channelを省略した場合は.envの単一チャンネル設定を使う
+
+        複数チャンネルで共有するTwitchAPI・VideoDownloader・VODCatalog・
+        QuotaLedger・LeaseStore・StagingAreaは引数で渡せる。
+        """
+        self.channel = channel or ChannelConfig.from_config()
+        self.twitch_api = twitch_api or TwitchAPI(self.channel.name)
+        self.youtube_api = YouTubeAPI(
+            token_path=self.channel.youtube_token_path,
+            privacy_status=self.channel.privacy_status,
+            quota=quota
+        )
+        # 同時にアップロードするスレッドに貸し出すクライアント（必要な数だけ
+        # copy()で作成する。youtube_apiはダウンロード側のスレッドでも照合に
+        # 使うため貸し出さない）
+        self._idle_clients = queue.LifoQueue()
+        self.downloader = downloader or VideoDownloader()
+        self.splitter = VideoSplitter(self.downloader.max_video_length)
+        self.catalog = catalog or VODCatalog()
+        # 複数ホストで分担する場合のみ使用（LEASE_DB_PATH未設定ならNone）
+        self.leases = leases or LeaseStore.from_config()
+        self.staging = staging or StagingArea(
+            self.downloader.download_dir, self.catalog, leases=self.leases,
+            file_prefixes=[self.channel.file_prefix]
+        )
 
     def process_single_video(self, video):
-        """単一の動画を処理"""
+        """単一の動画を処理（videoはカタログの行）"""
+        job = self.download_single_video(video)
+        if not job:
+            return
+
+        # YouTubeにアップロード
+        self.upload_downloaded_video(job)
+
+    def upload_downloaded_video(self, job):
+        """download_single_videoが返した動画をYouTubeにアップロード"""
+        try:
+            if self.leases and not self.leases.owns(job['video_id']):
+                print(
+                    f"処理権が他のワーカーに移ったため、アップロードを中止します: "
+                    f"{job['title']}"
+                )
+                return
+            # ダウンロード中にクォータを使い切った場合は、ファイルを残して延期
+            uploads = self._new_upload_sessions(
+                job.get('file_path'), job.get('parts')
+            )
+            if not self.youtube_api.quota.can_afford('videos.insert', uploads):
+                print(
+                    f"YouTube APIのクォータが不足しているため、"
+                    f"アップロードを延期します: {job['title']}"
+                )
+                metrics.count('vods_deferred')
+                return
+            if job.get('parts'):
+                self._upload_parts(job)
+            else:
+                self._upload_single_video(
+                    job['video_id'], job['file_path'], job['title'],
+                    job['date_str'], job['created_at_jst'],
+                    job['reservation']
+                )
+        finally:
+            # アップロードしなかった分の予約を解除する
+            job['reservation'].release()
+            self.staging.release(job['video_id'])
+            self._release_lease(job['video_id'])
+
+    def _claim(self, video):
+        """他のワーカー（ホスト）と重複しないよう、動画の処理権を取得"""
+        if not self.leases:
+            return True
+        status = self.leases.claim(video['id'])
+        if status == LEASE_CLAIMED:
+            return True
+        if status == LEASE_DONE:
+            self._record_completed_elsewhere(video)
+        else:
+            print(f"他のワーカーが処理中のためスキップします: {video['title']}")
+        return False
+
+    def _release_lease(self, video_id):
+        """カタログの処理状態に応じて、処理権を完了または未完了として手放す"""
+        if not self.leases:
+            return
+        video = self.catalog.get_video(video_id)
+        if video['state'] in (STATE_UPLOADED, STATE_CLEANED, STATE_SKIPPED):
+            self.leases.release(
+                video_id, done=True, youtube_id=video['youtube_id'],
+                skip_reason=video['skip_reason']
+            )
+        else:
+            self.leases.release(video_id)
+
+    def _record_completed_elsewhere(self, video):
+        """他のワーカーが処理を完了した動画をこのホストのカタログにも反映"""
+        youtube_id, skip_reason = self.leases.result(video['id'])
+        print(
+            f"他のワーカーが処理済みです: {video['title']}"
+            f"（YouTube: {youtube_id or skip_reason}）"
+        )
+        # このホストに残っている途中のファイルは不要
+        file_path = video.get('file_path')
+        if file_path and os.path.exists(file_path):
+            self._remove_file(file_path)
+        if youtube_id:
+            self.catalog.mark_uploaded(video['id'], youtube_id)
+            self.catalog.mark_cleaned(video['id'])
+        else:
+            self.catalog.mark_skipped(video['id'], skip_reason)
+
+    def _check_existing_upload(self, video):
+        """YouTubeにアップロード済みの動画であれば、カタログに反映してTrueを返す
+
+        カタログを失った場合や別の環境でアップロードした場合に、
+        同じ動画を再びダウンロード・アップロードしないようにする。
+        """
+        youtube_id = self.youtube_api.find_uploaded_video(video['id'])
+        if not youtube_id:
+            return False
+
+        print(
+            f"YouTubeにアップロード済みのためスキップします: {video['title']}"
+            f"（YouTube: {youtube_id}）"
+        )
+        file_path = video.get('file_path')
+        if file_path and os.path.exists(file_path):
+            self._remove_file(file_path)
+        self.catalog.mark_uploaded(video['id'], youtube_id)
+        self.catalog.mark_cleaned(video['id'])
+        metrics.count('vods_skipped')
+        self._release_lease(video['id'])
+        return True
+
+    def _can_split(self):
+        """長すぎる動画を分割してアップロードできるか"""
+        if not Config.SPLIT_LONG_VIDEOS:
+            return False
+        if not self.splitter.available():
+            print("ffmpegが見つからないため、長すぎる動画を分割できません")
+            return False
+        return True
+
+    def _planned_uploads(self, video):
+        """動画のアップロード回数（分割する場合はパート数）
+
+        分割済みの場合や中断したアップロードがある場合は、新しく作成する
+        アップロードセッションの数（_new_upload_sessions）を返す。
+        """
+        parts = self.catalog.get_parts(video['id'])
+        if (not parts and
+                video['duration'] > self.downloader.max_video_length and
+                Config.SPLIT_LONG_VIDEOS):
+            return self.splitter.plan(video['duration'])[0]
+        return self._new_upload_sessions(video.get('file_path'), parts)
+
+    def _new_upload_sessions(self, file_path, parts):
+        """新しく作成するアップロードセッションの数
+
+        videos.insertのクォータはセッションの作成時に消費されるため、
+        アップロード済みのパートと、保存したセッションから再開できる
+        ファイルは数えない。
+        """
+        if parts:
+            return len([
+                part for part in parts
+                if not part['youtube_id'] and
+                not self.youtube_api.has_resumable_upload(part['file_path'])
+            ])
+        return 0 if self.youtube_api.has_resumable_upload(file_path) else 1
+
+    def _reserve_quota(self, video):
+        """アップロードに必要なYouTube APIのクォータを予約（QuotaReservationを返す）
+
+        残量が足りない場合は、ダウンロードせずに次のクォータ期間まで延期して
+        Noneを返す（カタログの状態は変えないため、次回の実行・確認時に再び
+        対象になる）。
+        """
+        quota = self.youtube_api.quota
+        reservation = quota.reserve(
+            'videos.insert', self._planned_uploads(video)
+        )
+        if reservation:
+            return reservation
+        print(
+            f"YouTube APIのクォータが不足しているため延期します: {video['title']}"
+            f"（残り {quota.remaining()}ユニット、"
+            f"{quota.format_reset()}にリセット）"
+        )
+        metrics.count('vods_deferred')
+        return None
+
+    def _prepare_job(self, video, allow_split=True):
+        """動画の処理前チェックを行い、処理に必要な情報を返す
+
+        スキップ・失敗した場合はNoneを返す。allow_split=Falseの場合
+        （ストリーミング処理など）、長すぎる動画は分割せずにスキップする。
+        """
         video_id = video['id']
         title = video['title']
-        duration = self.twitch_api.parse_twitch_duration(video['duration'])
+        duration = video['duration']
 
         # Twitch APIから返される時間はUTCなので、日本時間に変換
         jst = pytz.timezone('Asia/Tokyo')
@@ -31,115 +246,531 @@ class UploadManager:
         print(f"長さ: {self.downloader.format_duration(duration)}")
         print(f"作成日時（JST）: {created_at_jst}")
 
-        # 動画が長すぎる場合の処理
+        # 動画が長すぎる場合の処理（分割できる場合はダウンロード後に分割）
         if duration > self.downloader.max_video_length:
-            print(
-                f"動画が長すぎます（{self.downloader.format_duration(duration)}）。"
-                "スキップします。"
-            )
-            return
+            if allow_split and self._can_split():
+                print(
+                    f"動画が長すぎるため"
+                    f"（{self.downloader.format_duration(duration)}）、"
+                    f"{self.splitter.plan(duration)[0]}個のパートに分割して"
+                    "アップロードします"
+                )
+            else:
+                print(
+                    f"動画が長すぎます"
+                    f"（{self.downloader.format_duration(duration)}）。"
+                    "スキップします。"
+                )
+                self.catalog.mark_skipped(video_id, 'too_long')
+                metrics.count('vods_skipped')
+                return None
 
-        # 動画URLを取得
-        video_url = self.twitch_api.get_video_url(video_id)
+        # 動画URLは一覧取得・再取得時にカタログに記録されている
+        video_url = video['url']
         if not video_url:
             print("動画URLの取得に失敗しました。")
-            return
+            metrics.count('vods_failed')
+            return None
 
         # ファイル名を生成（日本時間の日付を使用）
         date_str = created_at_jst.strftime("%Y%m%d")
         safe_title = "".join(
             c for c in title if c.isalnum() or c in (' ', '-', '_')
         ).rstrip()
-        filename = f"{date_str}_{safe_title[:50]}.mp4"
+        filename = f"{self.channel.file_prefix}{date_str}_{safe_title[:50]}.mp4"
+
+        return {
+            'video_id': video_id,
+            'title': title,
+            'video_url': video_url,
+            'duration': duration,
+            'filename': filename,
+            'date_str': date_str,
+            'created_at_jst': created_at_jst,
+        }
+
+    def download_single_video(self, video):
+        """単一の動画をダウンロードし、アップロード用の情報を返す
+
+        カタログに記録された処理状態から再開する（ダウンロード済みのファイルは
+        再利用し、アップロード済みのものはファイルの削除のみ行う）。
+        スキップ・失敗・延期した場合はNoneを返す。
+        """
+        if video['state'] == STATE_UPLOADED:
+            self._finish_uploaded(video)
+            return None
+
+        if not self._claim(video):
+            return None
+        if self._check_existing_upload(video):
+            return None
+        # スキップする動画のためにクォータを予約しない（延期扱いにしない）
+        job = self._prepare_job(video)
+        reservation = job and self._reserve_quota(video)
+        if not reservation:
+            self._release_lease(video['id'])
+            return None
+        result = None
+        try:
+            if self._reserve_staging(job, video):
+                job['reservation'] = reservation
+                result = self._download_job(job, video)
+        finally:
+            if not result:
+                reservation.release()
+                self.staging.release(video['id'])
+                self._release_lease(video['id'])
+        return result
+
+    def _reserve_staging(self, job, video):
+        """ダウンロード先の容量を予約し、予約できなければ延期してFalseを返す
+
+        ダウンロード済みのファイルがあればそのサイズ、なければTwitchの
+        長さとビットレートから見積もったサイズを予約する。見積もりのために
+        取得したHLSフォーマットはjob['hls_format']に入れ、ダウンロードで使う。
+        """
+        file_path = video.get('file_path')
+        if (video['state'] in (STATE_DOWNLOADED, STATE_VERIFIED,
+                               STATE_UPLOADING) and
+                file_path and os.path.exists(file_path)):
+            size = os.path.getsize(file_path)
+        else:
+            job['hls_format'] = self.downloader.find_hls_format(
+                job['video_url']
+            )
+            size = self.downloader.estimate_size(
+                job['video_url'], job['duration'], job['hls_format']
+            )
+        if job['duration'] > self.downloader.max_video_length:
+            # 分割中は元のファイルとパートが同時に存在する
+            size *= 2
+        if self.staging.reserve(job['video_id'], size):
+            return True
+        print(
+            f"ダウンロード先の容量が不足しているため延期します: {job['title']}"
+        )
+        metrics.count('vods_deferred')
+        return False
+
+    def _download_job(self, job, video):
+        video_id = job['video_id']
+        file_path = video.get('file_path')
+        result = None
+
+        parts = self.catalog.get_parts(video_id)
+        if parts and video['state'] in (STATE_VERIFIED, STATE_UPLOADING):
+            if all(
+                part['youtube_id'] or os.path.exists(part['file_path'] or '')
+                for part in parts
+            ):
+                print(f"分割済みのパートから再開します（{len(parts)}パート）")
+                job['file_path'] = file_path
+                job['parts'] = parts
+                return job
+            print("分割したパートのファイルが見つからないため、分割し直します")
+
+        if (video['state'] in (STATE_DOWNLOADED, STATE_VERIFIED,
+                               STATE_UPLOADING) and
+                file_path and os.path.exists(file_path)):
+            print(f"ダウンロード済みのファイルから再開します: {file_path}")
+        else:
+            # 動画をダウンロード（開始・完了をそれぞれカタログに記録）
+            self.catalog.mark_downloading(
+                video_id,
+                os.path.join(self.downloader.download_dir, job['filename'])
+            )
+            result = self.downloader.download_video(
+                job['video_url'], job['filename'],
+                expected_duration=job['duration'],
+                hls_format=job.get('hls_format')
+            )
+            if result and not result.verified:
+                self._hold_download(job)
+                return None
+            if not result:
+                print("動画のダウンロードに失敗しました。")
+                metrics.count('vods_failed')
+                return None
+            file_path = result.file_path
+            self.catalog.mark_downloaded(video_id, file_path)
+        job['file_path'] = file_path
+
+        # 確認済みのファイルを再利用する場合は長さの確認を省略
+        if result is None and video['state'] in (STATE_VERIFIED,
+                                                 STATE_UPLOADING):
+            pass
+        elif self._verify_download(job, result):
+            self.catalog.mark_verified(video_id)
+        else:
+            return None
 
-        # 動画をダウンロード
-        file_path = self.downloader.download_video(video_url, filename)
-        if not file_path:
-            print("動画のダウンロードに失敗しました。")
+        if job['duration'] > self.downloader.max_video_length:
+            return self._split_job(job)
+        return job
+
+    def _hold_download(self, job):
+        """長さを確認できないダウンロードを保留する
+
+        DOWNLOAD_MAX_UNVERIFIED回続けて確認できなかった動画は、一時ファイルを
+        削除してスキップする（毎回ダウンロードし直さないようにする）。
+        """
+        video_id = job['video_id']
+        count = self.catalog.record_unverified_download(video_id)
+        limit = Config.DOWNLOAD_MAX_UNVERIFIED
+        if not limit or count < limit:
+            print(f"保留中（{count}回目）: {job['title']}")
+            metrics.count('vods_failed')
             return
+        print(
+            f"ダウンロードした動画の長さを{count}回確認できなかったため、"
+            f"スキップします: {job['title']}"
+        )
+        self.downloader.discard_incomplete(
+            os.path.join(self.downloader.download_dir, job['filename'])
+        )
+        self.catalog.mark_skipped(video_id, 'unverified')
+        metrics.count('vods_skipped')
+
+    def _split_job(self, job):
+        """長すぎる動画をパートに分割してカタログに記録し、元のファイルを削除"""
+        video_id = job['video_id']
+        parts = self.splitter.split(job['file_path'], job['duration'])
+        if not parts:
+            print("動画の分割に失敗しました。")
+            metrics.count('vods_failed')
+            return None
+
+        self.catalog.set_parts(video_id, parts)
+        job['parts'] = self.catalog.get_parts(video_id)
+        # 以前にアップロード済みのパートはファイルが不要
+        kept = {part['file_path'] for part in job['parts']}
+        for file_path, _ in parts:
+            if file_path not in kept:
+                self._remove_file(file_path)
+        # 分割後は元のファイルは不要（ディスク容量を空ける）
+        self._remove_file(job['file_path'])
+        print(f"{len(parts)}個のパートに分割しました")
+        return job
+
+    def _verify_download(self, job, result):
+        """ダウンロードした動画の長さを確認
+
+        長すぎる場合、分割できれば分割の対象とし、できなければ削除して
+        スキップする。
+        """
+        file_path = job['file_path']
 
-        # 動画の長さを確認
-        actual_duration = self.downloader.get_video_duration(file_path)
+        # Twitchとダウンロード時の長さが食い違う場合（または再開したため
+        # ダウンロード時の長さが分からない場合）のみファイルを解析する
+        actual_duration = result.duration if result else None
+        if (actual_duration is None or
+                abs(actual_duration - job['duration']) > DURATION_TOLERANCE):
+            actual_duration = self.downloader.get_video_duration(file_path)
+        if actual_duration:
+            # 分割する場合はダウンロードした動画の長さを基準にする
+            job['duration'] = actual_duration
         if actual_duration and actual_duration > self.downloader.max_video_length:
+            if self._can_split():
+                return True
             print(
                 f"ダウンロードした動画が長すぎます"
                 f"（{self.downloader.format_duration(actual_duration)}）。"
                 "削除します。"
             )
-            os.remove(file_path)
-            return
+            self._remove_file(file_path)
+            self.catalog.mark_skipped(job['video_id'], 'too_long')
+            metrics.count('vods_skipped')
+            return False
+        return True
 
-        # YouTubeにアップロード
-        self._upload_single_video(file_path, title, date_str, created_at_jst)
+    def _finish_uploaded(self, video):
+        """アップロード後、ファイルの削除前に中断した動画の後始末"""
+        file_path = video.get('file_path')
+        print(
+            f"\nアップロード済みの動画の後始末を行います: {video['title']} "
+            f"(YouTube: {video['youtube_id']})"
+        )
+        if file_path and os.path.exists(file_path):
+            self._remove_file(file_path)
+            print(f"ローカルファイルを削除: {file_path}")
+        for part in self.catalog.get_parts(video['id']):
+            if part['file_path'] and os.path.exists(part['file_path']):
+                self._remove_file(part['file_path'])
+        self.catalog.mark_cleaned(video['id'])
+        self._release_lease(video['id'])
 
-    def _upload_single_video(self, file_path, title, date_str, created_at_jst):
-        """単一の動画をYouTubeにアップロード"""
-        # TwitchチャンネルURLを含む説明文を作成
-        twitch_url = Config.TWITCH_CHANNEL_URL
-        author_name = Config.AUTHOR_NAME
-        date_str = created_at_jst.strftime('%Y年%m月%d日')
-        description = (
-            f"Twitch配信アーカイブ\n\n配信日（JST）: {date_str}\n\n"
-            f"Twitchチャンネル: {twitch_url}\n\n#Twitch #配信アーカイブ"
+    def stream_single_video(self, video):
+        """単一の動画をローカルに保存せず、ダウンロードしながらアップロード"""
+        if not self._claim(video):
+            return
+        if self._check_existing_upload(video):
+            return
+        job = self._prepare_job(video, allow_split=False)
+        reservation = job and self._reserve_quota(video)
+        if not reservation:
+            self._release_lease(video['id'])
+            return
+        try:
+            self._stream_job(job, reservation)
+        finally:
+            reservation.release()
+            self._release_lease(video['id'])
+
+    def _stream_job(self, job, reservation):
+        buffer = StreamBuffer(
+            Config.STREAM_BUFFER_MB * 1024 * 1024,
+            spill_path=(
+                os.path.join(
+                    self.downloader.download_dir,
+                    f".stream_{job['video_id']}.buf"
+                )
+                if Config.STREAM_SPILL_TO_DISK else None
+            )
+        )
+        downloader = threading.Thread(
+            target=self.downloader.stream_video,
+            args=(job['video_url'], buffer),
+            name='stream-download'
         )
+        downloader.start()
+        try:
+            description, tags = self._build_metadata(
+                job['created_at_jst'], job['title'], job['video_id']
+            )
+            self.catalog.mark_uploading(job['video_id'])
+            video_id = self.youtube_api.upload_stream(
+                buffer=buffer,
+                title=job['title'],
+                description=description,
+                tags=tags,
+                category_id=self.channel.category_id,
+                reservation=reservation
+            )
+        finally:
+            # アップロードが失敗した場合もダウンロード側を止める
+            buffer.fail(StreamBufferError("アップロードが終了しました"))
+            downloader.join()
+            buffer.close()
 
-        # タグに作者名を追加
-        tags = ['Twitch', '配信アーカイブ', 'ライブ配信']
-        if author_name:
-            tags.append(author_name)
+        if video_id:
+            print(f"YouTubeアップロード成功: {video_id}")
+            self.catalog.mark_uploaded(job['video_id'], video_id)
+            self.youtube_api.add_uploaded_video(job['video_id'], video_id)
+            # ローカルにファイルを保存していないため、そのまま完了とする
+            self.catalog.mark_cleaned(job['video_id'])
+            metrics.count('vods_processed')
+        else:
+            print("YouTubeアップロードに失敗しました。")
+            metrics.count('vods_failed')
+
+    def _build_metadata(self, created_at_jst, title='', video_id=None,
+                        part=None, parts=None):
+        """YouTubeにアップロードする動画の説明文とタグを作成"""
+        return self.channel.build_metadata(
+            created_at_jst, title, video_id, part, parts
+        )
 
-        video_id = self.youtube_api.upload_video(
-            file_path=file_path,
-            title=title,
-            description=description,
-            tags=tags
+    def _upload_single_video(self, twitch_video_id, file_path, title,
+                             date_str, created_at_jst, reservation=None):
+        """単一の動画をYouTubeにアップロード"""
+        description, tags = self._build_metadata(
+            created_at_jst, title, twitch_video_id
         )
 
+        self.catalog.mark_uploading(twitch_video_id)
+        with self._youtube_client() as client:
+            video_id = client.upload_video(
+                file_path=file_path,
+                title=title,
+                description=description,
+                tags=tags,
+                category_id=self.channel.category_id,
+                reservation=reservation
+            )
+
         if video_id:
             print(f"YouTubeアップロード成功: {video_id}")
+            self.catalog.mark_uploaded(twitch_video_id, video_id)
+            self.youtube_api.add_uploaded_video(twitch_video_id, video_id)
+            metrics.count('vods_processed')
 
             # アップロード成功後、ローカルファイルを削除
-            os.remove(file_path)
+            self._remove_file(file_path)
+            self.catalog.mark_cleaned(twitch_video_id)
             print(f"ローカルファイルを削除: {file_path}")
         else:
             print("YouTubeアップロードに失敗しました。")
+            metrics.count('vods_failed')
+
+    @contextmanager
+    def _youtube_client(self):
+        """アップロードに使うYouTubeクライアントを借りる
+
+        YouTube APIのクライアントはスレッドセーフではないため、同時に
+        アップロードするスレッドにはそれぞれ別のクライアントを貸し出す。
+        空いているクライアントがなければ、youtube_apiと同じ認証情報で
+        新しく作成する。
+        """
+        try:
+            client = self._idle_clients.get_nowait()
+        except queue.Empty:
+            client = self.youtube_api.copy()
+        try:
+            yield client
+        finally:
+            self._idle_clients.put(client)
+
+    def _upload_parts(self, job):
+        """分割した動画の未アップロードのパートを並行してアップロード
+
+        パートごとにアップロード結果をカタログに記録するため、失敗した
+        パートのみ次回の実行で再試行される。
+        """
+        video_id = job['video_id']
+        total = len(job['parts'])
+        pending = [part for part in job['parts'] if not part['youtube_id']]
+        self.catalog.mark_uploading(video_id)
+
+        workers = max(min(Config.SPLIT_UPLOAD_WORKERS, len(pending)), 1)
+        fields = metrics.current_context()
+
+        def upload(part):
+            with metrics.context(**fields), self._youtube_client() as client:
+                return self._upload_part(job, part, total, client)
+
+        with ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='part-upload'
+        ) as executor:
+            list(executor.map(upload, pending))
+
+        parts = self.catalog.get_parts(video_id)
+        failed = [part for part in parts if not part['youtube_id']]
+        if failed:
+            print(
+                f"{len(failed)}/{total}個のパートのアップロードに失敗しました。"
+                "次回の実行で失敗したパートのみ再試行します"
+            )
+            metrics.count('vods_failed')
+            return
+
+        youtube_ids = ','.join(part['youtube_id'] for part in parts)
+        print(f"YouTubeアップロード成功: {youtube_ids}")
+        self.catalog.mark_uploaded(video_id, youtube_ids)
+        metrics.count('vods_processed')
+        file_path = job.get('file_path')
+        if file_path and os.path.exists(file_path):
+            self._remove_file(file_path)
+        self.catalog.mark_cleaned(video_id)
+
+    def _upload_part(self, job, part, total, client):
+        """分割した動画の1パートをアップロードし、成功したらファイルを削除"""
+        video_id = job['video_id']
+        number = part['part']
+        youtube_id = self.youtube_api.find_uploaded_part(
+            video_id, number, total
+        )
+        if youtube_id:
+            print(f"パート{number}/{total}はアップロード済みです: {youtube_id}")
+        else:
+            suffix = f" (Part {number}/{total})"
+            description, tags = self._build_metadata(
+                job['created_at_jst'], job['title'], video_id, number, total
+            )
+            youtube_id = client.upload_video(
+                file_path=part['file_path'],
+                title=job['title'][:TITLE_MAX_LENGTH - len(suffix)] + suffix,
+                description=description,
+                tags=tags,
+                category_id=self.channel.category_id,
+                reservation=job['reservation']
+            )
+            if not youtube_id:
+                print(f"パート{number}/{total}のアップロードに失敗しました")
+                return None
+            self.youtube_api.add_uploaded_video(
+                video_id, youtube_id, number, total
+            )
+
+        self.catalog.mark_part_uploaded(video_id, number, youtube_id)
+        if part['file_path'] and os.path.exists(part['file_path']):
+            self._remove_file(part['file_path'])
+        return youtube_id
+
+    def _remove_file(self, file_path):
+        """ダウンロードしたファイルを削除"""
+        with metrics.span('cleanup', file=os.path.basename(file_path)) as s:
+            s.bytes = os.path.getsize(file_path)
+            os.remove(file_path)
 
     def _get_videos_in_date_range(self, start_date, end_date):
         """指定した日時範囲の動画を取得"""
-        jst = pytz.timezone('Asia/Tokyo')
-        
-        # すべての動画を取得してソート
-        all_raw_videos = []
-        for days_back in range(1, 31):  # 最大30日間
-            videos = self.twitch_api.get_videos(days_back=days_back)
-            if videos:
-                for video in videos:
-                    # 重複チェック
-                    if not any(v['id'] == video['id'] for v in all_raw_videos):
-                        all_raw_videos.append(video)
-        
-        # 作成日時でソート（新しい順）
-        all_raw_videos.sort(key=lambda x: x['created_at'], reverse=True)
-        
-        # 指定された日付範囲内の動画のみを抽出
-        all_videos = []
-        for video in all_raw_videos:
-            created_at_utc = datetime.fromisoformat(
-                video['created_at'].replace('Z', '+00:00')
+        # 新しいアーカイブのみカタログに同期してから、カタログを日時範囲で検索
+        self.catalog.sync(self.twitch_api)
+        videos = self.catalog.get_videos_in_range(
+            start_date, end_date, states=PENDING_STATES,
+            channel=self.twitch_api.channel_name
+        )
+        return self._refresh_videos(videos)
+
+    def _refresh_videos(self, videos):
+        """ダウンロード前の動画のうち、一覧取得から時間が経ったものの情報を再取得
+
+        延期などで一覧取得から時間が経った動画は、URL・長さが変わったり
+        Twitchから削除されたりしている場合があるため、まとめて1回の
+        問い合わせで再取得する。削除された動画はスキップとして記録する。
+        """
+        threshold = datetime.now(timezone.utc) - timedelta(
+            minutes=Config.VOD_REFRESH_MINUTES
+        )
+        stale_ids = [
+            video['id'] for video in videos
+            if video['state'] in (STATE_LISTED, STATE_DOWNLOADING) and (
+                not video['url'] or
+                self.twitch_api.parse_created_at(video['updated_at'])
+                < threshold
+            )
+        ]
+        if not stale_ids:
+            return videos
+
+        deleted_ids = self.catalog.refresh(self.twitch_api, stale_ids)
+        if deleted_ids is None:
+            print("動画情報の再取得に失敗しました。カタログの情報で処理します")
+            return videos
+
+        print(f"{len(stale_ids)}件の動画情報を再取得しました")
+        for video_id in deleted_ids:
+            print(f"Twitchから削除された動画のためスキップします: {video_id}")
+            self.catalog.mark_skipped(video_id, 'deleted')
+            metrics.count('vods_skipped')
+        return [
+            self.catalog.get_video(video['id']) for video in videos
+            if video['id'] not in deleted_ids
+        ]
+
+    def run_manual_upload(self, start_datetime, end_datetime, pipeline=False,
+                          stream=False):
+        """指定した日時範囲の動画をアップロード処理を実行
+
+        pipeline=Trueの場合、次の動画のダウンロードを前の動画の
+        アップロードと並行して行う。stream=Trueの場合、動画をローカルに
+        保存せずダウンロードしながらアップロードする。
+        """
+        exporter = TextfileExporter.from_config()
+        if exporter:
+            exporter.start()
+        try:
+            self._run_manual_upload(
+                start_datetime, end_datetime, pipeline, stream
             )
-            created_at_jst = created_at_utc.astimezone(jst)
-            
-            # 指定された日付範囲内の動画のみを追加
-            if start_date <= created_at_jst <= end_date:
-                all_videos.append(video)
-            elif created_at_jst < start_date:
-                # 開始日より古い動画に到達したら終了
-                break
-        
-        return all_videos
-
-    def run_manual_upload(self, start_datetime, end_datetime):
-        """指定した日時範囲の動画をアップロード処理を実行"""
+        finally:
+            if exporter:
+                exporter.stop()
+            metrics.recorder.print_summary()
+            metrics.recorder.print_throughput('upload')
+
+    def _run_manual_upload(self, start_datetime, end_datetime, pipeline,
+                           stream):
         print(
             f"手動アップロード処理を開始: "
             f"{start_datetime.strftime('%Y年%m月%d日 %H:%M:%S')} から "
@@ -153,14 +784,15 @@ class UploadManager:
         if not videos:
             print(
                 f"指定した期間（{start_datetime.strftime('%Y年%m月%d日 %H:%M:%S')} から "
-                f"{end_datetime.strftime('%Y年%m月%d日 %H:%M:%S')}）の配信アーカイブが"
-                "見つかりませんでした。"
+                f"{end_datetime.strftime('%Y年%m月%d日 %H:%M:%S')}）の未処理の"
+                "配信アーカイブが見つかりませんでした。"
             )
             return
 
         print(
-            f"指定した期間の配信アーカイブ {len(videos)} 件を発見"
+            f"指定した期間の未処理の配信アーカイブ {len(videos)} 件を発見"
         )
+        metrics.count('vods_discovered', len(videos))
         print("処理対象の動画一覧:")
         for i, video in enumerate(videos, 1):
             created_at_utc = datetime.fromisoformat(
@@ -172,10 +804,108 @@ class UploadManager:
                 f"{created_at_jst.strftime('%Y年%m月%d日 %H:%M:%S')}"
             )
 
+        self._process_videos(videos, pipeline, stream)
+
+    def _process_videos(self, videos, pipeline, stream):
+        """取得した動画を順に（またはパイプラインで）処理"""
+        if not stream:
+            # 処理が終わった動画の残りのファイルを削除
+            self.staging.cleanup()
+        if pipeline:
+            UploadPipeline(self).run(videos)
+            return
+
         for i, video in enumerate(videos, 1):
             print(f"\n=== {i}件目の動画を処理中 ===")
             try:
-                self.process_single_video(video)
+                if stream:
+                    self.stream_single_video(video)
+                else:
+                    self.process_single_video(video)
             except Exception as e:
                 print(f"動画処理エラー: {str(e)}")
+                metrics.count('vods_failed')
                 continue
+
+    def run_watch(self, interval=None, pipeline=False, stream=False,
+                  stop_event=None):
+        """新しい配信アーカイブを定期的に確認し、見つかり次第アップロード
+
+        APIクライアントと認証情報は起動中ずっと使い回し、確認のたびに
+        カタログの高水位標より新しいアーカイブのみをTwitchから取得する。
+        stop_eventがセットされるか、Ctrl+Cで終了する。
+        """
+        interval = interval or Config.WATCH_INTERVAL
+        stop_event = stop_event or threading.Event()
+        exporter = TextfileExporter.from_config()
+        if exporter:
+            exporter.start()
+
+        print(f"監視モードを開始: {interval}秒ごとに新しい配信アーカイブを確認します")
+        try:
+            while not stop_event.is_set():
+                try:
+                    self._watch_once(pipeline, stream)
+                except Exception as e:
+                    # 一時的なエラーで監視を止めないよう、次回の確認で再試行する
+                    print(f"監視処理エラー: {str(e)}")
+                stop_event.wait(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            print("\n監視モードを終了します")
+            if exporter:
+                exporter.stop()
+            metrics.recorder.print_summary()
+            metrics.recorder.print_throughput('upload')
+
+    def _watch_once(self, pipeline, stream):
+        """監視モードの1回分の確認・処理"""
+        videos = self.get_watch_videos()
+        if not videos:
+            return
+
+        print(f"\n未処理の配信アーカイブ {len(videos)} 件を発見")
+        metrics.count('vods_discovered', len(videos))
+        self._process_videos(videos, pipeline, stream)
+
+    def get_watch_videos(self):
+        """監視モードで処理する未処理の配信アーカイブを古い順に取得
+
+        配信中のアーカイブは録画が続いているため、配信終了後まで除外する。
+        監視を始めてから見つかったアーカイブは、延期やステージング領域からの
+        追い出しでWATCH_LOOKBACK_HOURSより古くなっても処理するまで対象にする。
+        """
+        now = datetime.now(timezone.utc)
+        since = now - timedelta(hours=Config.WATCH_LOOKBACK_HOURS)
+        watch_start = self.twitch_api.parse_created_at(
+            self.catalog.get_watch_start(self.twitch_api.channel_name, since)
+        )
+        videos = self._get_videos_in_date_range(min(since, watch_start), now)
+        if not videos:
+            return []
+
+        live = self.twitch_api.get_live_stream()
+        if live is False:
+            print("配信状態を確認できないため、次回の確認まで処理を延期します")
+            return []
+        if live:
+            started_at = self.twitch_api.parse_created_at(live['started_at'])
+            videos = [
+                video for video in videos
+                if self.twitch_api.parse_created_at(video['created_at'])
+                < started_at - LIVE_ARCHIVE_MARGIN
+            ]
+            if not videos:
+                print(
+                    f"配信中のアーカイブは配信終了後に処理します"
+                    f"（{self.twitch_api.channel_name}）"
+                )
+
+        # 前回の確認以降に別の環境でアップロードされた動画も照合できるよう、
+        # アップロード済み動画の索引は確認のたびに作り直す
+        if videos:
+            self.youtube_api.invalidate_upload_index()
+
+        # 古いものから順にアップロードする
+        return videos[::-1]
@@ -1,13 +1,333 @@
+import json
 import os
-from datetime import datetime
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+import requests
 import yt_dlp
 from config import Config
+from media_probe import probe_duration
+from rate_limiter import download_limiter
+import metrics
+
+
+# ストリーミングダウンロード時に標準出力から一度に読み込むサイズ
+STREAM_READ_SIZE = 1024 * 1024
+
+# HLSダウンロードの途中の位置を記録する間隔（秒）
+STATE_INTERVAL = 5
+
+
+class HLSDownloadError(Exception):
+    """HLSセグメントのダウンロードに失敗"""
+
+
+class HLSSegmentDownloader:
+    """HLSのメディアプレイリストのセグメントを並列にダウンロードする
+
+    セグメントは複数スレッドで同時に取得し、出力ファイルには順番通りに
+    書き込む。先読みするセグメント数はワーカー数の2倍までに制限する。
+    limiterを渡すと、取得したセグメントごとに受信速度の上限まで待つ。
+    """
+
+    def __init__(self, workers=None, retries=None, timeout=(10, 60),
+                 limiter=None):
+        self.workers = workers or Config.HLS_DOWNLOAD_WORKERS
+        self.retries = (
+            retries if retries is not None else Config.HLS_SEGMENT_RETRIES
+        )
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.workers
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.playlist_duration = None
+        self.limiter = limiter
+        self.throttled = 0.0
+        self._throttled_lock = threading.Lock()
+
+    def _get(self, url):
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def best_variant(self, playlist_url, text):
+        """マスタープレイリストから最高ビットレートのバリアントを選択
+
+        (BANDWIDTH（ビット/秒）, URL)を返す。
+        """
+        best_bandwidth = -1
+        best_url = None
+        lines = text.splitlines()
+        for i, line in enumerate(lines):
+            if not line.startswith('#EXT-X-STREAM-INF'):
+                continue
+            match = re.search(r'[:,]BANDWIDTH=(\d+)', line)
+            bandwidth = int(match.group(1)) if match else 0
+            uri = next(
+                (u.strip() for u in lines[i + 1:]
+                 if u.strip() and not u.startswith('#')),
+                None
+            )
+            if uri and bandwidth > best_bandwidth:
+                best_bandwidth = bandwidth
+                best_url = urljoin(playlist_url, uri)
+
+        if not best_url:
+            raise HLSDownloadError("バリアントプレイリストが見つかりません")
+        return best_bandwidth, best_url
+
+    def resolve_media_playlist(self, playlist_url):
+        """マスタープレイリストの場合は最高ビットレートのバリアントを選択"""
+        text = self._get(playlist_url).text
+        if '#EXT-X-STREAM-INF' not in text:
+            return playlist_url, text
+
+        _, best_url = self.best_variant(playlist_url, text)
+        return best_url, self._get(best_url).text
+
+    def variant_bandwidth(self, playlist_url):
+        """マスタープレイリストの最高ビットレート（ビット/秒、不明な場合はNone）"""
+        text = self._get(playlist_url).text
+        if '#EXT-X-STREAM-INF' not in text:
+            return None
+        return self.best_variant(playlist_url, text)[0] or None
+
+    def parse_segments(self, playlist_url, text):
+        """メディアプレイリストからセグメントURLの一覧を取得
+
+        #EXTINFの合計（プレイリスト上の長さ）はplaylist_durationに保存する。
+        """
+        segments = []
+        self.playlist_duration = 0.0
+        for line in text.splitlines():
+            line = line.strip()
+            if line.startswith('#EXTINF:'):
+                try:
+                    self.playlist_duration += float(
+                        line[len('#EXTINF:'):].split(',')[0]
+                    )
+                except ValueError:
+                    pass
+            if line.startswith('#EXT-X-KEY') and 'METHOD=NONE' not in line:
+                raise HLSDownloadError("暗号化されたHLSには対応していません")
+            if line.startswith('#EXT-X-MAP'):
+                match = re.search(r'URI="([^"]+)"', line)
+                if match:
+                    segments.append(urljoin(playlist_url, match.group(1)))
+            elif line and not line.startswith('#'):
+                segments.append(urljoin(playlist_url, line))
+        if not segments:
+            raise HLSDownloadError("セグメントが見つかりません")
+        return segments
+
+    def _fetch_segment(self, url):
+        for attempt in range(self.retries + 1):
+            try:
+                data = self._get(url).content
+            except requests.exceptions.RequestException as e:
+                if attempt >= self.retries:
+                    raise HLSDownloadError(
+                        f"セグメントの取得に失敗: {url}: {str(e)}"
+                    )
+                time.sleep(min(2 ** attempt, 30))
+                continue
+            if self.limiter:
+                waited = self.limiter.consume(len(data))
+                with self._throttled_lock:
+                    self.throttled += waited
+            return data
+
+    @staticmethod
+    def state_path(output_path):
+        """途中まで書き込んだセグメント数を記録するファイル"""
+        return output_path + '.json'
+
+    def _load_state(self, output_path, media_url, total):
+        """前回の続きから書き込める場合は(次のセグメント番号, バイト数)を返す
+
+        プレイリストが変わった場合や、ファイルが記録より短い場合は
+        最初からダウンロードし直す。
+        """
+        try:
+            with open(self.state_path(output_path), encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return 0, 0
+        if (state.get('media') != urlparse(media_url).path or
+                state.get('segments') != total or
+                not os.path.exists(output_path) or
+                os.path.getsize(output_path) < state.get('bytes', 0)):
+            return 0, 0
+        return state['next'], state['bytes']
+
+    def _save_state(self, output_path, f, media_url, total, index,
+                    bytes_written):
+        """書き込んだデータをディスクに反映してから、続きの位置を記録"""
+        f.flush()
+        os.fsync(f.fileno())
+        state_path = self.state_path(output_path)
+        with open(state_path + '.tmp', 'w', encoding='utf-8') as state:
+            json.dump({
+                'media': urlparse(media_url).path,
+                'segments': total,
+                'next': index,
+                'bytes': bytes_written,
+            }, state)
+        os.replace(state_path + '.tmp', state_path)
+
+    def download(self, playlist_url, output_path):
+        """プレイリストの全セグメントを順番通りにoutput_pathへ書き込む
+
+        書き込んだ位置をSTATE_INTERVAL秒ごとに記録し、中断した場合は
+        次回その位置から再開する。(ファイルの合計バイト数, 再開時に既に
+        書き込まれていたバイト数)を返す。完了後の記録ファイルは
+        呼び出し側で削除する。
+        """
+        media_url, text = self.resolve_media_playlist(playlist_url)
+        segments = self.parse_segments(media_url, text)
+        start_index, resumed_bytes = self._load_state(
+            output_path, media_url, len(segments)
+        )
+        if not start_index and os.path.exists(self.state_path(output_path)):
+            # 続きから再開できない古い記録
+            os.remove(self.state_path(output_path))
+        if start_index:
+            print(
+                f"HLSセグメント {start_index}/{len(segments)} 個目から"
+                f"再開します（{resumed_bytes / (1024 * 1024):.1f}MB）"
+            )
+        print(
+            f"HLSセグメント {len(segments) - start_index} 個を "
+            f"{self.workers} 並列でダウンロードします"
+        )
+
+        bytes_written = resumed_bytes
+        window = self.workers * 2
+        mode = 'r+b' if start_index else 'wb'
+        with ThreadPoolExecutor(max_workers=self.workers) as executor, \
+                open(output_path, mode) as f:
+            # 記録より後ろに書き込まれていた分は捨てる
+            f.truncate(resumed_bytes)
+            f.seek(resumed_bytes)
+            pending = deque()
+            next_index = start_index
+            written_index = start_index
+            saved_at = time.monotonic()
+            while pending or next_index < len(segments):
+                while next_index < len(segments) and len(pending) < window:
+                    pending.append(
+                        executor.submit(self._fetch_segment, segments[next_index])
+                    )
+                    next_index += 1
+                try:
+                    data = pending.popleft().result()
+                except Exception:
+                    for future in pending:
+                        future.cancel()
+                    raise
+                f.write(data)
+                bytes_written += len(data)
+                written_index += 1
+                metrics.count('bytes_downloaded', len(data))
+                if time.monotonic() - saved_at >= STATE_INTERVAL:
+                    self._save_state(
+                        output_path, f, media_url, len(segments),
+                        written_index, bytes_written
+                    )
+                    saved_at = time.monotonic()
+            self._save_state(
+                output_path, f, media_url, len(segments), written_index,
+                bytes_written
+            )
+
+        return bytes_written, resumed_bytes
+
+
+class DownloadResult:
+    """download_videoの結果
+
+    durationはダウンロード時に判明した動画の長さ（秒、不明な場合はNone）。
+    throttledは帯域制限で待った秒数、resumed_bytesは前回の続きから
+    再開した場合に既に書き込まれていたバイト数。verifiedがFalseの場合は
+    最後まで揃っていることを確認できておらず、file_pathは一時ファイル。
+    """
+
+    def __init__(self, file_path, duration=None, format_id=None,
+                 bytes_written=0, elapsed=0.0, throttled=0.0,
+                 resumed_bytes=0):
+        self.file_path = file_path
+        self.verified = True
+        self.throttled = throttled
+        self.resumed_bytes = resumed_bytes
+        self.duration = duration
+        self.format_id = format_id
+        self.bytes_written = bytes_written
+        self.elapsed = elapsed
+
+    @property
+    def throughput(self):
+        """ダウンロード速度（バイト/秒、再開前に書き込まれていた分は除く）"""
+        if not self.elapsed:
+            return 0.0
+        return (self.bytes_written - self.resumed_bytes) / self.elapsed
+
+    def summary(self):
+        mb = 1024 * 1024
+        resumed = (
+            f"（{self.resumed_bytes / mb:.1f}MBから再開）"
+            if self.resumed_bytes else ""
+        )
+        return (
+            f"{self.bytes_written / mb:.1f}MB{resumed}, {self.elapsed:.1f}秒, "
+            f"{self.throughput / mb:.1f}MB/s, フォーマット: {self.format_id}"
+        )
+
+
+# Twitchが報告する長さとダウンロード時の長さの差がこの秒数以内なら一致とみなす
+DURATION_TOLERANCE = 30
+
+
+class _ProgressCounter:
+    """yt-dlpの進捗からダウンロード済みバイト数をメトリクスに加算する
+
+    limiterを渡すと、進捗を受け取るたびに受信速度の上限まで待つ
+    （yt-dlpのダウンロードスレッドで呼ばれるため、受信自体が遅くなる）。
+    """
+
+    def __init__(self, limiter=None):
+        self.limiter = limiter
+        self.throttled = 0.0
+        self._last = {}
+
+    def __call__(self, progress):
+        downloaded = progress.get('downloaded_bytes')
+        if downloaded is None:
+            return
+        key = progress.get('tmpfilename') or progress.get('filename')
+        delta = downloaded - self._last.get(key, 0)
+        self._last[key] = downloaded
+        if delta > 0:
+            metrics.count('bytes_downloaded', delta)
+            if self.limiter:
+                self.throttled += self.limiter.consume(delta)
 
 
 class VideoDownloader:
-    def __init__(self):
+    def __init__(self, limiter=None):
         self.download_dir = Config.DOWNLOAD_DIR
         self.max_video_length = Config.MAX_VIDEO_LENGTH
+        self.hls_workers = Config.HLS_DOWNLOAD_WORKERS
+        # 全ダウンロードで共有する受信速度の上限（時間帯ごとに切り替わる）
+        self.limiter = limiter or download_limiter
 
         # ダウンロードディレクトリが存在しない場合のみ作成
         if not os.path.exists(self.download_dir):
@@ -16,61 +336,362 @@ class VideoDownloader:
         else:
             print(f"既存のダウンロードディレクトリを使用します: {self.download_dir}")
 
-    def download_video(self, url, filename):
-        """動画をダウンロード"""
+    def download_video(self, url, filename, expected_duration=None,
+                       hls_format=None):
+        """動画をダウンロードし、DownloadResultを返す（失敗時はNone）
+
+        hls_formatにresolve_hls_formatで取得済みの情報を渡すと、
+        動画ページを解析し直さずに使う。
+
+        ダウンロード中のデータは一時ファイル（.part・.dl）に書き込み、
+        中断した場合は次回その続きから再開する。最後まで揃っていることを
+        （独自のHLSダウンローダーは書き込み位置の記録、yt-dlpは動画の長さと
+        Twitchの長さ（expected_duration）の照合で）確認してから、filenameに
+        名前を変える。足りない場合はNone、確認できない場合は名前を変えずに
+        verifiedがFalseの結果を返す。
+        """
+        with metrics.span('download', filename=filename) as s:
+            result = self._download_video(
+                url, filename, expected_duration, hls_format
+            )
+            if result is None or not result.verified:
+                s.fail()
+            else:
+                s.bytes = result.bytes_written - result.resumed_bytes
+                s.set(
+                    format_id=result.format_id,
+                    media_duration=result.duration,
+                    throttled=round(result.throttled, 1),
+                    resumed_bytes=result.resumed_bytes
+                )
+        return result
+
+    def incomplete_paths(self, output_path):
+        """output_pathのダウンロード途中の一時ファイル
+
+        独自のHLSダウンローダーの.part（と書き込み位置の記録）と、
+        yt-dlpの出力先（.dl、yt-dlp自身の.part・フラグメント）。
+        """
+        part_path = output_path + '.part'
+        ytdlp_path = output_path + '.dl'
+        return part_path, ytdlp_path
+
+    def discard_incomplete(self, output_path):
+        """output_pathのダウンロード途中の一時ファイルをすべて削除"""
+        directory = os.path.dirname(output_path)
+        prefixes = tuple(
+            os.path.basename(path) for path in self.incomplete_paths(output_path)
+        )
+        for name in os.listdir(directory):
+            if name.startswith(prefixes):
+                os.remove(os.path.join(directory, name))
+
+    def _download_video(self, url, filename, expected_duration, hls_format):
         try:
-            # yt-dlpを使用して動画をダウンロード
             output_path = os.path.join(self.download_dir, filename)
 
-            # ファイルが既に存在する場合はスキップ
+            # 確認済みのファイルのみがこの名前になるため、そのまま使う
+            # （長さは呼び出し側で必要な場合のみ解析する）
             if os.path.exists(output_path):
-                file_size = os.path.getsize(output_path)
-                # ファイルサイズが1MB以上ある場合はスキップ（不完全なダウンロードを除外）
-                if file_size > 1024 * 1024:
-                    print(
-                        f"ファイルが既に存在します。スキップします: {filename} "
-                        f"({file_size / (1024*1024):.1f}MB)"
-                    )
-                    return output_path
-                else:
-                    print(f"不完全なファイルを削除します: {filename}")
-                    os.remove(output_path)
-
-            ydl_opts = {
-                'outtmpl': output_path,
-                'format': 'best',
-                'noplaylist': True,
-            }
+                print(f"確認済みのファイルを使用します: {filename}")
+                return DownloadResult(
+                    output_path,
+                    bytes_written=os.path.getsize(output_path),
+                    resumed_bytes=os.path.getsize(output_path)
+                )
 
             print(f"動画をダウンロード中: {filename}")
 
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
+            start = time.monotonic()
+            result = None
+            if self.hls_workers:
+                result = self._download_hls(url, output_path, hls_format)
+            native = result is not None
+
+            if not result:
+                result = self._download_ytdlp(url, output_path)
 
             # ファイルが実際にダウンロードされたかチェック
-            if os.path.exists(output_path):
-                print(f"ダウンロード完了: {output_path}")
-                return output_path
-            else:
+            if not os.path.exists(result.file_path):
                 print("ダウンロードされたファイルが見つかりません")
                 return None
+            result.bytes_written = os.path.getsize(result.file_path)
+            result.elapsed = time.monotonic() - start
+
+            # 最後まで揃っていることを確認してから最終的な名前にする
+            complete, duration = self._check_complete(
+                result, expected_duration, native
+            )
+            if complete is None:
+                # 確認できないファイルは最終的な名前にしない（一時ファイルは
+                # 残し、次回もう一度確認する）
+                print(
+                    "ダウンロードした動画の長さを確認できないため、"
+                    "アップロードを保留します"
+                )
+                result.verified = False
+                return result
+            if not complete:
+                print(
+                    f"ダウンロードした動画が途中までしかありません"
+                    f"（{duration}秒 / Twitch {expected_duration}秒）。"
+                    "次回は最初からダウンロードし直します"
+                )
+                self.discard_incomplete(output_path)
+                return None
+            os.replace(result.file_path, output_path)
+            self.discard_incomplete(output_path)
+            result.file_path = output_path
+            result.duration = duration
+            print(f"ダウンロード完了: {output_path}")
+            print(f"ダウンロード統計: {result.summary()}")
+            return result
 
         except Exception as e:
             print(f"ダウンロードエラー: {str(e)}")
             return None
 
+    def _check_complete(self, result, expected_duration, native):
+        """一時ファイルが最後まで揃っているかを確認し、(結果, 動画の長さ)を返す
+
+        結果は揃っていればTrue、足りなければFalse、確認できなければNone。
+        独自のHLSダウンローダーの場合は、全セグメントを書き込んだことを
+        書き込み位置の記録とバイト数で確認し、プレイリストの長さがTwitchの
+        長さと食い違う場合のみファイルを解析する。yt-dlpの場合はファイルを
+        解析してTwitchの長さと比べ、長さが分からなければ確認できないとする。
+        """
+        if native:
+            if not self._hls_written(result.file_path):
+                return False, None
+            duration = result.duration
+            if (duration and expected_duration and
+                    abs(duration - expected_duration) > DURATION_TOLERANCE):
+                duration = self.get_video_duration(result.file_path) or duration
+                return (
+                    duration >= expected_duration - DURATION_TOLERANCE,
+                    duration
+                )
+            return True, duration
+
+        duration = self.get_video_duration(result.file_path)
+        if duration is None:
+            return None, None
+        if not expected_duration:
+            return True, duration
+        return duration >= expected_duration - DURATION_TOLERANCE, duration
+
+    @staticmethod
+    def _hls_written(part_path):
+        """独自のHLSダウンローダーが全セグメントを書き込んだか"""
+        try:
+            with open(HLSSegmentDownloader.state_path(part_path),
+                      encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return (
+            state.get('next') == state.get('segments') and
+            os.path.getsize(part_path) == state.get('bytes')
+        )
+
+    def _download_ytdlp(self, url, output_path):
+        """yt-dlpでダウンロード
+
+        yt-dlpは.part・フラグメントの記録（.ytdl）から前回の続きを
+        ダウンロードする。出力先はoutput_pathではなく一時ファイル（.dl）。
+        """
+        _, ytdlp_path = self.incomplete_paths(output_path)
+        counter = _ProgressCounter(self.limiter)
+        ydl_opts = {
+            'outtmpl': ytdlp_path,
+            'format': 'best',
+            'noplaylist': True,
+            'continuedl': True,
+            'nopart': False,
+            'progress_hooks': [counter],
+        }
+
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=True)
+
+        return DownloadResult(
+            ytdlp_path,
+            duration=info.get('duration'),
+            format_id=info.get('format_id'),
+            throttled=counter.throttled,
+        )
+
+    def estimate_size(self, url, duration, hls_format=None):
+        """Twitchの動画の長さとバリアントのビットレートから保存サイズを見積もる
+
+        hls_formatにはresolve_hls_formatで取得した情報を渡す（ダウンロードにも
+        同じ情報を渡せば、動画ページの解析は1回で済む）。ビットレートが
+        分からない場合はSTAGING_DEFAULT_BITRATE_MBPSを使う。
+        """
+        bitrate = None
+        if hls_format and hls_format.get('tbr'):
+            bitrate = hls_format['tbr'] * 1000
+        elif hls_format and hls_format['url'] == url:
+            # .m3u8が直接渡された場合はマスタープレイリストのBANDWIDTHを使う
+            try:
+                bitrate = HLSSegmentDownloader(workers=1).variant_bandwidth(url)
+            except Exception as e:
+                print(f"ビットレートの取得エラー: {str(e)}")
+        if not bitrate:
+            bitrate = Config.STAGING_DEFAULT_BITRATE_MBPS * 1000 * 1000
+        return int(duration * bitrate / 8 * Config.STAGING_SIZE_MARGIN)
+
+    def find_hls_format(self, url):
+        """resolve_hls_formatと同じ（取得に失敗した場合はNoneを返す）"""
+        try:
+            return self.resolve_hls_format(url)
+        except Exception as e:
+            print(f"HLSフォーマットの取得エラー: {str(e)}")
+            return None
+
+    def resolve_hls_format(self, url):
+        """動画ページのURLから最高画質のHLSフォーマット情報を取得
+
+        .m3u8のURLが渡された場合はそのURLのみを持つ情報を返す。
+        """
+        if urlparse(url).path.endswith('.m3u8'):
+            return {'url': url, 'format_id': 'hls'}
+
+        with yt_dlp.YoutubeDL({'quiet': True, 'noplaylist': True}) as ydl:
+            info = ydl.extract_info(url, download=False)
+
+        formats = [
+            f for f in info.get('formats') or []
+            if f.get('protocol', '').startswith('m3u8') and f.get('url')
+        ]
+        if not formats:
+            return None
+        # yt-dlpのformatsは低画質から高画質の順に並んでいる
+        best = dict(formats[-1])
+        best.setdefault('duration', info.get('duration'))
+        return best
+
+    def _download_hls(self, url, output_path, hls_format=None):
+        """独自のHLSダウンローダーで一時ファイル（.part）にダウンロード
+
+        Twitchのセグメントはyt-dlpと同様にMPEG-TSのまま書き込む。
+        中断した場合は.partと書き込み位置の記録を残し、次回その続きから
+        再開する。書き込みを始める前に失敗した場合はNoneを返し、
+        yt-dlpで再試行する。途中まで書き込んでから失敗した場合は
+        続きを残したまま例外を送出する（次回の実行で再開する）。
+        """
+        part_path, _ = self.incomplete_paths(output_path)
+        state_path = HLSSegmentDownloader.state_path(part_path)
+        try:
+            hls_format = hls_format or self.resolve_hls_format(url)
+            if not hls_format:
+                print("HLSプレイリストが見つかりません。yt-dlpで再試行します")
+                return None
+
+            downloader = HLSSegmentDownloader(
+                workers=self.hls_workers, limiter=self.limiter
+            )
+            bytes_written, resumed_bytes = downloader.download(
+                hls_format['url'], part_path
+            )
+            return DownloadResult(
+                part_path,
+                duration=(
+                    downloader.playlist_duration or hls_format.get('duration')
+                ),
+                format_id=hls_format.get('format_id'),
+                bytes_written=bytes_written,
+                throttled=downloader.throttled,
+                resumed_bytes=resumed_bytes,
+            )
+        except Exception as e:
+            if os.path.exists(state_path):
+                print(f"HLSダウンロードエラー: {str(e)}。次回続きから再開します")
+                raise
+            print(f"HLSダウンロードエラー: {str(e)}。yt-dlpで再試行します")
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            return None
+
+    def stream_video(self, url, buffer):
+        """動画をダウンロードしながらStreamBufferに書き込む
+
+        yt-dlpの標準出力（MPEG-TS）をそのままバッファに流し込む。
+        失敗した場合はbuffer.failで読み込み側に通知する。
+        """
+        cmd = [
+            sys.executable, '-m', 'yt_dlp',
+            '--quiet', '--no-playlist',
+            '-f', 'best',
+            '-o', '-',
+            url
+        ]
+
+        print(f"動画をストリーミングダウンロード中: {url}")
+        # 標準エラー出力はパイプが詰まらないよう一時ファイルに書き出す
+        stderr_file = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=stderr_file
+        )
+        try:
+            while True:
+                data = process.stdout.read(STREAM_READ_SIZE)
+                if not data:
+                    break
+                buffer.write(data)
+                metrics.count('bytes_downloaded', len(data))
+                self.limiter.consume(len(data))
+
+            returncode = process.wait()
+            if returncode != 0:
+                stderr_file.seek(0)
+                error = stderr_file.read().decode(errors='replace')
+                raise RuntimeError(
+                    f"yt-dlpが終了コード{returncode}で終了しました: {error}"
+                )
+
+            buffer.finish()
+            print(
+                f"ストリーミングダウンロード完了: "
+                f"{buffer.bytes_written / (1024 * 1024):.1f}MB"
+            )
+        except Exception as e:
+            print(f"ダウンロードエラー: {str(e)}")
+            buffer.fail(e)
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            stderr_file.close()
+
     def get_video_duration(self, file_path):
         """動画の長さを取得（秒）"""
+        with metrics.span('probe', file=os.path.basename(file_path)) as s:
+            duration = self._get_video_duration(file_path)
+            if duration is None:
+                s.fail()
+            s.set(media_duration=duration)
+        return duration
+
+    def _get_video_duration(self, file_path):
         try:
             # ファイルが存在するかチェック
             if not os.path.exists(file_path):
                 print(f"ファイルが存在しません: {file_path}")
                 return None
 
-            # 方法1: ffprobeを使用
+            # 方法1: MP4/MPEG-TSのヘッダーを直接読み込む（外部プロセス不要）
             try:
-                import subprocess
+                duration = probe_duration(file_path)
+                if duration:
+                    return duration
+            except Exception as probe_error:
+                print(f"動画ヘッダー読み込みエラー: {probe_error}")
 
+            # 以下はヘッダーから取得できない場合のフォールバック
+            # 方法2: ffprobeを使用
+            try:
                 cmd = [
                     'ffprobe',
                     '-v', 'quiet',
@@ -87,7 +708,7 @@ class VideoDownloader:
             except Exception as ffprobe_error:
                 print(f"ffprobeエラー: {ffprobe_error}")
 
-            # 方法2: yt-dlpを使用（file://プロトコル）
+            # 方法3: yt-dlpを使用（file://プロトコル）
             try:
                 import urllib.parse
 
@@ -108,7 +729,7 @@ class VideoDownloader:
             except Exception as ytdlp_error:
                 print(f"yt-dlpエラー: {ytdlp_error}")
 
-            # 方法3: yt-dlpコマンドラインを使用
+            # 方法4: yt-dlpコマンドラインを使用
             try:
 
                 cmd = [
@@ -134,23 +755,6 @@ class VideoDownloader:
             print(f"動画長の取得エラー: {str(e)}")
             return None
 
-    def cleanup_old_files(self, max_age_days=7):
-        """古いファイルを削除"""
-        try:
-            current_time = datetime.now()
-            for filename in os.listdir(self.download_dir):
-                file_path = os.path.join(self.download_dir, filename)
-                if os.path.isfile(file_path):
-                    file_age = current_time - datetime.fromtimestamp(
-                        os.path.getctime(file_path)
-                    )
-                    if file_age.days > max_age_days:
-                        os.remove(file_path)
-                        print(f"古いファイルを削除: {filename}")
-
-        except Exception as e:
-            print(f"ファイルクリーンアップエラー: {str(e)}")
-
     def format_duration(self, seconds):
         """秒数を時:分:秒形式に変換"""
         hours = int(seconds // 3600)
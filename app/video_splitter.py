@@ -0,0 +1,118 @@
+import csv
+import glob
+import math
+import os
+import shutil
+import subprocess
+from config import Config
+import metrics
+
+
+# キーフレームの位置で切るとパートが目標より少し長くなるため、上限から引く秒数
+SPLIT_MARGIN = 60
+
+
+class VideoSplitter:
+    """長すぎる動画をffmpegのストリームコピー（再エンコードなし）で分割する
+
+    ffmpegのsegmentマクサーでキーフレームの位置ごとに切るため、画質は
+    変わらず、ファイルを1回読み書きするだけで分割できる。
+    """
+
+    def __init__(self, max_length=None, ffmpeg='ffmpeg'):
+        self.max_length = max_length or Config.MAX_VIDEO_LENGTH
+        self.ffmpeg = ffmpeg
+
+    def available(self):
+        """ffmpegがインストールされているか"""
+        return shutil.which(self.ffmpeg) is not None
+
+    def plan(self, duration):
+        """動画を分割するパート数と、1パートの目標の長さ（秒）を返す
+
+        各パートがほぼ同じ長さになるように分割する。
+        """
+        limit = self.max_length - min(SPLIT_MARGIN, self.max_length // 10)
+        parts = max(math.ceil(duration / limit), 1)
+        return parts, duration / parts
+
+    def part_pattern(self, file_path):
+        """パートのファイル名（ffmpegの連番形式）"""
+        root, _ = os.path.splitext(file_path)
+        return f"{root}.part%03d.ts"
+
+    def split(self, file_path, duration):
+        """動画をパートに分割し、(パートのファイルパス, 長さ)のリストを返す
+
+        失敗した場合、またはキーフレームの間隔が長く上限を超えるパートが
+        できた場合は、作成したパートを削除してNoneを返す。
+        """
+        with metrics.span('split', file=os.path.basename(file_path)) as s:
+            parts = self._split(file_path, duration)
+            if parts is None:
+                s.fail()
+            else:
+                s.bytes = sum(os.path.getsize(path) for path, _ in parts)
+                s.set(parts=len(parts))
+        return parts
+
+    def _split(self, file_path, duration):
+        count, segment_time = self.plan(duration)
+        # 切る位置を明示し、末尾に短いパートができないようにする
+        cut_times = ','.join(
+            f'{segment_time * i:.3f}' for i in range(1, count)
+        )
+        list_path = os.path.splitext(file_path)[0] + '.parts.csv'
+        print(
+            f"動画を{count}個のパートに分割中: {os.path.basename(file_path)}"
+            f"（1パート約{segment_time / 3600:.1f}時間）"
+        )
+        cmd = [
+            self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+            '-i', file_path,
+            '-map', '0', '-c', 'copy',
+            '-f', 'segment',
+            '-segment_times', cut_times,
+            # Twitchのアーカイブと同じMPEG-TSで書き出す
+            '-segment_format', 'mpegts',
+            '-reset_timestamps', '1',
+            '-segment_list', list_path,
+            '-segment_list_type', 'csv',
+            self.part_pattern(file_path),
+        ]
+
+        parts = []
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f"ffmpegエラー: {result.stderr.strip()}")
+                self._remove_parts(file_path)
+                return None
+
+            # 各行は「ファイル名,開始秒,終了秒」
+            directory = os.path.dirname(file_path)
+            with open(list_path, newline='', encoding='utf-8') as f:
+                for name, start, end in csv.reader(f):
+                    parts.append((
+                        os.path.join(directory, os.path.basename(name)),
+                        float(end) - float(start)
+                    ))
+            too_long = [d for _, d in parts if d > self.max_length]
+            if not parts or too_long:
+                print("上限を超えるパートができたため、分割を中止します")
+                self._remove_parts(file_path)
+                return None
+            return parts
+        except Exception as e:
+            print(f"動画分割エラー: {str(e)}")
+            self._remove_parts(file_path)
+            return None
+        finally:
+            if os.path.exists(list_path):
+                os.remove(list_path)
+
+    def _remove_parts(self, file_path):
+        """途中まで書き出されたものを含め、パートのファイルをすべて削除"""
+        root, _ = os.path.splitext(file_path)
+        for path in glob.glob(glob.escape(root) + '.part[0-9][0-9][0-9].ts'):
+            os.remove(path)
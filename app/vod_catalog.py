@@ -0,0 +1,391 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from config import Config
+
+
+# 処理状態（アーカイブごとに上から順に進む。各段階の完了時に記録する）
+STATE_LISTED = 'listed'            # Twitchから取得済み
+STATE_DOWNLOADING = 'downloading'  # ダウンロード開始（file_pathに保存先）
+STATE_DOWNLOADED = 'downloaded'    # ダウンロード完了
+STATE_VERIFIED = 'verified'        # 動画の長さを確認済み
+STATE_UPLOADING = 'uploading'      # アップロード開始
+STATE_UPLOADED = 'uploaded'        # アップロード完了（youtube_idに動画ID）
+STATE_CLEANED = 'cleaned'          # ローカルファイル削除済み（処理完了）
+STATE_SKIPPED = 'skipped'          # 長すぎるなどの理由で処理しない
+
+# 再起動時に処理を再開する状態
+PENDING_STATES = (
+    STATE_LISTED, STATE_DOWNLOADING, STATE_DOWNLOADED, STATE_VERIFIED,
+    STATE_UPLOADING, STATE_UPLOADED,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vods (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    duration INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    url TEXT,
+    state TEXT NOT NULL DEFAULT 'listed',
+    youtube_id TEXT,
+    skip_reason TEXT,
+    updated_at TEXT NOT NULL,
+    channel TEXT,
+    file_path TEXT,
+    unverified_downloads INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_vods_created_at ON vods (created_at);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS vod_parts (
+    video_id TEXT NOT NULL,
+    part INTEGER NOT NULL,
+    parts INTEGER NOT NULL,
+    duration REAL,
+    file_path TEXT,
+    youtube_id TEXT,
+    PRIMARY KEY (video_id, part)
+);
+"""
+
+
+def to_twitch_timestamp(dt):
+    """datetimeをTwitchのcreated_at形式（UTC, 末尾Z）の文字列に変換"""
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class VODCatalog:
+    """取得済みのTwitch配信アーカイブと処理状態を保持するローカルカタログ"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or Config.CATALOG_PATH
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+        # パイプライン処理で複数スレッドから使うため、ロックで直列化する
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            self._migrate()
+
+    def _migrate(self):
+        """旧版のカタログにチャンネル列・ファイルパス列などを追加"""
+        columns = {
+            row['name']
+            for row in self.conn.execute("PRAGMA table_info(vods)")
+        }
+        if 'channel' not in columns:
+            self.conn.execute("ALTER TABLE vods ADD COLUMN channel TEXT")
+        if 'file_path' not in columns:
+            self.conn.execute("ALTER TABLE vods ADD COLUMN file_path TEXT")
+        if 'unverified_downloads' not in columns:
+            self.conn.execute(
+                "ALTER TABLE vods ADD COLUMN "
+                "unverified_downloads INTEGER NOT NULL DEFAULT 0"
+            )
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+            # 旧版の状態を処理段階に置き換える（旧版はアップロード成功直後に
+            # ファイルを削除していたため、アップロード済みは削除済みとみなす）
+            self.conn.execute(
+                "UPDATE vods SET state = ? WHERE state = 'discovered'",
+                (STATE_LISTED,)
+            )
+            self.conn.execute(
+                "UPDATE vods SET state = ? WHERE state = ?",
+                (STATE_CLEANED, STATE_UPLOADED)
+            )
+            self.conn.execute("PRAGMA user_version = 1")
+        if Config.TWITCH_CHANNEL_NAME:
+            self.conn.execute(
+                "UPDATE vods SET channel = ? WHERE channel IS NULL",
+                (Config.TWITCH_CHANNEL_NAME,)
+            )
+            self.conn.execute(
+                "UPDATE sync_state SET key = ? WHERE key = 'watermark'",
+                (self._watermark_key(Config.TWITCH_CHANNEL_NAME),)
+            )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_vods_channel_created_at "
+            "ON vods (channel, created_at)"
+        )
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def _watermark_key(channel):
+        return f'watermark:{channel}'
+
+    def get_watermark(self, channel):
+        """チャンネルの同期済みの最新created_at（高水位標）を取得"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM sync_state WHERE key = ?",
+                (self._watermark_key(channel),)
+            ).fetchone()
+        return row['value'] if row else None
+
+    def get_watch_start(self, channel, default):
+        """監視モードで対象にする最も古いcreated_at
+
+        初回は監視を始めた時点の遡る範囲の始まり（default）を記録し、
+        以降はその値を返す。
+        """
+        key = f'watch_start:{channel}'
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO sync_state (key, value) VALUES (?, ?)",
+                (key, to_twitch_timestamp(default))
+            )
+            row = self.conn.execute(
+                "SELECT value FROM sync_state WHERE key = ?", (key,)
+            ).fetchone()
+        return row['value']
+
+    def sync(self, twitch_api):
+        """高水位標より新しいアーカイブのみをTwitchから取得してカタログに追加
+
+        高水位標はチャンネル（twitch_api.channel_name）ごとに保持する。
+        配信中のアーカイブは長さが伸びるため、高水位標と同時刻の動画も
+        再取得して長さ・タイトルを更新する。
+
+        一覧を途中までしか取得できなかった場合は、取得できた分だけ追加して
+        高水位標は進めない（次回の同期で取得できなかった古い側を取り直す）。
+        """
+        channel = twitch_api.channel_name
+        watermark = self.get_watermark(channel)
+        since = twitch_api.parse_created_at(watermark) if watermark else None
+
+        videos, complete = twitch_api.list_videos(since=since)
+        now = to_twitch_timestamp(datetime.now(timezone.utc))
+        with self._lock, self.conn:
+            for video in videos:
+                self.conn.execute(
+                    """
+                    INSERT INTO vods
+                        (id, created_at, duration, title, url, updated_at,
+                         channel, state)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (id) DO UPDATE SET
+                        duration = excluded.duration,
+                        title = excluded.title,
+                        url = excluded.url,
+                        updated_at = excluded.updated_at
+                    """,
+                    (
+                        video['id'],
+                        video['created_at'],
+                        twitch_api.parse_twitch_duration(video['duration']),
+                        video['title'],
+                        video.get('url'),
+                        now,
+                        channel,
+                        STATE_LISTED,
+                    )
+                )
+            if videos and complete:
+                newest = max(v['created_at'] for v in videos)
+                if not watermark or newest > watermark:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO sync_state (key, value) "
+                        "VALUES (?, ?)",
+                        (self._watermark_key(channel), newest)
+                    )
+
+        print(
+            f"カタログを同期しました（{channel}）: "
+            f"{len(videos)}件の配信アーカイブを取得"
+        )
+        if not complete:
+            print(
+                f"配信アーカイブの一覧を最後まで取得できませんでした（{channel}）。"
+                "次回の同期で取り直します"
+            )
+        return len(videos)
+
+    def refresh(self, twitch_api, video_ids):
+        """指定した動画の長さ・タイトル・URLをTwitchからまとめて再取得して更新
+
+        Twitchで見つからなかった（削除された）動画IDのリストを返す。
+        取得に失敗した場合はNoneを返す。
+        """
+        videos = twitch_api.get_videos_by_id(video_ids)
+        if videos is None:
+            return None
+
+        now = to_twitch_timestamp(datetime.now(timezone.utc))
+        with self._lock, self.conn:
+            for video in videos.values():
+                self.conn.execute(
+                    """
+                    UPDATE vods SET duration = ?, title = ?, url = ?,
+                        updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (
+                        twitch_api.parse_twitch_duration(video['duration']),
+                        video['title'],
+                        video.get('url'),
+                        now,
+                        video['id'],
+                    )
+                )
+        return [video_id for video_id in video_ids if video_id not in videos]
+
+    def get_videos_in_range(self, start_datetime, end_datetime, states=None,
+                            channel=None):
+        """指定した日時範囲の動画を新しい順に取得"""
+        query = (
+            "SELECT * FROM vods WHERE created_at BETWEEN ? AND ?"
+        )
+        params = [
+            to_twitch_timestamp(start_datetime),
+            to_twitch_timestamp(end_datetime),
+        ]
+        if channel:
+            query += " AND channel = ?"
+            params.append(channel)
+        if states:
+            query += f" AND state IN ({', '.join('?' for _ in states)})"
+            params.extend(states)
+        query += " ORDER BY created_at DESC"
+
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_video(self, video_id):
+        """動画IDからカタログの行を取得"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT * FROM vods WHERE id = ?", (video_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def _set_state(self, video_id, state, **fields):
+        """処理状態と付随する列（file_path, youtube_idなど）を1トランザクションで更新"""
+        fields['state'] = state
+        fields['updated_at'] = to_twitch_timestamp(datetime.now(timezone.utc))
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        with self._lock, self.conn:
+            self.conn.execute(
+                f"UPDATE vods SET {assignments} WHERE id = ?",
+                (*fields.values(), video_id)
+            )
+
+    def mark_downloading(self, video_id, file_path):
+        self._set_state(video_id, STATE_DOWNLOADING, file_path=file_path)
+
+    def mark_downloaded(self, video_id, file_path):
+        self._set_state(
+            video_id, STATE_DOWNLOADED, file_path=file_path,
+            unverified_downloads=0
+        )
+
+    def record_unverified_download(self, video_id):
+        """ダウンロードした動画を確認できなかった回数を1増やし、増やした後の回数を返す"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE vods SET unverified_downloads = unverified_downloads + 1 "
+                "WHERE id = ?",
+                (video_id,)
+            )
+            row = self.conn.execute(
+                "SELECT unverified_downloads FROM vods WHERE id = ?",
+                (video_id,)
+            ).fetchone()
+        return row['unverified_downloads'] if row else 0
+
+    def mark_verified(self, video_id):
+        self._set_state(video_id, STATE_VERIFIED)
+
+    def mark_uploading(self, video_id):
+        self._set_state(video_id, STATE_UPLOADING)
+
+    def mark_uploaded(self, video_id, youtube_id):
+        self._set_state(video_id, STATE_UPLOADED, youtube_id=youtube_id)
+
+    def mark_cleaned(self, video_id):
+        self._set_state(video_id, STATE_CLEANED, file_path=None)
+
+    def mark_skipped(self, video_id, reason):
+        self._set_state(
+            video_id, STATE_SKIPPED, skip_reason=reason, file_path=None
+        )
+
+    def reset(self, video_id):
+        """最初から処理し直す（ファイルが失われた場合など）"""
+        self._set_state(video_id, STATE_LISTED, file_path=None)
+
+    def get_staged_files(self):
+        """ローカルにファイルが記録されている動画の(動画ID, 処理状態, ファイルパス)
+
+        分割したパートのファイルも含む。
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                """
+                SELECT id, state, file_path FROM vods
+                WHERE file_path IS NOT NULL
+                UNION ALL
+                SELECT vods.id, vods.state, vod_parts.file_path
+                FROM vod_parts JOIN vods ON vods.id = vod_parts.video_id
+                WHERE vod_parts.file_path IS NOT NULL
+                """
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def get_parts(self, video_id):
+        """分割した動画のパートをパート番号順に取得（分割していない場合は空）"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM vod_parts WHERE video_id = ? ORDER BY part",
+                (video_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def set_parts(self, video_id, parts):
+        """分割したパート（(file_path, duration)のリスト、先頭がパート1）を記録
+
+        同じパート数で分割し直した場合、アップロード済みのパートは
+        YouTubeの動画IDを引き継ぐ（file_pathはNoneにする）。
+        """
+        with self._lock, self.conn:
+            uploaded = {
+                row['part']: row['youtube_id']
+                for row in self.conn.execute(
+                    "SELECT part, youtube_id FROM vod_parts "
+                    "WHERE video_id = ? AND parts = ? "
+                    "AND youtube_id IS NOT NULL",
+                    (video_id, len(parts))
+                )
+            }
+            self.conn.execute(
+                "DELETE FROM vod_parts WHERE video_id = ?", (video_id,)
+            )
+            for number, (file_path, duration) in enumerate(parts, 1):
+                youtube_id = uploaded.get(number)
+                self.conn.execute(
+                    """
+                    INSERT INTO vod_parts
+                        (video_id, part, parts, duration, file_path, youtube_id)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        video_id, number, len(parts), duration,
+                        None if youtube_id else file_path, youtube_id,
+                    )
+                )
+
+    def mark_part_uploaded(self, video_id, part, youtube_id):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE vod_parts SET youtube_id = ?, file_path = NULL "
+                "WHERE video_id = ? AND part = ?",
+                (youtube_id, video_id, part)
+            )
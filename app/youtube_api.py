@@ -1,15 +1,224 @@
+import json
 import os
 import pickle
+import re
+import threading
+import time
+import httplib2
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, MediaUpload
+from config import Config
+from quota_ledger import QuotaLedger
+from rate_limiter import upload_limiter
+import metrics
+
+
+# 動画説明文に埋め込むTwitchの動画ID（アップロード済みの動画の照合に使う）
+# 分割してアップロードした場合は「Twitch VOD ID: 123 Part 1/2」となる
+TWITCH_VOD_ID_LABEL = 'Twitch VOD ID:'
+TWITCH_VOD_ID_PATTERN = re.compile(
+    r'^' + re.escape(TWITCH_VOD_ID_LABEL) +
+    r'\s*(\d+)(?:\s+Part\s+(\d+)/(\d+))?\s*$',
+    re.MULTILINE
+)
+
+# YouTubeの動画タイトルの最大文字数
+TITLE_MAX_LENGTH = 100
+
+# playlistItems.listの1ページあたりの最大件数
+PLAYLIST_PAGE_SIZE = 50
+
+
+def format_twitch_vod_id(video_id, part=None, parts=None):
+    """動画説明文に埋め込むTwitchの動画IDの行"""
+    line = f"{TWITCH_VOD_ID_LABEL} {video_id}"
+    if part:
+        line += f" Part {part}/{parts}"
+    return line
+
+
+def extract_twitch_vod_id(description):
+    """動画説明文からTwitchの動画IDとパート番号を取り出す
+
+    (動画ID, パート番号, パート数)を返す（分割していない場合はパート1/1）。
+    見つからない場合はNoneを返す。
+    """
+    match = TWITCH_VOD_ID_PATTERN.search(description or '')
+    if not match:
+        return None
+    if match.group(2):
+        return match.group(1), int(match.group(2)), int(match.group(3))
+    return match.group(1), 1, 1
+
+
+class StreamBufferUpload(MediaUpload):
+    """StreamBufferから読み込むサイズ未確定のアップロード"""
+
+    # 256KiBの倍数である必要がある
+    CHUNK_SIZE = 32 * 1024 * 1024
+
+    def __init__(self, buffer, mimetype='video/mp2t', chunksize=None):
+        self._buffer = buffer
+        self._mimetype = mimetype
+        # 送信中のチャンクを保持したまま次のデータを書き込めるサイズにする
+        self._chunksize = chunksize or min(
+            self.CHUNK_SIZE,
+            max(256 * 1024, buffer.capacity // 2 // (256 * 1024) * 256 * 1024)
+        )
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        return None
+
+    def resumable(self):
+        return True
+
+    def getbytes(self, begin, length):
+        return self._buffer.read_at(begin, length)
+
+    def has_stream(self):
+        return False
+
+    def set_chunksize(self, chunksize):
+        self._chunksize = chunksize
+
+
+class AdaptiveMediaFileUpload(MediaFileUpload):
+    """送信中にチャンクサイズを変更できるMediaFileUpload
+
+    before_readを設定すると、チャンクを読み込む直前（セッションの作成後、
+    そのチャンクを送信する前）に呼び出す。
+    """
+
+    before_read = None
+
+    def set_chunksize(self, chunksize):
+        self._chunksize = chunksize
+
+    def stream(self):
+        if self.before_read:
+            self.before_read()
+        return super().stream()
+
+
+class AdaptiveChunkSizer:
+    """計測したスループットからチャンクサイズを調整する
+
+    1チャンクの送信時間が目標秒数に近づくように、最小・最大の範囲内で
+    チャンクサイズを増減する（常に256KiBの倍数）。エラー時は半分にする。
+    """
+
+    UNIT = 256 * 1024
+
+    def __init__(self, initial=None, minimum=None, maximum=None,
+                 target_seconds=None):
+        mb = 1024 * 1024
+        self.minimum = self._align(minimum or Config.UPLOAD_CHUNK_MIN_MB * mb)
+        self.maximum = self._align(maximum or Config.UPLOAD_CHUNK_MAX_MB * mb)
+        self.target_seconds = (
+            target_seconds or Config.UPLOAD_CHUNK_TARGET_SECONDS
+        )
+        self.chunksize = self._clamp(
+            initial or Config.UPLOAD_CHUNK_INITIAL_MB * mb
+        )
+        self.sizes_used = []
+        self.retries = 0
+        self.bytes_sent = 0
+        self.seconds = 0.0
+
+    def _align(self, size):
+        return max(self.UNIT, int(size) // self.UNIT * self.UNIT)
+
+    def _clamp(self, size):
+        return min(self.maximum, max(self.minimum, self._align(size)))
+
+    def record_success(self, bytes_sent, elapsed):
+        """チャンク送信の結果から次のチャンクサイズを決める"""
+        self.sizes_used.append(self.chunksize)
+        self.bytes_sent += bytes_sent
+        self.seconds += elapsed
+        if bytes_sent <= 0 or elapsed <= 0:
+            return self.chunksize
+        throughput = bytes_sent / elapsed
+        # 急激な変化を避けるため、1回の調整は2倍・半分までに制限する
+        ideal = throughput * self.target_seconds
+        ideal = min(self.chunksize * 2, max(self.chunksize / 2, ideal))
+        self.chunksize = self._clamp(ideal)
+        return self.chunksize
+
+    def limited(self, rate):
+        """送信速度の上限rate（バイト/秒）で目標秒数内に送れるチャンクサイズ
+
+        上限がある場合は、1チャンクを上限を超える速度で送る量を抑えるため
+        最小値より小さくなることもある。
+        """
+        if not rate:
+            return self.chunksize
+        return min(self.chunksize, self._align(rate * self.target_seconds))
+
+    def record_retry(self):
+        self.retries += 1
+        self.chunksize = self._clamp(self.chunksize / 2)
+        return self.chunksize
+
+    def summary(self):
+        mb = 1024 * 1024
+        rate = self.bytes_sent / self.seconds if self.seconds else 0
+        sizes = self.sizes_used or [self.chunksize]
+        return (
+            f"送信量: {self.bytes_sent / mb:.1f}MB, "
+            f"平均速度: {rate / mb:.2f}MB/s, "
+            f"チャンクサイズ: {min(sizes) / mb:.2f}〜{max(sizes) / mb:.2f}MB"
+            f"（最終 {self.chunksize / mb:.2f}MB）, "
+            f"再試行: {self.retries}回"
+        )
+
+
+def is_retriable_upload_error(error):
+    """チャンク送信を再試行すべきエラーかどうか"""
+    if isinstance(error, HttpError):
+        return error.resp.status >= 500 or error.resp.status == 429
+    return isinstance(error, (httplib2.HttpLib2Error, OSError))
+
+
+def is_quota_exceeded(error):
+    """1日のクォータ上限に達したことを示すエラーかどうか"""
+    return (
+        isinstance(error, HttpError) and error.resp.status == 403 and
+        any(
+            reason in (error.content or b'')
+            for reason in (b'quotaExceeded', b'dailyLimitExceeded')
+        )
+    )
 
 
 class YouTubeAPI:
-    def __init__(self):
+    def __init__(self, token_path=None, privacy_status='private',
+                 quota=None, limiter=None):
         self.credentials = None
         self.youtube = None
+        # 同じGoogle Cloudプロジェクトを使うクライアント間で共有する
+        self.quota = quota or QuotaLedger()
+        # 全アップロードで共有する送信速度の上限（時間帯ごとに切り替わる）
+        self.limiter = limiter or upload_limiter
+        # アップロード先アカウントのトークン（チャンネルごとに切り替え可能）
+        self.token_path = token_path or os.path.join(
+            os.path.dirname(os.path.dirname(__file__)), 'pickle', 'token.pickle'
+        )
+        self.privacy_status = privacy_status
+        # Twitchの動画ID → {'parts': パート数, 'videos': {パート番号: YouTubeの動画ID}}
+        # （初回の照合時に作成）
+        self._upload_index = None
+        self._upload_index_lock = threading.Lock()
 
         # OAuth 2.0のスコープ（Brand Account対応のため追加）
         self.SCOPES = [
@@ -23,9 +232,7 @@ class YouTubeAPI:
         creds = None
 
         # トークンファイルが存在する場合は読み込み
-        token_path = os.path.join(
-            os.path.dirname(os.path.dirname(__file__)), 'pickle', 'token.pickle'
-        )
+        token_path = self.token_path
         if os.path.exists(token_path):
             try:
                 with open(token_path, 'rb') as token:
@@ -86,34 +293,145 @@ class YouTubeAPI:
                 print(f"トークンファイル保存エラー: {str(e)}")
 
         self.credentials = creds
-        self.youtube = build('youtube', 'v3', credentials=creds)
+        self.youtube = self.build_client(creds)
 
         return True
 
+    def copy(self):
+        """同じアカウント・クォータ台帳を使う別のクライアントを作成
+
+        APIクライアント（httplib2）はスレッドセーフではないため、並行して
+        アップロードする場合はスレッドごとに別のクライアントを使う。
+        """
+        client = YouTubeAPI(
+            token_path=self.token_path, privacy_status=self.privacy_status,
+            quota=self.quota, limiter=self.limiter
+        )
+        if self.credentials:
+            client.credentials = self.credentials
+            client.youtube = client.build_client(self.credentials)
+        return client
+
+    def build_client(self, creds):
+        """認証情報からYouTube APIクライアントを作成
+
+        YOUTUBE_API_ROOT_URLが設定されている場合は、同梱のディスカバリー
+        文書の接続先を差し替える（ベンチマーク用のローカルサーバーなど）。
+        """
+        if not Config.YOUTUBE_API_ROOT_URL:
+            return build('youtube', 'v3', credentials=creds)
+
+        document = json.loads(discovery_cache.get_static_doc('youtube', 'v3'))
+        document['rootUrl'] = Config.YOUTUBE_API_ROOT_URL.rstrip('/') + '/'
+        document['baseUrl'] = (
+            document['rootUrl'] + document.get('servicePath', '')
+        )
+        return build_from_document(document, credentials=creds)
+
+    def _build_body(self, title, description, tags, category_id):
+        """動画のメタデータを作成"""
+        return {
+            'snippet': {
+                'title': title,
+                'description': description,
+                'tags': tags or [],
+                'categoryId': category_id
+            },
+            'status': {
+                'privacyStatus': self.privacy_status,  # デフォルトは非公開
+                'selfDeclaredMadeForKids': False
+            }
+        }
+
+    def _upload_state_path(self, file_path):
+        return file_path + '.upload.json'
+
+    def _file_identity(self, file_path):
+        """ファイルが同一であることを確認するための情報"""
+        stat = os.stat(file_path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def _load_upload_state(self, file_path):
+        """前回中断したアップロードのセッション情報を読み込む
+
+        ファイルが変更されている場合はNoneを返す（状態ファイルは削除しない）。
+        """
+        state_path = self._upload_state_path(file_path)
+        if not os.path.exists(state_path):
+            return None
+
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception as e:
+            print(f"アップロード状態ファイルの読み込みエラー: {str(e)}")
+            state = None
+
+        if not state or state.get('file') != self._file_identity(file_path):
+            return None
+        return state
+
+    def has_resumable_upload(self, file_path):
+        """中断したアップロードのセッション（作成時にクォータを消費済み）から再開できるか"""
+        return bool(
+            file_path and os.path.exists(file_path) and
+            self._load_upload_state(file_path)
+        )
+
+    def _save_upload_state(self, file_path, request):
+        """再開用のセッションURIと確定済みバイト数をファイルの隣に保存"""
+        state = {
+            'resumable_uri': request.resumable_uri,
+            'progress': request.resumable_progress,
+            'file': self._file_identity(file_path),
+        }
+        state_path = self._upload_state_path(file_path)
+        tmp_path = state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+
+    def _clear_upload_state(self, file_path):
+        state_path = self._upload_state_path(file_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
     def upload_video(self, file_path, title, description="", tags=None,
-                     category_id="22"):
-        """動画をYouTubeにアップロード"""
+                     category_id="22", reservation=None):
+        """動画をYouTubeにアップロード
+
+        前回のアップロードが中断されていた場合は、保存したセッションの
+        確定済みバイト数から再開する。reservationを渡すと、アップロードを
+        開始した時点で予約していたクォータを消費済みに切り替える。
+        """
+        with metrics.span(
+                'upload', file=os.path.basename(file_path),
+                worker=threading.current_thread().name
+        ) as s:
+            video_id = self._upload_video(
+                file_path, title, description, tags, category_id, s,
+                reservation
+            )
+            if not video_id:
+                s.fail()
+            s.set(youtube_id=video_id)
+        return video_id
+
+    def _upload_video(self, file_path, title, description, tags,
+                      category_id, span, reservation):
         if not self.youtube:
             if not self.authenticate():
                 return None
 
         try:
-            # 動画ファイルのアップロード
-            media = MediaFileUpload(file_path, resumable=True)
+            # 動画ファイルのアップロード（チャンクサイズは送信中に調整）
+            sizer = AdaptiveChunkSizer()
+            media = AdaptiveMediaFileUpload(
+                file_path, chunksize=sizer.chunksize, resumable=True
+            )
 
             # 動画のメタデータ
-            body = {
-                'snippet': {
-                    'title': title,
-                    'description': description,
-                    'tags': tags or [],
-                    'categoryId': category_id
-                },
-                'status': {
-                    'privacyStatus': 'private',  # 最初は非公開でアップロード
-                    'selfDeclaredMadeForKids': False
-                }
-            }
+            body = self._build_body(title, description, tags, category_id)
 
             # アップロード実行
             request = self.youtube.videos().insert(
@@ -122,20 +440,130 @@ class YouTubeAPI:
                 media_body=media
             )
 
+            state = self._load_upload_state(file_path)
+            if not state and os.path.exists(self._upload_state_path(file_path)):
+                print("アップロード状態がファイルと一致しないため破棄します")
+                self._clear_upload_state(file_path)
+            if state:
+                print(
+                    f"中断したアップロードを再開します: "
+                    f"{state['progress'] / (1024 * 1024):.1f}MB 送信済み"
+                )
+                request.resumable_uri = state['resumable_uri']
+                # 送信量はサーバーに確定済みのバイト数から数える（最初の
+                # next_chunkで確定済みの範囲に更新されるため、0のままだと
+                # 送信済みの分まで今回の送信量に含まれてしまう）
+                request.resumable_progress = state['progress']
+                # エラー状態にしておくと、次のnext_chunkでサーバーに
+                # 確定済みの範囲を問い合わせてから続きを送信する
+                request._in_error_state = True
+
+            # 新しいセッションは作成した直後（最初のチャンクを送る前）に
+            # 保存し、最初のチャンクの送信中に中断してもセッションと
+            # 消費したクォータを失わないようにする
+            saved_uri = state['resumable_uri'] if state else None
+
+            def save_new_session():
+                nonlocal saved_uri
+                if request.resumable_uri and request.resumable_uri != saved_uri:
+                    self._save_upload_state(file_path, request)
+                    saved_uri = request.resumable_uri
+
+            media.before_read = save_new_session
+
             response = None
+            consecutive_errors = 0
+            throttled = 0.0
             while response is None:
-                status, response = request.next_chunk()
-                if status:
-                    print(f"アップロード進捗: {int(status.progress() * 100)}%")
+                progress_before = request.resumable_progress
+                # 送信速度の上限がある間は、1チャンクをその速度で目標秒数内に
+                # 送れる大きさに抑える（送信後に待つだけでは瞬間的な速度を
+                # 抑えられない）
+                media.set_chunksize(
+                    sizer.limited(self.limiter.current_rate())
+                )
+                started = time.monotonic()
+                new_session = request.resumable_uri is None
+                try:
+                    status, response = request.next_chunk()
+                except HttpError as e:
+                    if state and e.resp.status in (404, 410):
+                        # セッションの有効期限切れ。最初からやり直す
+                        print(
+                            "アップロードセッションが失効しています。"
+                            "最初からアップロードします"
+                        )
+                        self._clear_upload_state(file_path)
+                        state = None
+                        request.resumable_uri = None
+                        request.resumable_progress = 0
+                        request._in_error_state = False
+                        continue
+                    if not is_retriable_upload_error(e):
+                        raise
+                    error = e
+                except Exception as e:
+                    if not is_retriable_upload_error(e):
+                        raise
+                    error = e
+                else:
+                    consecutive_errors = 0
+                    sent = max((
+                        media.size() if response is not None
+                        else request.resumable_progress
+                    ) - progress_before, 0)
+                    metrics.count('bytes_uploaded', sent)
+                    sizer.record_success(sent, time.monotonic() - started)
+                    # 全体の送信速度の上限を超えた分だけ待つ
+                    throttled += self.limiter.consume(sent)
+                    if status:
+                        self._save_upload_state(file_path, request)
+                        print(
+                            f"アップロード進捗: {int(status.progress() * 100)}%"
+                            f"（チャンク {sent / (1024 * 1024):.1f}MB, "
+                            f"{time.monotonic() - started:.1f}秒）"
+                        )
+                    continue
+                finally:
+                    # videos.insertのクォータはセッションの作成時に消費される
+                    if new_session and (
+                            request.resumable_uri or response is not None):
+                        self.quota.record('videos.insert')
+                        if reservation:
+                            reservation.use()
 
+                # 一時的なエラー: チャンクを小さくして再試行
+                consecutive_errors += 1
+                if consecutive_errors > Config.UPLOAD_CHUNK_RETRIES:
+                    raise error
+                sizer.record_retry()
+                # 次のnext_chunkで確定済みの範囲を問い合わせてから再送する
+                request._in_error_state = request.resumable_uri is not None
+                wait = min(2 ** consecutive_errors, 60)
+                print(
+                    f"チャンク送信エラー: {str(error)}。{wait}秒後に再試行します"
+                    f"（{consecutive_errors}/{Config.UPLOAD_CHUNK_RETRIES}）"
+                )
+                time.sleep(wait)
+
+            print(f"アップロード統計: {sizer.summary()}")
+            span.bytes = sizer.bytes_sent
+            span.set(
+                retries=sizer.retries, chunksize=sizer.chunksize,
+                throttled=round(throttled, 1)
+            )
             video_id = response['id']
             print(f"アップロード完了: {video_id}")
+            self._clear_upload_state(file_path)
 
             return video_id
 
         except Exception as e:
             error_msg = str(e)
             print(f"アップロードエラー: {error_msg}")
+            if is_quota_exceeded(e):
+                self.quota.mark_exhausted()
+                return None
 
             # 認証エラーの場合は再認証を試行
             if ("unauthorized" in error_msg.lower() or
@@ -144,12 +572,221 @@ class YouTubeAPI:
                 self.credentials = None
                 self.youtube = None
                 if self.authenticate():
-                    return self.upload_video(
-                        file_path, title, description, tags, category_id
+                    return self._upload_video(
+                        file_path, title, description, tags, category_id,
+                        span, reservation
                     )
 
             return None
 
+    def upload_stream(self, buffer, title, description="", tags=None,
+                      category_id="22", reservation=None):
+        """StreamBufferに書き込まれるデータを順次YouTubeにアップロード
+
+        送信済みのデータは再送できないため、認証エラー時の再試行は行わない。
+        """
+        with metrics.span(
+                'upload', stream=True,
+                worker=threading.current_thread().name
+        ) as s:
+            video_id = self._upload_stream(
+                buffer, title, description, tags, category_id, reservation, s
+            )
+            s.bytes = buffer.bytes_written
+            if not video_id:
+                s.fail()
+            s.set(youtube_id=video_id)
+        return video_id
+
+    def _upload_stream(self, buffer, title, description, tags, category_id,
+                       reservation, span):
+        if not self.youtube:
+            if not self.authenticate():
+                return None
+
+        try:
+            media = StreamBufferUpload(buffer)
+            body = self._build_body(title, description, tags, category_id)
+            request = self.youtube.videos().insert(
+                part=",".join(body.keys()),
+                body=body,
+                media_body=media
+            )
+
+            response = None
+            throttled = 0.0
+            # 送信速度の上限がある間はチャンクを小さくする（_upload_videoと同じ）
+            sizer = AdaptiveChunkSizer(
+                initial=media.chunksize(), minimum=AdaptiveChunkSizer.UNIT,
+                maximum=media.chunksize()
+            )
+            while response is None:
+                progress_before = request.resumable_progress
+                media.set_chunksize(sizer.limited(self.limiter.current_rate()))
+                new_session = request.resumable_uri is None
+                try:
+                    status, response = request.next_chunk(num_retries=3)
+                finally:
+                    if new_session and (
+                            request.resumable_uri or response is not None):
+                        self.quota.record('videos.insert')
+                        if reservation:
+                            reservation.use()
+                sent = (
+                    request.resumable_progress if response is None
+                    else buffer.bytes_written
+                ) - progress_before
+                metrics.count('bytes_uploaded', sent)
+                throttled += self.limiter.consume(sent)
+                if status:
+                    print(
+                        f"アップロード進捗: "
+                        f"{status.resumable_progress / (1024 * 1024):.0f}MB"
+                    )
+
+            span.set(throttled=round(throttled, 1))
+            video_id = response['id']
+            print(f"アップロード完了: {video_id}")
+
+            return video_id
+
+        except Exception as e:
+            print(f"アップロードエラー: {str(e)}")
+            if is_quota_exceeded(e):
+                self.quota.mark_exhausted()
+            buffer.fail(e)
+            return None
+
+    def find_uploaded_video(self, twitch_video_id):
+        """Twitchの動画がアップロード済みであればYouTubeの動画IDを返す
+
+        分割してアップロードした動画は、全パートがそろっている場合のみ
+        パート順にカンマ区切りで返す。初回の呼び出し時にチャンネルの
+        アップロード済み動画の一覧を1回だけ取得して索引を作り、以降は
+        その索引を参照する（invalidate_upload_index()で作り直す）。
+        一覧を取得できない場合はNoneを返し（照合せずに処理を続ける）、
+        次の呼び出しで取得し直す。
+        """
+        with self._upload_index_lock:
+            index = self._get_upload_index()
+            entry = index and index.get(str(twitch_video_id))
+            if not entry or len(entry['videos']) < entry['parts']:
+                return None
+            return ','.join(
+                entry['videos'][part]
+                for part in range(1, entry['parts'] + 1)
+            )
+
+    def find_uploaded_part(self, twitch_video_id, part, parts):
+        """分割した動画のパートがアップロード済みであればYouTubeの動画IDを返す"""
+        with self._upload_index_lock:
+            index = self._get_upload_index()
+            entry = index and index.get(str(twitch_video_id))
+            if not entry or entry['parts'] != parts:
+                return None
+            return entry['videos'].get(part)
+
+    def add_uploaded_video(self, twitch_video_id, video_id, part=1,
+                           parts=1):
+        """このプロセスでアップロードした動画を索引に追加"""
+        with self._upload_index_lock:
+            if self._upload_index is not None:
+                self._add_to_index(
+                    self._upload_index, str(twitch_video_id), video_id,
+                    part, parts
+                )
+
+    def invalidate_upload_index(self):
+        """索引を破棄し、次の照合時にアップロード済み動画の一覧を取得し直す
+
+        監視モードでは、前回の確認以降に別の環境でアップロードされた動画を
+        照合できるよう、確認のたびに呼ぶ。
+        """
+        with self._upload_index_lock:
+            self._upload_index = None
+
+    def _get_upload_index(self):
+        """索引（取得に失敗した場合はNone。失敗した結果は保持しない）"""
+        if self._upload_index is None:
+            self._upload_index = self._build_upload_index()
+        return self._upload_index
+
+    @staticmethod
+    def _add_to_index(index, twitch_video_id, video_id, part, parts):
+        entry = index.get(twitch_video_id)
+        # 分割せずにアップロードした動画があれば、そちらを優先する
+        if entry is None or (parts == 1 and entry['parts'] != 1):
+            entry = index[twitch_video_id] = {'parts': parts, 'videos': {}}
+        if entry['parts'] == parts:
+            entry['videos'].setdefault(part, video_id)
+
+    def _build_upload_index(self):
+        """アップロード済み動画のプレイリストから、説明文のTwitch動画IDの索引を作成
+
+        一覧を最後まで取得できなかった場合は、途中までの索引ではなくNoneを返す。
+        """
+        index = {}
+        if not Config.CHECK_EXISTING_UPLOADS:
+            return index
+        if not self.youtube:
+            if not self.authenticate():
+                return None
+
+        with metrics.span('youtube.index') as s:
+            try:
+                channels = self.youtube.channels().list(
+                    part='contentDetails', mine=True
+                ).execute()
+                self.quota.record('channels.list')
+                if not channels.get('items'):
+                    print(
+                        "YouTubeチャンネルが見つからないため、"
+                        "アップロード済みの動画を確認できません"
+                    )
+                    s.fail()
+                    return None
+                playlist_id = channels['items'][0]['contentDetails'][
+                    'relatedPlaylists']['uploads']
+
+                pages = 0
+                videos = 0
+                page_token = None
+                while True:
+                    response = self.youtube.playlistItems().list(
+                        part='snippet', playlistId=playlist_id,
+                        maxResults=PLAYLIST_PAGE_SIZE, pageToken=page_token
+                    ).execute()
+                    self.quota.record('playlistItems.list')
+                    pages += 1
+                    for item in response.get('items', []):
+                        snippet = item['snippet']
+                        videos += 1
+                        found = extract_twitch_vod_id(
+                            snippet.get('description')
+                        )
+                        if found:
+                            self._add_to_index(
+                                index, found[0],
+                                snippet['resourceId']['videoId'],
+                                found[1], found[2]
+                            )
+                    page_token = response.get('nextPageToken')
+                    if not page_token:
+                        break
+            except Exception as e:
+                print(f"アップロード済み動画の取得エラー: {str(e)}")
+                if is_quota_exceeded(e):
+                    self.quota.mark_exhausted()
+                s.fail()
+                return None
+            s.set(pages=pages, videos=videos, indexed=len(index))
+
+        print(
+            f"YouTubeのアップロード済み動画 {videos} 件を確認しました"
+            f"（Twitch動画IDあり: {len(index)} 件）"
+        )
+        return index
+
     def update_video_privacy(self, video_id, privacy_status='public'):
         """動画のプライバシー設定を更新"""
         if not self.youtube:
@@ -166,6 +803,7 @@ class YouTubeAPI:
                     }
                 }
             ).execute()
+            self.quota.record('videos.update')
 
             print(f"プライバシー設定を更新: {video_id} -> {privacy_status}")
             return True
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+アップロード処理全体のベンチマーク
+
+Twitch Helix API・HLS配信・YouTubeの再開可能アップロードをローカルの
+代替サーバー（fake_services.py）に置き換え、run_manual_upload を実際に
+動かして以下を計測する（ネットワーク接続・認証情報は不要）。
+
+- 1時間あたりの処理VOD数
+- 処理段階ごとの転送速度（metrics の集計から）
+- 最大メモリ使用量（RSS）
+- サーバーごとのリクエスト数
+"""
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+from fake_services import FakeHelixServer, FakeHLSServer, FakeYouTubeServer
+
+
+def configure_environment(workdir, helix, youtube, args):
+    """appモジュールを読み込む前に、接続先と作業ディレクトリを環境変数で設定"""
+    os.environ.update({
+        'TWITCH_CLIENT_ID': 'bench',
+        'TWITCH_CLIENT_SECRET': 'bench',
+        'TWITCH_CHANNEL_NAME': 'bench',
+        'TWITCH_API_BASE_URL': f"{helix.url}/helix",
+        'TWITCH_AUTH_URL': f"{helix.url}/oauth2/token",
+        'YOUTUBE_API_ROOT_URL': youtube.url,
+        'DOWNLOAD_DIR': os.path.join(workdir, 'downloads'),
+        'CATALOG_PATH': os.path.join(workdir, 'vod_catalog.db'),
+        'METRICS_DIR': os.path.join(workdir, 'logs'),
+        'QUOTA_LEDGER_PATH': os.path.join(workdir, 'youtube_quota.db'),
+        'PIPELINE_MIN_FREE_SPACE_GB': '0',
+        'UPLOAD_CHUNK_INITIAL_MB': str(args.chunk_mb),
+        'UPLOAD_CHUNK_MIN_MB': str(args.chunk_mb),
+        'UPLOAD_WORKERS': str(args.upload_workers),
+        'UPLOAD_BANDWIDTH_MBPS': str(args.upload_mbps),
+    })
+    sys.path.insert(
+        0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+    )
+
+
+def peak_rss_mb():
+    # Linuxではキロバイト、macOSではバイト単位
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='アップロード処理全体のベンチマーク')
+    parser.add_argument('--vods', type=int, default=5)
+    parser.add_argument(
+        '--vod-seconds', type=int, default=600, help='VOD1件の長さ（秒）'
+    )
+    parser.add_argument('--segment-kb', type=int, default=512)
+    parser.add_argument(
+        '--hls-latency', type=float, default=0.01,
+        help='HLSセグメントごとの応答遅延（秒）'
+    )
+    parser.add_argument(
+        '--yt-latency', type=float, default=0.0,
+        help='YouTubeへのリクエストごとの応答遅延（秒）'
+    )
+    parser.add_argument(
+        '--yt-bandwidth-mb', type=float, default=0,
+        help='YouTubeへのアップロード帯域上限（MB/s、0は無制限）'
+    )
+    parser.add_argument(
+        '--yt-error-rate', type=float, default=0.0,
+        help='チャンク送信を503で失敗させる確率'
+    )
+    parser.add_argument('--chunk-mb', type=int, default=1)
+    parser.add_argument(
+        '--upload-workers', type=int, default=1,
+        help='--pipeline時のアップロードの同時実行数'
+    )
+    parser.add_argument(
+        '--upload-mbps', type=float, default=0,
+        help='全アップロードの合計の送信速度の上限（Mbps、0は無制限）'
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--pipeline', action='store_true')
+    mode.add_argument('--stream', action='store_true')
+    args = parser.parse_args()
+
+    hls = FakeHLSServer(
+        segment_size=args.segment_kb * 1024, latency=args.hls_latency
+    ).start()
+    helix = FakeHelixServer().start()
+    youtube = FakeYouTubeServer(
+        latency=args.yt_latency,
+        bandwidth=int(args.yt_bandwidth_mb * 1024 * 1024),
+        error_rate=args.yt_error_rate
+    ).start()
+    helix.add_videos(hls, args.vods, args.vod_seconds)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(workdir, helix, youtube, args)
+
+        from google.oauth2.credentials import Credentials
+        import metrics
+        from upload_manager import UploadManager
+
+        manager = UploadManager()
+        manager.youtube_api.credentials = Credentials(token='bench')
+        manager.youtube_api.youtube = manager.youtube_api.build_client(
+            manager.youtube_api.credentials
+        )
+
+        newest = manager.twitch_api.parse_created_at(helix.videos[0]['created_at'])
+        oldest = manager.twitch_api.parse_created_at(helix.videos[-1]['created_at'])
+        start = time.monotonic()
+        manager.run_manual_upload(
+            oldest - timedelta(hours=1), newest + timedelta(hours=1),
+            pipeline=args.pipeline, stream=args.stream
+        )
+        elapsed = time.monotonic() - start
+        rows = metrics.recorder.summary()
+
+    for server in (hls, helix, youtube):
+        server.stop()
+
+    mb = 1024 * 1024
+    mode_name = 'pipeline' if args.pipeline else (
+        'stream' if args.stream else 'sequential'
+    )
+    print("\n=== ベンチマーク結果 ===")
+    print(f"モード: {mode_name}")
+    print(
+        f"VOD: {len(youtube.completed)}/{args.vods}件アップロード, "
+        f"{elapsed:.2f}秒 ({len(youtube.completed) / elapsed * 3600:.0f}件/時)"
+    )
+    print(f"最大RSS: {peak_rss_mb():.1f}MB")
+    print(f"\n{'段階':<20} {'回数':>6} {'合計秒':>8} {'MB':>8} {'MB/s':>8}")
+    for name, row in rows.items():
+        rate = row['bytes'] / row['seconds'] / mb if row['seconds'] else 0
+        print(
+            f"{name:<20} {row['count']:>6} {row['seconds']:>8.2f} "
+            f"{row['bytes'] / mb:>8.1f} {rate:>8.1f}"
+        )
+    print("\nリクエスト数:")
+    for label, server in (
+        ('Helix', helix), ('HLS', hls), ('YouTube', youtube)
+    ):
+        counts = ', '.join(
+            f"{key}={value}" for key, value in sorted(server.requests.items())
+        )
+        print(f"  {label}: {counts}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+HLSセグメントダウンローダーのベンチマーク
+
+ローカルのHTTPサーバーで合成したHLSプレイリストを配信し、
+ワーカー数ごとのダウンロード速度を計測する（ネットワーク接続不要）。
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+)
+
+from video_downloader import HLSSegmentDownloader  # noqa: E402
+
+
+def make_handler(segment_count, segment_size, latency):
+    payload = os.urandom(segment_size)
+    playlist = "#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:10\n"
+    for i in range(segment_count):
+        playlist += f"#EXTINF:10.000,\n{i}.ts\n"
+    playlist += "#EXT-X-ENDLIST\n"
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.endswith('.m3u8'):
+                body = playlist.encode()
+            else:
+                # セグメントごとのサーバー応答遅延を再現
+                time.sleep(latency)
+                body = payload
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HLSダウンロードのベンチマーク')
+    parser.add_argument('--segments', type=int, default=200)
+    parser.add_argument('--segment-kb', type=int, default=512)
+    parser.add_argument(
+        '--latency', type=float, default=0.05,
+        help='セグメントごとの応答遅延（秒）'
+    )
+    parser.add_argument(
+        '--workers', type=int, nargs='+', default=[1, 4, 8, 16]
+    )
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        ('127.0.0.1', 0),
+        make_handler(args.segments, args.segment_kb * 1024, args.latency)
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/index.m3u8"
+
+    print(
+        f"セグメント数: {args.segments}, サイズ: {args.segment_kb}KB, "
+        f"遅延: {args.latency * 1000:.0f}ms"
+    )
+    print(f"{'workers':>8} {'秒':>8} {'MB/s':>8}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output_path = os.path.join(tmpdir, 'out.ts')
+        for workers in args.workers:
+            start = time.monotonic()
+            downloader = HLSSegmentDownloader(workers=workers, retries=0)
+            # 前回の書き込み位置から再開しないよう記録を消す
+            state_path = downloader.state_path(output_path)
+            if os.path.exists(state_path):
+                os.remove(state_path)
+            size, _ = downloader.download(url, output_path)
+            elapsed = time.monotonic() - start
+            print(
+                f"{workers:>8} {elapsed:>8.2f} "
+                f"{size / (1024 * 1024) / elapsed:>8.1f}"
+            )
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+複数プロセスでのリース（処理権）分担のベンチマーク
+
+同じリースDBを指す複数のワーカープロセスで配信アーカイブ（ダミーのID）を
+分担し、各動画がちょうど1回ずつ処理されること、停止したワーカーのリースが
+期限切れ後に引き継がれることを確認する。
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+)
+
+from job_lease import LeaseStore, LEASE_CLAIMED, LEASE_DONE  # noqa: E402
+
+
+def worker(index, db_path, video_ids, ttl, work, crash_after, journal_mode,
+           results_dir):
+    store = LeaseStore(
+        db_path, worker_id=f'worker-{index}', ttl=ttl,
+        journal_mode=journal_mode
+    )
+    ids = list(video_ids)
+    random.Random(index).shuffle(ids)
+    processed = []
+    claims = 0
+
+    while True:
+        remaining = False
+        for video_id in ids:
+            status = store.claim(video_id)
+            claims += 1
+            if status == LEASE_DONE:
+                continue
+            remaining = True
+            if status != LEASE_CLAIMED:
+                continue
+            if crash_after is not None and len(processed) >= crash_after:
+                # リースを保持したまま停止（kill -9 相当）
+                os._exit(1)
+            time.sleep(work)
+            store.release(video_id, done=True, youtube_id=f'yt-{video_id}')
+            processed.append(video_id)
+        if not remaining:
+            break
+        # 他のワーカーの処理中・期限切れ待ちの動画が残っている
+        time.sleep(ttl / 4)
+
+    with open(os.path.join(results_dir, f'{index}.json'), 'w') as f:
+        json.dump({'processed': processed, 'claims': claims}, f)
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='リース分担のベンチマーク')
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--vods', type=int, default=100)
+    parser.add_argument(
+        '--work', type=float, default=0.02, help='1件あたりの処理時間（秒）'
+    )
+    parser.add_argument('--ttl', type=float, default=2.0)
+    parser.add_argument(
+        '--crash', type=int, default=1,
+        help='途中で停止させるワーカー数（各ワーカーは数件処理した後に停止）'
+    )
+    parser.add_argument('--journal-mode', default='WAL')
+    args = parser.parse_args()
+
+    video_ids = [str(900000 + i) for i in range(args.vods)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, 'leases.db')
+        # スキーマ作成の競合を避けるため先に作成しておく
+        LeaseStore(db_path, ttl=args.ttl, journal_mode=args.journal_mode)
+
+        start = time.monotonic()
+        processes = []
+        for i in range(args.workers):
+            crash_after = 3 if i < args.crash else None
+            process = multiprocessing.Process(
+                target=worker,
+                args=(i, db_path, video_ids, args.ttl, args.work, crash_after,
+                      args.journal_mode, tmpdir)
+            )
+            process.start()
+            processes.append(process)
+        for process in processes:
+            process.join()
+        elapsed = time.monotonic() - start
+
+        results = {}
+        for i in range(args.workers):
+            path = os.path.join(tmpdir, f'{i}.json')
+            if os.path.exists(path):
+                with open(path) as f:
+                    results[i] = json.load(f)
+        conn = sqlite3.connect(db_path)
+        done = conn.execute(
+            "SELECT COUNT(*) FROM leases WHERE state = 'done'"
+        ).fetchone()[0]
+        reclaimed = conn.execute(
+            "SELECT COUNT(*) FROM leases WHERE attempts > 1"
+        ).fetchone()[0]
+        conn.close()
+
+    counts = Counter(
+        video_id for result in results.values()
+        for video_id in result['processed']
+    )
+    duplicates = sum(1 for n in counts.values() if n > 1)
+    claims = sum(result['claims'] for result in results.values())
+
+    print(
+        f"ワーカー: {args.workers}（うち停止 {args.crash}）, VOD: {args.vods}, "
+        f"TTL: {args.ttl}秒, journal_mode: {args.journal_mode}"
+    )
+    print(f"所要時間: {elapsed:.2f}秒, claim: {claims}回 ({claims / elapsed:.0f}回/秒)")
+    for i in range(args.workers):
+        if i in results:
+            print(f"  worker-{i}: {len(results[i]['processed'])}件処理")
+        else:
+            print(f"  worker-{i}: 停止")
+    print(
+        f"完了: {done}/{args.vods}件, 重複処理: {duplicates}件, "
+        f"引き継ぎ: {reclaimed}件"
+    )
+    if done != args.vods or duplicates:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+動画長取得のマイクロベンチマーク
+
+合成したMP4/MPEG-TSファイルに対して、media_probe（ファイルを直接読む方式）と
+ffprobe（インストールされている場合）の所要時間を比較する。
+"""
+
+import argparse
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+)
+
+from media_probe import probe_duration  # noqa: E402
+
+
+def box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def write_mp4(path, size_mb, duration):
+    """ftyp + mdat（中身は空） + moov/mvhd の最小構成のMP4を作成"""
+    timescale = 1000
+    mvhd = box(
+        b'mvhd',
+        struct.pack('>B3xIIII', 0, 0, 0, timescale, int(duration * timescale))
+        + b'\0' * 80
+    )
+    mdat_size = size_mb * 1024 * 1024
+    with open(path, 'wb') as f:
+        f.write(box(b'ftyp', b'isom\0\0\0\0isomavc1'))
+        f.write(struct.pack('>I4s', 8 + mdat_size, b'mdat'))
+        # 中身は読まれないので疎なファイルにする
+        f.seek(mdat_size, os.SEEK_CUR)
+        f.write(box(b'moov', mvhd))
+
+
+def ts_packet(pid, pcr=None):
+    if pcr is None:
+        header = struct.pack('>BHB', 0x47, pid, 0x10)
+        return header + b'\xff' * 184
+    base = pcr & ((1 << 33) - 1)
+    pcr_bytes = bytes([
+        (base >> 25) & 0xFF, (base >> 17) & 0xFF, (base >> 9) & 0xFF,
+        (base >> 1) & 0xFF, ((base & 1) << 7) | 0x7E, 0
+    ])
+    adaptation = bytes([7, 0x10]) + pcr_bytes
+    header = struct.pack('>BHB', 0x47, pid, 0x30)
+    return header + adaptation + b'\xff' * (184 - len(adaptation))
+
+
+def write_ts(path, size_mb, duration):
+    """PID 0x100 に一定間隔でPCRを持つMPEG-TSを作成"""
+    packets = size_mb * 1024 * 1024 // 188
+    pcr_every = 50
+    pcr_count = packets // pcr_every
+    step = duration * 90000 / max(1, pcr_count - 1)
+    plain = ts_packet(0x100) * (pcr_every - 1)
+    with open(path, 'wb') as f:
+        for i in range(pcr_count):
+            f.write(ts_packet(0x100, int(i * step)))
+            f.write(plain)
+
+
+def measure(func, path, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(path)
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def ffprobe(path):
+    result = subprocess.run(
+        ['ffprobe', '-v', 'quiet', '-show_entries', 'format=duration',
+         '-of', 'csv=p=0', path],
+        capture_output=True, text=True
+    )
+    return float(result.stdout.strip()) if result.returncode == 0 else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='動画長取得のベンチマーク')
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--duration', type=float, default=3 * 3600 + 12.5)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    has_ffprobe = shutil.which('ffprobe') is not None
+    if not has_ffprobe:
+        print("ffprobeが見つからないため、media_probeのみ計測します")
+
+    print(f"{'形式':<6} {'方式':<12} {'ms/回':>10} {'結果(秒)':>12}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, writer in (('mp4', write_mp4), ('ts', write_ts)):
+            path = os.path.join(tmpdir, f'synthetic.{name}')
+            writer(path, args.size_mb, args.duration)
+            methods = [('media_probe', probe_duration)]
+            if has_ffprobe:
+                methods.append(('ffprobe', ffprobe))
+            for label, func in methods:
+                ms, result = measure(func, path, args.repeat)
+                print(f"{name:<6} {label:<12} {ms:>10.2f} {result or 0:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+"""
+ベンチマーク用のローカルサーバー（Twitch Helix / YouTube / HLS配信の代替）
+
+いずれもスレッドで動くHTTPサーバーで、ネットワーク接続なしに
+アップロード処理全体を動かすために使う。
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _FakeServer:
+    """リクエスト数を数えるHTTPサーバーの共通部分"""
+
+    def __init__(self):
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def count(self, key):
+        with self._lock:
+            self.requests[key] += 1
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def send_body(self, status, body=b'', headers=None,
+                          content_type='application/json'):
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body).encode()
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def read_body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length) if length else b''
+
+            def do_GET(self):
+                owner.handle(self, 'GET')
+
+            def do_POST(self):
+                owner.handle(self, 'POST')
+
+            def do_PUT(self):
+                owner.handle(self, 'PUT')
+
+        return Handler
+
+
+class FakeHLSServer(_FakeServer):
+    """合成したHLS VOD（MPEG-TSのセグメント）を配信する"""
+
+    def __init__(self, segment_size=512 * 1024, segment_seconds=10,
+                 latency=0.0):
+        self.segment_size = segment_size
+        self.segment_seconds = segment_seconds
+        self.latency = latency
+        self.durations = {}
+        # すべてのセグメントで同じ内容を返す（同期バイトだけ合わせる）
+        packet = b'\x47' + os.urandom(187)
+        self.payload = (packet * (segment_size // 188 + 1))[:segment_size]
+        super().__init__()
+
+    def add_vod(self, vod_id, duration):
+        self.durations[str(vod_id)] = duration
+        return f"{self.url}/{vod_id}/index.m3u8"
+
+    def handle(self, request, method):
+        path = urlparse(request.path).path
+        match = re.match(r'^/(\w+)/index\.m3u8$', path)
+        if match:
+            self.count('playlist')
+            duration = self.durations.get(match.group(1))
+            if duration is None:
+                return request.send_body(404)
+            lines = [
+                '#EXTM3U', '#EXT-X-VERSION:3',
+                f'#EXT-X-TARGETDURATION:{self.segment_seconds}'
+            ]
+            remaining = duration
+            i = 0
+            while remaining > 0:
+                seconds = min(self.segment_seconds, remaining)
+                lines.append(f'#EXTINF:{seconds:.3f},')
+                lines.append(f'{i}.ts')
+                remaining -= seconds
+                i += 1
+            lines.append('#EXT-X-ENDLIST')
+            return request.send_body(
+                200, ('\n'.join(lines) + '\n').encode(),
+                content_type='application/vnd.apple.mpegurl'
+            )
+
+        self.count('segment')
+        if self.latency:
+            time.sleep(self.latency)
+        request.send_body(200, self.payload, content_type='video/mp2t')
+
+
+class FakeHelixServer(_FakeServer):
+    """Twitch Helix API（/oauth2/token, /users, /videos）の代替"""
+
+    def __init__(self, page_size=100):
+        self.page_size = page_size
+        self.videos = []
+        # 配信中を再現する場合は配信開始時刻（created_at形式）を設定
+        self.live_started_at = None
+        super().__init__()
+
+    def user_id(self, login):
+        return str(1000 + sum(login.encode()) % 9000)
+
+    def add_videos(self, hls, count, duration, newest=None, interval_hours=24,
+                   channel='bench'):
+        """count件のアーカイブを新しい順に追加"""
+        newest = newest or datetime.now(timezone.utc).replace(microsecond=0)
+        for i in range(count):
+            vod_id = str(900000 + len(self.videos))
+            created_at = newest - timedelta(hours=interval_hours * i)
+            hours, rest = divmod(duration, 3600)
+            self.videos.append({
+                'id': vod_id,
+                'user_id': self.user_id(channel),
+                'user_login': channel,
+                'title': f'ベンチマーク配信 {vod_id}',
+                'created_at': created_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'duration': f'{hours}h{rest // 60}m{rest % 60}s',
+                'url': hls.add_vod(vod_id, duration),
+                'type': 'archive',
+            })
+        self.videos.sort(key=lambda v: v['created_at'], reverse=True)
+
+    def handle(self, request, method):
+        parsed = urlparse(request.path)
+        query = parse_qs(parsed.query)
+
+        if parsed.path.endswith('/token'):
+            self.count('token')
+            request.read_body()
+            return request.send_body(
+                200, {'access_token': 'bench', 'expires_in': 3600}
+            )
+        if parsed.path.endswith('/users'):
+            self.count('users')
+            login = query.get('login', ['bench'])[0]
+            return request.send_body(
+                200, {'data': [{'id': self.user_id(login), 'login': login}]}
+            )
+        if parsed.path.endswith('/streams'):
+            self.count('streams')
+            data = []
+            if self.live_started_at:
+                data.append({'type': 'live', 'started_at': self.live_started_at})
+            return request.send_body(200, {'data': data})
+        if parsed.path.endswith('/videos'):
+            self.count('videos')
+            if 'id' in query:
+                ids = set(query['id'])
+                return request.send_body(200, {
+                    'data': [v for v in self.videos if v['id'] in ids]
+                })
+            videos = [
+                v for v in self.videos
+                if v['user_id'] == query.get('user_id', [v['user_id']])[0]
+            ]
+            offset = int(query.get('after', ['0'])[0])
+            # page_sizeはサーバー側の1ページの上限として扱う
+            first = min(
+                int(query.get('first', [self.page_size])[0]), self.page_size
+            )
+            page = videos[offset:offset + first]
+            pagination = {}
+            if offset + first < len(videos):
+                pagination['cursor'] = str(offset + first)
+            return request.send_body(
+                200, {'data': page, 'pagination': pagination}
+            )
+
+        request.send_body(404, {'error': 'not found'})
+
+
+class FakeYouTubeServer(_FakeServer):
+    """YouTube Data APIの再開可能アップロードの代替
+
+    latency: 1リクエストごとの遅延（秒）
+    bandwidth: アップロードの帯域上限（バイト/秒、0は無制限）
+    error_rate: チャンク送信を503で失敗させる確率
+    session_limit: この数のセッションを作成した後はquotaExceededを返す
+    """
+
+    def __init__(self, latency=0.0, bandwidth=0, error_rate=0.0, seed=0,
+                 session_limit=None):
+        self.latency = latency
+        self.session_limit = session_limit
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.sessions = {}
+        self.completed = {}
+        super().__init__()
+
+    def handle(self, request, method):
+        if self.latency:
+            time.sleep(self.latency)
+        parsed = urlparse(request.path)
+
+        if method == 'POST' and 'upload' in parsed.path:
+            self.count('session')
+            metadata = json.loads(request.read_body() or b'{}')
+            if (self.session_limit is not None and
+                    len(self.sessions) >= self.session_limit):
+                self.count('quota_exceeded')
+                return request.send_body(403, {'error': {
+                    'code': 403, 'message': 'quota exceeded',
+                    'errors': [{'reason': 'quotaExceeded'}],
+                }})
+            session_id = uuid.uuid4().hex
+            self.sessions[session_id] = {'received': 0, 'metadata': metadata}
+            return request.send_body(200, {}, headers={
+                'Location': f"{self.url}/upload/session/{session_id}"
+            })
+
+        if method == 'PUT' and parsed.path.startswith('/upload/session/'):
+            return self._handle_chunk(request, parsed.path.rsplit('/', 1)[1])
+
+        if method == 'GET' and parsed.path.endswith('/playlistItems'):
+            return self._handle_playlist_items(request, parsed)
+
+        if method == 'GET' and parsed.path.endswith('/channels'):
+            self.count('channels')
+            return request.send_body(200, {'items': [{
+                'id': 'UCbench',
+                'snippet': {'title': 'bench'},
+                'contentDetails': {'relatedPlaylists': {'uploads': 'UUbench'}},
+            }]})
+
+        request.send_body(404, {'error': {'code': 404, 'message': 'not found'}})
+
+    def add_existing(self, twitch_video_id):
+        """以前にアップロードされた動画として登録（説明文にTwitchの動画IDを含む）"""
+        video_id = f"bench{len(self.completed):06d}"
+        self.completed[video_id] = {'received': 0, 'metadata': {'snippet': {
+            'title': f"existing {twitch_video_id}",
+            'description': f"Twitch VOD ID: {twitch_video_id}",
+        }}}
+        return video_id
+
+    def _handle_playlist_items(self, request, parsed):
+        """アップロード済み動画のプレイリスト（新しい順、pageTokenは開始位置）"""
+        self.count('playlist_items')
+        query = parse_qs(parsed.query)
+        page_size = int(query.get('maxResults', ['5'])[0])
+        start = int(query.get('pageToken', ['0'])[0])
+        video_ids = sorted(self.completed, reverse=True)
+        items = [
+            {'snippet': {
+                'title': self.completed[video_id]['metadata'].get(
+                    'snippet', {}).get('title', ''),
+                'description': self.completed[video_id]['metadata'].get(
+                    'snippet', {}).get('description', ''),
+                'resourceId': {'kind': 'youtube#video', 'videoId': video_id},
+            }}
+            for video_id in video_ids[start:start + page_size]
+        ]
+        body = {'items': items}
+        if start + page_size < len(video_ids):
+            body['nextPageToken'] = str(start + page_size)
+        request.send_body(200, body)
+
+    def _handle_chunk(self, request, session_id):
+        self.count('chunk')
+        data = request.read_body()
+        session = self.sessions.get(session_id)
+        if session is None:
+            return request.send_body(404, {'error': {'code': 404}})
+
+        if data and self.bandwidth:
+            time.sleep(len(data) / self.bandwidth)
+        if data and self.random.random() < self.error_rate:
+            self.count('injected_error')
+            return request.send_body(
+                503, {'error': {'code': 503, 'message': 'injected'}}
+            )
+
+        content_range = request.headers.get('Content-Range', '')
+        match = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', content_range)
+        if match:
+            total = match.group(3)
+            if int(match.group(1)) == session['received']:
+                session['received'] += len(data)
+        else:
+            total = content_range.rsplit('/', 1)[-1]
+
+        if total != '*' and session['received'] == int(total):
+            video_id = f"bench{len(self.completed):06d}"
+            self.completed[video_id] = session
+            return request.send_body(200, {
+                'id': video_id,
+                'snippet': session['metadata'].get('snippet', {}),
+            })
+
+        headers = {}
+        if session['received']:
+            headers['Range'] = f"bytes=0-{session['received'] - 1}"
+        request.send_body(308, b'', headers=headers)
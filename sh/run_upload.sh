@@ -34,4 +34,5 @@ python main.py "$@" 2>&1 | tee -a "$LOG_FILE"
 echo "$(date): アップロード処理が完了しました" | tee -a "$LOG_FILE"
 
 # 古いログファイルを削除（30日以上前）
-find "$LOG_DIR" -name "upload_*.log" -mtime +30 -delete 2>/dev/null || true 
\ No newline at end of file
+find "$LOG_DIR" -name "upload_*.log" -mtime +30 -delete 2>/dev/null || true
+find "$LOG_DIR" -name "metrics_*.jsonl" -mtime +30 -delete 2>/dev/null || true 
\ No newline at end of file
@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+# appモジュールを読み込む前に、作業ディレクトリを一時ディレクトリに向ける
+WORKDIR = tempfile.mkdtemp(prefix='twitch-vods-test-')
+os.environ.update({
+    'DOWNLOAD_DIR': os.path.join(WORKDIR, 'downloads'),
+    'CATALOG_PATH': os.path.join(WORKDIR, 'vod_catalog.db'),
+    'METRICS_DIR': os.path.join(WORKDIR, 'logs'),
+    'QUOTA_LEDGER_PATH': os.path.join(WORKDIR, 'youtube_quota.db'),
+    'METRICS_ENABLED': 'false',
+})
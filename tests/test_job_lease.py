@@ -0,0 +1,48 @@
+import pytest
+
+from job_lease import LEASE_BUSY, LEASE_CLAIMED, LEASE_DONE, LeaseStore
+
+
+@pytest.fixture
+def workers(tmp_path):
+    path = str(tmp_path / 'leases.db')
+    stores = [
+        LeaseStore(path, worker_id=name, ttl=60) for name in ('a', 'b')
+    ]
+    yield stores
+    for store in stores:
+        store.close()
+
+
+def test_claim_is_exclusive_until_done(workers):
+    a, b = workers
+
+    assert a.claim('1') == LEASE_CLAIMED
+    assert b.claim('1') == LEASE_BUSY
+    assert a.owns('1') and not b.owns('1')
+    assert b.active_video_ids() == {'1'}
+
+    a.release('1', done=True, youtube_id='yt1')
+    assert b.claim('1') == LEASE_DONE
+    assert b.active_video_ids() == set()
+
+
+def test_released_lease_can_be_claimed(workers):
+    """未完了で手放した動画は、他のワーカーが処理できる"""
+    a, b = workers
+    a.claim('1')
+    a.release('1')
+
+    assert b.claim('1') == LEASE_CLAIMED
+    assert b.owns('1')
+
+
+def test_expired_lease_is_taken_over(workers):
+    """期限が切れたリースは他のワーカーが引き継ぎ、元のワーカーは処理権を失う"""
+    a, b = workers
+    a.claim('1')
+    with a.conn:
+        a.conn.execute("UPDATE leases SET expires_at = 0")
+
+    assert b.claim('1') == LEASE_CLAIMED
+    assert not a.owns('1')
@@ -0,0 +1,84 @@
+import struct
+
+from media_probe import PCR_CLOCK, PCR_WRAP, TS_PACKET_SIZE, probe_duration
+
+
+def box(box_type, body):
+    return struct.pack('>I4s', 8 + len(body), box_type) + body
+
+
+def mvhd(timescale, duration, version=0):
+    if version == 1:
+        body = struct.pack('>B3xQQIQ', 1, 0, 0, timescale, duration)
+    else:
+        body = struct.pack('>B3xIIII', 0, 0, 0, timescale, duration)
+    return box(b'mvhd', body + b'\0' * 80)
+
+
+def ts_packet(pid, pcr=None):
+    """PCRを持つ（pcrがNoneの場合はペイロードのみの）MPEG-TSパケット"""
+    header = bytes([0x47, (pid >> 8) & 0x1F, pid & 0xFF])
+    if pcr is None:
+        packet = header + bytes([0x10])
+    else:
+        packet = header + bytes([
+            0x30, 7, 0x10,
+            (pcr >> 25) & 0xFF, (pcr >> 17) & 0xFF, (pcr >> 9) & 0xFF,
+            (pcr >> 1) & 0xFF, ((pcr & 1) << 7) | 0x7E, 0,
+        ])
+    return packet + b'\xff' * (TS_PACKET_SIZE - len(packet))
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_mp4_duration(tmp_path):
+    """moov/mvhdのtimescaleとdurationから長さを求める（mdatが先でもよい）"""
+    data = (
+        box(b'ftyp', b'isom\0\0\0\0') + box(b'mdat', b'\0' * 1000) +
+        box(b'moov', mvhd(1000, 90500))
+    )
+    assert probe_duration(write(tmp_path, 'a.mp4', data)) == 90.5
+
+
+def test_mp4_duration_version1(tmp_path):
+    """64bitのmvhd（version 1）にも対応する"""
+    data = box(b'ftyp', b'isom\0\0\0\0') + box(
+        b'moov', mvhd(90000, 3 * 3600 * 90000, version=1)
+    )
+    assert probe_duration(write(tmp_path, 'a.mp4', data)) == 3 * 3600
+
+
+def test_mp4_without_moov(tmp_path):
+    """書きかけ（moovがない）のファイルは長さ不明とする"""
+    data = box(b'ftyp', b'isom\0\0\0\0') + box(b'mdat', b'\0' * 1000)
+    assert probe_duration(write(tmp_path, 'a.mp4', data)) is None
+
+
+def test_ts_duration(tmp_path):
+    """最初と最後のPCRの差から長さを求める（他のPIDのPCRは無視する）"""
+    packets = [ts_packet(0x100, 0)]
+    for second in range(1, 11):
+        packets.append(ts_packet(0x101))
+        packets.append(ts_packet(0x200, 999 * PCR_CLOCK))
+        packets.append(ts_packet(0x100, second * PCR_CLOCK))
+    data = b''.join(packets)
+    assert probe_duration(write(tmp_path, 'a.ts', data)) == 10
+
+
+def test_ts_duration_across_pcr_wrap(tmp_path):
+    """PCRが一周しても長さを求められる"""
+    start = PCR_WRAP - 5 * PCR_CLOCK
+    data = b''.join(
+        ts_packet(0x100, (start + second * PCR_CLOCK) % PCR_WRAP)
+        for second in range(11)
+    )
+    assert probe_duration(write(tmp_path, 'a.ts', data)) == 10
+
+
+def test_unknown_format(tmp_path):
+    assert probe_duration(write(tmp_path, 'a.bin', b'not a video')) is None
+    assert probe_duration(write(tmp_path, 'empty.ts', b'')) is None
@@ -0,0 +1,39 @@
+import threading
+
+from multi_channel import FairQueue
+
+
+def test_fair_queue_round_robin():
+    """件数の多いチャンネルがあっても、チャンネルごとに順番に取り出す"""
+    queue = FairQueue()
+    for i in range(3):
+        queue.put('a', f'a{i}')
+    queue.put('b', 'b0')
+    queue.put('c', 'c0')
+    queue.close()
+
+    items = []
+    while True:
+        entry = queue.get()
+        if entry is None:
+            break
+        items.append(entry[1])
+
+    assert items == ['a0', 'b0', 'c0', 'a1', 'a2']
+
+
+def test_fair_queue_blocks_when_full():
+    """maxsizeに達している間はput()が待ち、取り出すと再開する"""
+    queue = FairQueue(maxsize=1)
+    queue.put('a', 1)
+    done = threading.Event()
+
+    def put():
+        queue.put('b', 2)
+        done.set()
+    threading.Thread(target=put, daemon=True).start()
+
+    assert not done.wait(0.2)
+    assert queue.get() == ('a', 1)
+    assert done.wait(5)
+    assert queue.qsize() == 1
@@ -0,0 +1,21 @@
+import time
+
+from metrics import MetricsRecorder
+from prometheus_exporter import TextfileExporter
+
+
+def test_exporter_restarts_after_stop(tmp_path):
+    """stop()した後にstart()しても、一定間隔での書き出しを再開する"""
+    path = tmp_path / 'metrics.prom'
+    exporter = TextfileExporter(
+        str(path), interval=0.05, recorder=MetricsRecorder()
+    )
+    exporter.start()
+    exporter.stop()
+
+    exporter.start()
+    path.unlink()
+    time.sleep(0.3)
+    assert exporter._thread.is_alive()
+    assert path.exists()
+    exporter.stop()
@@ -0,0 +1,54 @@
+import time
+from datetime import datetime
+
+import pytest
+import pytz
+
+from rate_limiter import BandwidthProfile, TokenBucket, mbps_to_bytes
+
+
+def at(hour, minute=0):
+    return pytz.timezone('Asia/Tokyo').localize(
+        datetime(2024, 1, 1, hour, minute)
+    )
+
+
+def test_profile_windows():
+    """時間帯ごとの上限（日をまたぐ時間帯を含む）と、範囲外の既定値"""
+    profile = BandwidthProfile(
+        10, '09:00-18:00=50,22:00-06:00=200', timezone='Asia/Tokyo'
+    )
+
+    assert profile.mbps_at(at(9)) == 50
+    assert profile.mbps_at(at(17, 59)) == 50
+    assert profile.mbps_at(at(18)) == 10
+    assert profile.mbps_at(at(23)) == 200
+    assert profile.mbps_at(at(5, 59)) == 200
+    assert profile.rate_at(at(12)) == mbps_to_bytes(50)
+
+
+def test_profile_rejects_invalid_spec():
+    with pytest.raises(ValueError):
+        BandwidthProfile(0, '09:00-25:00=50', timezone='Asia/Tokyo')
+    with pytest.raises(ValueError):
+        BandwidthProfile(0, '09:00=50', timezone='Asia/Tokyo')
+
+
+def test_unlimited_bucket_does_not_wait():
+    bucket = TokenBucket()
+
+    assert bucket.consume(10 ** 9) == 0.0
+    assert bucket.current_rate() == 0
+
+
+def test_bucket_waits_for_borrowed_tokens():
+    """バケットの容量を超えて消費した分は、上限の速度で返すまで待つ"""
+    bucket = TokenBucket(rate=1000)
+
+    started = time.monotonic()
+    # 溜まっている1秒分に加えて0.3秒分を借りる
+    waited = bucket.consume(1300)
+
+    assert 0.25 <= waited <= 0.5
+    assert time.monotonic() - started >= 0.25
+    assert bucket.waited == waited
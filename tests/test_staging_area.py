@@ -0,0 +1,139 @@
+import os
+import time
+
+import pytest
+
+from job_lease import LeaseStore
+from staging_area import StagingArea
+from vod_catalog import STATE_CLEANED, STATE_LISTED, VODCatalog
+
+from test_vod_catalog import add_video
+
+DAY = 24 * 3600
+KB = 1000
+
+
+def write(directory, name, size=1024, age=0):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    if age:
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_cleanup_keeps_untracked_files(tmp_path):
+    """カタログにないファイルは、既定では名前が一致しても削除しない"""
+    catalog = VODCatalog(str(tmp_path / 'catalog.db'))
+    staging = StagingArea(str(tmp_path), catalog, max_bytes=0)
+    legacy = write(str(tmp_path), 'bench_20240101_配信.mp4', age=30 * DAY)
+
+    staging.cleanup()
+
+    assert os.path.exists(legacy)
+    catalog.close()
+
+
+def test_cleanup_removes_old_untracked_files(tmp_path):
+    """経過時間を設定すると、それより古い生成名のファイルのみ削除する"""
+    catalog = VODCatalog(str(tmp_path / 'catalog.db'))
+    staging = StagingArea(
+        str(tmp_path), catalog, max_bytes=0,
+        file_prefixes=['bench_'], orphan_max_age=DAY
+    )
+    old = write(str(tmp_path), 'bench_20240101_配信.mp4', age=2 * DAY)
+    recent = write(str(tmp_path), 'bench_20240102_配信.mp4')
+    other = write(str(tmp_path), 'memo_20240101_配信.mp4', age=2 * DAY)
+
+    staging.cleanup()
+
+    assert not os.path.exists(old)
+    assert os.path.exists(recent)
+    assert os.path.exists(other)
+    catalog.close()
+
+
+@pytest.fixture
+def staged(tmp_path):
+    """処理状態の異なる動画のファイルを古い順に置いたステージング領域
+
+    すべて1KBで、u1・u2はアップロード済み、dはダウンロード途中、
+    pはアップロード待ち、fは処理中（予約済み）。
+    """
+    directory = tmp_path / 'downloads'
+    directory.mkdir()
+    catalog = VODCatalog(str(tmp_path / 'catalog.db'))
+    paths = {}
+    for age, video_id in enumerate(['u1', 'u2', 'd', 'p', 'f']):
+        add_video(catalog, video_id)
+        paths[video_id] = str(directory / f'20240101_{video_id}.mp4')
+        name = os.path.basename(paths[video_id])
+        if video_id == 'd':
+            catalog.mark_downloading(video_id, paths[video_id])
+            name += '.part'
+        else:
+            catalog.mark_downloaded(video_id, paths[video_id])
+        if video_id.startswith('u'):
+            catalog.mark_uploaded(video_id, f'yt-{video_id}')
+        write(str(directory), name, KB, age=(10 - age) * DAY)
+    write(str(directory), 'memo.txt', KB, age=30 * DAY)
+
+    staging = StagingArea(str(directory), catalog, max_bytes=int(5.5 * KB))
+    assert staging.reserve('f', KB)
+    yield staging, catalog, paths
+    catalog.close()
+
+
+def remaining(staging):
+    return sorted(os.listdir(staging.download_dir))
+
+
+def test_evicts_by_state_then_age(staged):
+    """アップロード済み → ダウンロード途中 → アップロード待ちの順、同じ状態は古い順"""
+    staging, catalog, paths = staged
+
+    assert staging.reserve('new1', int(1.5 * KB), wait=False)
+    assert not os.path.exists(paths['u1'])
+    assert os.path.exists(paths['u2'])
+    assert catalog.get_video('u1')['state'] == STATE_CLEANED
+
+    assert staging.reserve('new2', int(2 * KB), wait=False)
+    assert remaining(staging) == [
+        '20240101_f.mp4', '20240101_p.mp4', 'memo.txt'
+    ]
+    # 途中まで書き込んだ動画は、次回最初からダウンロードし直す
+    assert catalog.get_video('d')['state'] == STATE_LISTED
+    assert catalog.get_video('d')['file_path'] is None
+
+
+def test_keeps_files_in_flight(staged, tmp_path):
+    """予約中・他のワーカーが処理中の動画と、生成名でないファイルは削除しない"""
+    staging, catalog, paths = staged
+    other = LeaseStore(str(tmp_path / 'leases.db'), worker_id='other')
+    staging.leases = LeaseStore(str(tmp_path / 'leases.db'), worker_id='self')
+    try:
+        other.claim('p')
+        assert not staging.reserve('new', int(4.5 * KB), wait=False)
+        # 足りない場合は何も削除しない
+        assert len(remaining(staging)) == 6
+
+        assert staging.reserve('new', int(3.5 * KB), wait=False)
+        assert remaining(staging) == [
+            '20240101_f.mp4', '20240101_p.mp4', 'memo.txt'
+        ]
+    finally:
+        other.close()
+        staging.leases.close()
+
+
+def test_cleanup_removes_only_finished_videos(staged):
+    """cleanupは処理が終わった動画のファイルのみ削除する"""
+    staging, catalog, paths = staged
+    staging.release('f')
+
+    staging.cleanup()
+
+    assert remaining(staging) == [
+        '20240101_d.mp4.part', '20240101_f.mp4', '20240101_p.mp4', 'memo.txt'
+    ]
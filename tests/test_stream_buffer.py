@@ -0,0 +1,65 @@
+import os
+import threading
+
+import pytest
+
+from stream_buffer import StreamBuffer, StreamBufferError
+
+
+@pytest.mark.parametrize('spill', [False, True])
+def test_reads_across_ring_boundary(tmp_path, spill):
+    """容量より大きいデータも、読み込んだ分を解放しながら順に受け渡す"""
+    spill_path = str(tmp_path / '.stream.buf') if spill else None
+    buffer = StreamBuffer(1000, spill_path=spill_path)
+    data = os.urandom(5000)
+
+    def write():
+        for pos in range(0, len(data), 300):
+            buffer.write(data[pos:pos + 300])
+        buffer.finish()
+    writer = threading.Thread(target=write)
+    writer.start()
+
+    received = []
+    pos = 0
+    while True:
+        chunk = buffer.read_at(pos, 700)
+        received.append(chunk)
+        pos += len(chunk)
+        if len(chunk) < 700:
+            break
+    writer.join()
+
+    assert b''.join(received) == data
+    buffer.close()
+    if spill:
+        assert not os.path.exists(spill_path)
+
+
+def test_released_range_cannot_be_read():
+    buffer = StreamBuffer(100)
+    buffer.write(b'x' * 50)
+    buffer.read_at(40, 10)
+
+    with pytest.raises(StreamBufferError):
+        buffer.read_at(30, 10)
+
+
+def test_fail_unblocks_writer():
+    """読み込み側が失敗を通知すると、空きを待っている書き込み側も止まる"""
+    buffer = StreamBuffer(100)
+    errors = []
+
+    def write():
+        try:
+            buffer.write(b'x' * 500)
+        except StreamBufferError as e:
+            errors.append(e)
+    writer = threading.Thread(target=write)
+    writer.start()
+
+    buffer.fail(StreamBufferError('upload failed'))
+    writer.join(5)
+
+    assert not writer.is_alive()
+    assert len(errors) == 1
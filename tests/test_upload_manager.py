@@ -0,0 +1,55 @@
+import pytest
+
+from channels import ChannelConfig
+from config import Config
+from quota_ledger import QuotaLedger
+from upload_manager import UploadManager
+from vod_catalog import STATE_LISTED, STATE_SKIPPED, VODCatalog
+
+from test_vod_catalog import add_video
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DOWNLOAD_DIR', str(tmp_path / 'downloads'))
+    monkeypatch.setattr(Config, 'MAX_VIDEO_LENGTH', 3600)
+    catalog = VODCatalog(str(tmp_path / 'catalog.db'))
+    # videos.insert（1600ユニット）を1回も予約できないクォータ
+    quota = QuotaLedger(str(tmp_path / 'quota.db'), daily_limit=100)
+    manager = UploadManager(
+        channel=ChannelConfig('bench'), catalog=catalog, quota=quota
+    )
+    monkeypatch.setattr(
+        manager.youtube_api, 'find_uploaded_video', lambda video_id: None
+    )
+    yield manager
+    catalog.close()
+
+
+def test_unsplittable_video_is_skipped_before_quota(manager, monkeypatch):
+    """分割できない長すぎる動画は、クォータ不足でも延期せずにスキップする"""
+    monkeypatch.setattr(Config, 'SPLIT_LONG_VIDEOS', False)
+    add_video(manager.catalog, '1')
+    with manager.catalog.conn:
+        manager.catalog.conn.execute(
+            "UPDATE vods SET duration = 7200, url = 'https://example.com/1'"
+        )
+
+    assert manager.download_single_video(manager.catalog.get_video('1')) is None
+
+    video = manager.catalog.get_video('1')
+    assert video['state'] == STATE_SKIPPED
+    assert video['skip_reason'] == 'too_long'
+
+
+def test_quota_shortage_defers_video(manager):
+    """処理できる動画は、クォータが不足していれば延期する"""
+    add_video(manager.catalog, '2')
+    with manager.catalog.conn:
+        manager.catalog.conn.execute(
+            "UPDATE vods SET url = 'https://example.com/2'"
+        )
+
+    assert manager.download_single_video(manager.catalog.get_video('2')) is None
+
+    assert manager.catalog.get_video('2')['state'] == STATE_LISTED
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from config import Config
+from video_downloader import DownloadResult, VideoDownloader
+
+
+@pytest.fixture
+def downloader(monkeypatch):
+    monkeypatch.setattr(Config, 'STAGING_DEFAULT_BITRATE_MBPS', 8)
+    monkeypatch.setattr(Config, 'STAGING_SIZE_MARGIN', 1.0)
+    return VideoDownloader()
+
+
+def test_estimate_size_uses_format_bitrate(downloader, monkeypatch):
+    """解析済みのフォーマットのビットレート（tbr）から見積もり、解析し直さない"""
+    def resolve(url):
+        raise AssertionError('resolve_hls_format should not be called')
+    monkeypatch.setattr(downloader, 'resolve_hls_format', resolve)
+
+    hls_format = {'url': 'https://example.com/media.m3u8', 'tbr': 6000}
+    size = downloader.estimate_size(
+        'https://www.twitch.tv/videos/1', 3600, hls_format
+    )
+
+    assert size == 3600 * 6000 * 1000 // 8
+
+
+def test_estimate_size_falls_back_to_default(downloader):
+    """ビットレートが分からない場合は既定のビットレートで見積もる"""
+    size = downloader.estimate_size('https://www.twitch.tv/videos/1', 10)
+
+    assert size == 10 * 8 * 1000 * 1000 // 8
+
+
+def test_unverified_download_is_held(downloader, tmp_path, monkeypatch):
+    """長さを確認できないyt-dlpのダウンロードは最終的な名前にしない"""
+    monkeypatch.setattr(downloader, 'download_dir', str(tmp_path))
+    monkeypatch.setattr(downloader, 'hls_workers', 0)
+
+    def download(url, output_path):
+        path = output_path + '.dl'
+        with open(path, 'wb') as f:
+            f.write(b'\0' * 1024)
+        return DownloadResult(path)
+    monkeypatch.setattr(downloader, '_download_ytdlp', download)
+    monkeypatch.setattr(downloader, 'get_video_duration', lambda path: None)
+
+    result = downloader.download_video('https://example.com/1', 'a.mp4', 60)
+
+    assert result is not None and not result.verified
+    assert os.path.exists(str(tmp_path / 'a.mp4.dl'))
+    assert not os.path.exists(str(tmp_path / 'a.mp4'))
@@ -0,0 +1,31 @@
+import os
+import stat
+
+from video_splitter import VideoSplitter
+
+FAILING_FFMPEG = """#!/bin/sh
+# 最後の引数（パートのファイル名）で2つ書き出してから失敗する
+for last; do :; done
+printf x > "$(printf "$last" 0)"
+printf x > "$(printf "$last" 1)"
+echo "injected failure" >&2
+exit 1
+"""
+
+
+def test_failed_split_removes_parts(tmp_path):
+    """ffmpegが失敗した場合は、書き出し済みのパートを残さない"""
+    ffmpeg = tmp_path / 'ffmpeg'
+    ffmpeg.write_text(FAILING_FFMPEG)
+    ffmpeg.chmod(ffmpeg.stat().st_mode | stat.S_IEXEC)
+    video = tmp_path / '20240101_配信.mp4'
+    video.write_bytes(b'\0' * 1024)
+    other = tmp_path / '20240102_配信.part000.ts'
+    other.write_bytes(b'\0')
+
+    splitter = VideoSplitter(max_length=3600, ffmpeg=str(ffmpeg))
+    assert splitter.split(str(video), 3 * 3600) is None
+
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ['ffmpeg', video.name, other.name]
+    )
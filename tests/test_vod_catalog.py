@@ -0,0 +1,218 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from fake_services import FakeHelixServer, FakeHLSServer
+from config import Config
+from twitch_api import TwitchAPI
+from vod_catalog import (
+    PENDING_STATES, STATE_CLEANED, STATE_DOWNLOADING, STATE_LISTED,
+    STATE_SKIPPED, STATE_UPLOADED, VODCatalog
+)
+
+# チャンネル列・ファイルパス列・処理段階がなかった旧版のカタログ
+LEGACY_SCHEMA = """
+CREATE TABLE vods (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    duration INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    url TEXT,
+    state TEXT NOT NULL DEFAULT 'discovered',
+    youtube_id TEXT,
+    skip_reason TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class FlakyHelixServer(FakeHelixServer):
+    """failを設定すると、そのカーソルの/videosを一度だけ500で失敗させる"""
+
+    def __init__(self, **kwargs):
+        self.fail_after = None
+        super().__init__(**kwargs)
+
+    def handle(self, request, method):
+        parsed = urlparse(request.path)
+        after = parse_qs(parsed.query).get('after', [None])[0]
+        if parsed.path.endswith('/videos') and after and \
+                after == self.fail_after:
+            self.fail_after = None
+            self.count('videos_failed')
+            return request.send_body(500, {'error': 'injected'})
+        return super().handle(request, method)
+
+
+def add_video(catalog, video_id, created_at='2024-01-01T00:00:00Z',
+              state='listed', channel='bench'):
+    """Twitchを介さずにカタログへ動画を追加"""
+    with catalog.conn:
+        catalog.conn.execute(
+            "INSERT INTO vods (id, created_at, duration, title, url, "
+            "updated_at, channel, state) VALUES (?, ?, 60, ?, NULL, ?, ?, ?)",
+            (video_id, created_at, f'配信 {video_id}', created_at, channel,
+             state)
+        )
+
+
+@pytest.fixture
+def servers(monkeypatch):
+    hls = FakeHLSServer().start()
+    helix = FlakyHelixServer(page_size=2).start()
+    monkeypatch.setattr(Config, 'TWITCH_CLIENT_ID', 'test')
+    monkeypatch.setattr(Config, 'TWITCH_CLIENT_SECRET', 'test')
+    monkeypatch.setattr(Config, 'TWITCH_API_BASE_URL', f"{helix.url}/helix")
+    monkeypatch.setattr(Config, 'TWITCH_AUTH_URL', f"{helix.url}/oauth2/token")
+    yield hls, helix
+    helix.stop()
+    hls.stop()
+
+
+def test_partial_listing_keeps_watermark(tmp_path, servers):
+    """途中のページで失敗した同期は高水位標を進めず、次回で取り直す"""
+    hls, helix = servers
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    helix.add_videos(hls, 1, 60, newest=now - timedelta(days=10))
+    catalog = VODCatalog(str(tmp_path / 'catalog.db'))
+    twitch_api = TwitchAPI('bench')
+
+    assert catalog.sync(twitch_api) == 1
+    watermark = catalog.get_watermark('bench')
+    assert watermark == helix.videos[0]['created_at']
+
+    # 高水位標より新しい4件のうち、2ページ目の取得に失敗する
+    helix.add_videos(hls, 4, 60, newest=now)
+    helix.fail_after = '2'
+    assert catalog.sync(twitch_api) == 2
+    assert helix.requests['videos_failed'] == 1
+    assert catalog.get_watermark('bench') == watermark
+
+    # 再試行では高水位標から取り直し、取得できなかった分も追加する
+    catalog.sync(twitch_api)
+    assert catalog.get_watermark('bench') == helix.videos[0]['created_at']
+    for video in helix.videos:
+        assert catalog.get_video(video['id']) is not None
+    catalog.close()
+
+
+def test_unverified_downloads_are_counted(tmp_path):
+    """確認できなかった回数を数え、ダウンロードが確認できたら0に戻す"""
+    catalog = VODCatalog(str(tmp_path / 'catalog.db'))
+    add_video(catalog, '1')
+
+    assert catalog.record_unverified_download('1') == 1
+    assert catalog.record_unverified_download('1') == 2
+    catalog.mark_downloaded('1', str(tmp_path / 'a.mp4'))
+    assert catalog.get_video('1')['unverified_downloads'] == 0
+    catalog.close()
+
+
+def test_migrate_legacy_catalog(tmp_path, monkeypatch):
+    """旧版のカタログに列を追加し、状態と高水位標をチャンネルごとに引き継ぐ"""
+    monkeypatch.setattr(Config, 'TWITCH_CHANNEL_NAME', 'bench')
+    path = str(tmp_path / 'catalog.db')
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executescript(LEGACY_SCHEMA)
+        conn.executemany(
+            "INSERT INTO vods (id, created_at, duration, title, state, "
+            "updated_at) VALUES (?, '2024-01-01T00:00:00Z', 60, 't', ?, "
+            "'2024-01-01T00:00:00Z')",
+            [('1', 'discovered'), ('2', 'uploaded'), ('3', 'skipped')]
+        )
+        conn.execute(
+            "INSERT INTO sync_state VALUES ('watermark', '2024-01-01T00:00:00Z')"
+        )
+    conn.close()
+
+    catalog = VODCatalog(path)
+
+    # 旧版はアップロード成功直後にファイルを削除していた
+    assert catalog.get_video('1')['state'] == STATE_LISTED
+    assert catalog.get_video('2')['state'] == STATE_CLEANED
+    assert catalog.get_video('3')['state'] == STATE_SKIPPED
+    assert catalog.get_video('1')['channel'] == 'bench'
+    assert catalog.get_video('1')['file_path'] is None
+    assert catalog.get_watermark('bench') == '2024-01-01T00:00:00Z'
+    catalog.close()
+
+    # 2回目以降は処理段階を変更しない
+    catalog = VODCatalog(path)
+    catalog.mark_uploaded('1', 'yt1')
+    catalog.close()
+    catalog = VODCatalog(path)
+    assert catalog.get_video('1')['state'] == STATE_UPLOADED
+    catalog.close()
+
+
+def test_sync_updates_listed_videos(tmp_path, servers):
+    """再同期では長さ・タイトルを更新し、処理状態はそのまま残す"""
+    hls, helix = servers
+    helix.add_videos(hls, 3, 60)
+    catalog = VODCatalog(str(tmp_path / 'catalog.db'))
+    twitch_api = TwitchAPI('bench')
+
+    assert catalog.sync(twitch_api) == 3
+    newest = helix.videos[0]
+    catalog.mark_downloading(newest['id'], str(tmp_path / 'a.mp4'))
+
+    # 配信中のアーカイブは長さが伸びる（高水位標と同時刻の動画も取得し直す）
+    newest['duration'] = '0h2m0s'
+    newest['title'] = '更新後'
+    assert catalog.sync(twitch_api) == 1
+
+    video = catalog.get_video(newest['id'])
+    assert video['duration'] == 120
+    assert video['title'] == '更新後'
+    assert video['state'] == STATE_DOWNLOADING
+    assert video['channel'] == 'bench'
+    catalog.close()
+
+
+def test_videos_in_range_by_state(tmp_path):
+    """日時範囲・処理状態・チャンネルで絞り込み、新しい順に返す"""
+    catalog = VODCatalog(str(tmp_path / 'catalog.db'))
+    add_video(catalog, '1', created_at='2024-01-01T00:00:00Z')
+    add_video(catalog, '2', created_at='2024-01-02T00:00:00Z')
+    add_video(catalog, '3', created_at='2024-01-03T00:00:00Z')
+    add_video(catalog, '4', created_at='2024-01-02T12:00:00Z', channel='other')
+    catalog.mark_uploaded('2', 'yt2')
+    catalog.mark_cleaned('2')
+    catalog.mark_skipped('1', 'too_long')
+
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    end = datetime(2024, 1, 4, tzinfo=timezone.utc)
+    pending = catalog.get_videos_in_range(
+        start, end, states=PENDING_STATES, channel='bench'
+    )
+    assert [v['id'] for v in pending] == ['3']
+    every = catalog.get_videos_in_range(start, end)
+    assert [v['id'] for v in every] == ['3', '4', '2', '1']
+    assert catalog.get_video('1')['skip_reason'] == 'too_long'
+    catalog.close()
+
+
+def test_parts_keep_uploaded_ids(tmp_path):
+    """同じパート数で分割し直した場合は、アップロード済みのパートを引き継ぐ"""
+    catalog = VODCatalog(str(tmp_path / 'catalog.db'))
+    add_video(catalog, '1')
+    catalog.set_parts('1', [('a.part000.ts', 10.0), ('a.part001.ts', 10.0)])
+    catalog.mark_part_uploaded('1', 1, 'yt1')
+
+    catalog.set_parts('1', [('b.part000.ts', 10.0), ('b.part001.ts', 10.0)])
+
+    parts = catalog.get_parts('1')
+    assert [(p['youtube_id'], p['file_path']) for p in parts] == [
+        ('yt1', None), (None, 'b.part001.ts')
+    ]
+    assert sorted(catalog.get_staged_files()) == [
+        ('1', STATE_LISTED, 'b.part001.ts')
+    ]
+    catalog.close()
@@ -0,0 +1,203 @@
+import json
+import os
+import time
+
+import pytest
+from google.oauth2.credentials import Credentials
+
+from fake_services import FakeYouTubeServer
+from config import Config
+from quota_ledger import QuotaLedger
+from rate_limiter import TokenBucket
+from youtube_api import YouTubeAPI
+import metrics
+
+MB = 1024 * 1024
+
+
+class RecordingYouTubeServer(FakeYouTubeServer):
+    """受け取ったチャンクの大きさを記録する"""
+
+    def __init__(self, **kwargs):
+        self.chunk_sizes = []
+        super().__init__(**kwargs)
+
+    def _handle_chunk(self, request, session_id):
+        length = int(request.headers.get('Content-Length') or 0)
+        if length:
+            self.chunk_sizes.append(length)
+        return super()._handle_chunk(request, session_id)
+
+
+@pytest.fixture
+def youtube(monkeypatch):
+    server = RecordingYouTubeServer().start()
+    monkeypatch.setattr(Config, 'YOUTUBE_API_ROOT_URL', server.url)
+    for name in ('INITIAL', 'MIN', 'MAX'):
+        monkeypatch.setattr(Config, f'UPLOAD_CHUNK_{name}_MB', 1)
+    yield server
+    server.stop()
+
+
+def make_client(tmp_path, limiter=None):
+    api = YouTubeAPI(
+        quota=QuotaLedger(str(tmp_path / 'quota.db')),
+        limiter=limiter or TokenBucket()
+    )
+    api.credentials = Credentials(token='test')
+    api.youtube = api.build_client(api.credentials)
+    return api
+
+
+def make_file(tmp_path, size):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(os.urandom(size))
+    return str(path)
+
+
+def start_session(youtube, api, path, received):
+    """receivedバイトまで送信済みのセッションと再開用の状態ファイルを用意"""
+    session_id = f'resumed{received}'
+    youtube.sessions[session_id] = {'received': received, 'metadata': {}}
+    with open(path + '.upload.json', 'w', encoding='utf-8') as f:
+        json.dump({
+            'resumable_uri': f"{youtube.url}/upload/session/{session_id}",
+            'progress': received,
+            'file': api._file_identity(path),
+        }, f)
+
+
+def test_resume_counts_only_remaining_bytes(tmp_path, youtube):
+    """中断したセッションの再開では、確定済みの分を送信量に含めない"""
+    path = make_file(tmp_path, 4 * MB)
+    api = make_client(tmp_path)
+
+    # 半分まで送信済みのセッションを用意する
+    start_session(youtube, api, path, 2 * MB)
+    # セッションの作成時にクォータを消費済みのため、予約は不要
+    assert api.has_resumable_upload(path)
+
+    before = metrics.recorder.counters.get('bytes_uploaded', 0)
+    video_id = api.upload_video(path, 'resume')
+    uploaded = metrics.recorder.counters.get('bytes_uploaded', 0) - before
+
+    assert video_id is not None
+    assert uploaded == 2 * MB
+    assert metrics.recorder.spans[-1].bytes == 2 * MB
+    # 新しいセッションは作成しない
+    assert youtube.requests['session'] == 0
+    assert not os.path.exists(path + '.upload.json')
+    assert not api.has_resumable_upload(path)
+
+
+def test_rate_limit_caps_chunk_size(tmp_path, youtube, monkeypatch):
+    """上限がある間は、上限×目標秒数を超えるチャンクを送らない"""
+    monkeypatch.setattr(Config, 'UPLOAD_CHUNK_TARGET_SECONDS', 0.25)
+    path = make_file(tmp_path, 2 * MB)
+    api = make_client(tmp_path, TokenBucket(rate=1 * MB))
+
+    started = time.monotonic()
+    assert api.upload_video(path, 'limited') is not None
+    elapsed = time.monotonic() - started
+
+    assert max(youtube.chunk_sizes) <= MB // 4
+    assert sum(youtube.chunk_sizes) == 2 * MB
+    # 最初の1秒分はバケットに溜まっているため、残りの1MBで約1秒かかる
+    assert elapsed >= 0.9
+
+
+def test_resume_throttles_only_remaining_bytes(tmp_path, youtube, monkeypatch):
+    """再開時は確定済みの範囲の分まで待たない"""
+    monkeypatch.setattr(Config, 'UPLOAD_CHUNK_TARGET_SECONDS', 0.25)
+    path = make_file(tmp_path, 8 * MB)
+    limiter = TokenBucket(rate=1 * MB)
+    api = make_client(tmp_path, limiter)
+    start_session(youtube, api, path, 7 * MB)
+
+    assert api.upload_video(path, 'resume') is not None
+
+    assert sum(youtube.chunk_sizes) == 1 * MB
+    assert limiter.waited < 1.0
+
+
+class FlakyChannelsServer(RecordingYouTubeServer):
+    """最初のchannels.listだけ失敗する"""
+
+    def handle(self, request, method):
+        if request.path.split('?')[0].endswith('/channels') and \
+                not self.requests['channels_failed']:
+            self.count('channels_failed')
+            return request.send_body(
+                500, {'error': {'code': 500, 'message': 'injected'}}
+            )
+        return super().handle(request, method)
+
+
+def test_failed_upload_index_is_not_cached(tmp_path, monkeypatch):
+    """一覧の取得に失敗した索引は保持せず、次の照合で取得し直す"""
+    server = FlakyChannelsServer().start()
+    monkeypatch.setattr(Config, 'YOUTUBE_API_ROOT_URL', server.url)
+    monkeypatch.setattr(Config, 'CHECK_EXISTING_UPLOADS', True)
+    try:
+        existing = server.add_existing('123')
+        api = make_client(tmp_path)
+
+        assert api.find_uploaded_video('123') is None
+        assert api.find_uploaded_video('123') == existing
+
+        # 索引を作り直すと、その後にアップロードされた動画も照合できる
+        later = server.add_existing('456')
+        assert api.find_uploaded_video('456') is None
+        api.invalidate_upload_index()
+        assert api.find_uploaded_video('456') == later
+    finally:
+        server.stop()
+
+
+class FirstChunkFailsServer(RecordingYouTubeServer):
+    """最初のチャンクの送信を再試行できないエラーで失敗させる"""
+
+    def _handle_chunk(self, request, session_id):
+        if not self.requests['first_chunk_failed']:
+            self.count('first_chunk_failed')
+            request.read_body()
+            return request.send_body(
+                400, {'error': {'code': 400, 'message': 'injected'}}
+            )
+        return super()._handle_chunk(request, session_id)
+
+
+def test_session_is_saved_before_first_chunk(tmp_path, monkeypatch):
+    """最初のチャンクの送信中に中断しても、作成したセッションから再開する"""
+    server = FirstChunkFailsServer().start()
+    monkeypatch.setattr(Config, 'YOUTUBE_API_ROOT_URL', server.url)
+    try:
+        path = make_file(tmp_path, 2 * MB)
+        api = make_client(tmp_path)
+
+        assert api.upload_video(path, 'first') is None
+        assert api.has_resumable_upload(path)
+        with open(path + '.upload.json', encoding='utf-8') as f:
+            assert json.load(f)['progress'] == 0
+
+        assert api.upload_video(path, 'first') is not None
+        assert server.requests['session'] == 1
+        assert api.quota.remaining() == api.quota.daily_limit - 1600
+    finally:
+        server.stop()
+
+
+def test_mismatched_state_is_kept_until_upload(tmp_path, youtube):
+    """一致しない状態ファイルは確認では削除せず、アップロード時に破棄する"""
+    path = make_file(tmp_path, 1 * MB)
+    api = make_client(tmp_path)
+    start_session(youtube, api, path, 0)
+    with open(path, 'ab') as f:
+        f.write(b'\0')
+
+    assert not api.has_resumable_upload(path)
+    assert os.path.exists(path + '.upload.json')
+
+    assert api.upload_video(path, 'changed') is not None
+    assert youtube.requests['session'] == 1
+    assert not os.path.exists(path + '.upload.json')